@@ -1,903 +1,4364 @@
-import os
-import uuid
-import random
-from datetime import datetime
-from flask import Flask, render_template_string, request, jsonify, session
-from werkzeug.utils import secure_filename
-import xml.etree.ElementTree as ET
-
-# ==========================================
-# 1. CONFIGURATION
-# ==========================================
-app = Flask(__name__)
-app.secret_key = 'TITANIUM_PAYMASTER_KEY_V16'
-app.config['UPLOAD_FOLDER'] = 'static/uploads'
-app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
-
-if not os.path.exists(app.config['UPLOAD_FOLDER']):
-    os.makedirs(app.config['UPLOAD_FOLDER'])
-
-DB_FILES = {
-    'users': 'users.xml',
-    'vehicles': 'vehicles.xml',
-    'rentals': 'rentals.xml'
-}
-
-# ==========================================
-# 2. XML DATABASE ENGINE
-# ==========================================
-
-def save_db(key, data):
-    root = ET.Element(key)
-
-    for item in data:
-        record = ET.SubElement(root, "record")
-        for k, v in item.items():
-            child = ET.SubElement(record, k)
-            child.text = str(v)
-
-    tree = ET.ElementTree(root)
-    tree.write(DB_FILES[key], encoding='utf-8', xml_declaration=True)
-
-
-def load_db(key):
-    if not os.path.exists(DB_FILES[key]):
-        return []
-
-    tree = ET.parse(DB_FILES[key])
-    root = tree.getroot()
-
-    data = []
-    for record in root.findall("record"):
-        entry = {}
-        for child in record:
-            value = child.text.strip() if child.text else ""
-            entry[child.tag] = value
-        data.append(entry)
-
-    return data
-
-
-def repair_db():
-    # USERS
-    if not os.path.exists(DB_FILES['users']):
-        users = [
-            {"id": "1", "name": "Drive Hub", "email": "admin@rental.com", "password": "admin", "role": "admin"},
-            {"id": "2", "name": "Client One", "email": "user@gmail.com", "password": "user", "role": "user"}
-        ]
-        save_db('users', users)
-
-    # VEHICLES
-    if not os.path.exists(DB_FILES['vehicles']):
-        vehicles = [{
-            "id": "101",
-            "model": "Tesla Model S",
-            "price": "1200",
-            "status": "Available",
-            "health": "100",
-            "kms": "5000",
-            "fuel": "Electric",
-            "year": "2024",
-            "transmission": "Auto",
-            "seats": "5",
-            "image": ""
-        }]
-        save_db('vehicles', vehicles)
-
-    # RENTALS
-    if not os.path.exists(DB_FILES['rentals']):
-        save_db('rentals', [])
-
-repair_db()
-
-
-# ==========================================
-# 3. BACKEND ROUTES (UNCHANGED LOGIC)
-# ==========================================
-
-@app.route('/')
-def root():
-    return render_template_string(UI_CODE)
-
-@app.route('/api/auth/login', methods=['POST'])
-def login():
-    data = request.json
-    users = load_db('users')
-
-    user = next((u for u in users if u['email'] == data['email'] and u['password'] == data['password']), None)
-
-    if user:
-        session['user'] = user
-        return jsonify({"status": "success", "user": user})
-
-    return jsonify({"status": "error", "message": "Invalid Credentials"})
-
-
-@app.route('/api/auth/register', methods=['POST'])
-def register():
-    data = request.json
-    users = load_db('users')
-
-    if any(u['email'] == data['email'] for u in users):
-        return jsonify({"status": "error", "message": "Email exists"})
-
-    users.append({
-        "id": str(len(users) + 1),
-        "name": data['name'],
-        "email": data['email'],
-        "password": data['password'],
-        "role": "user"
-    })
-
-    save_db('users', users)
-    return jsonify({"status": "success"})
-
-
-
-
-@app.route('/api/data/sync')
-def sync():
-    user = session.get('user')
-    if not user:
-        return jsonify({"status": "error"}), 401
-
-    vehicles = load_db('vehicles')
-    rentals = load_db('rentals')
-
-    # 🔥 AUTO MAINTENANCE CHECK
-    now = datetime.now()
-
-    for v in vehicles:
-        if v.get('status') == 'Maintenance' and v.get('maintenance_start'):
-            try:
-                start_time = datetime.strptime(v['maintenance_start'], "%Y-%m-%d %H:%M:%S")
-
-                if now - start_time >= timedelta(hours=1):
-                    v['health'] = "100"
-                    v['status'] = "Available"
-                    v.pop('maintenance_start', None)
-
-            except:
-                pass
-
-    save_db('vehicles', vehicles)
-    # 🔥 END MAINTENANCE CHECK
-
-    if user['role'] == 'admin':
-        revenue = sum(float(r.get('total', 0)) for r in rentals)
-        active = len([r for r in rentals if r.get('status') == 'Active'])
-        fleet = len(vehicles)
-        kms = sum(int(v.get('kms', 0)) for v in vehicles)
-
-        response = {
-            "role": "admin",
-            "vehicles": vehicles,
-            "rentals": rentals,
-            "stats": {
-                "revenue": revenue,
-                "active": active,
-                "fleet": fleet,
-                "kms": kms
-            }
-        }
-    else:
-        my_rentals = [r for r in rentals if r.get('user_email') == user['email']]
-        response = {
-            "role": "user",
-            "vehicles": vehicles,
-            "rentals": my_rentals,
-            "stats": {}
-        }
-
-    return jsonify({"status": "success", "data": response})
-
-@app.route('/api/vehicle/manage', methods=['POST'])
-def manage_vehicle():
-    if not session.get('user') or session['user']['role'] != 'admin':
-        return jsonify({"error": "Unauthorized"}), 403
-
-    v_id = request.form.get('id')
-    vehicles = load_db('vehicles')
-
-    v_data = {
-        "model": request.form.get('model'),
-        "price": str(request.form.get('price')),
-        "year": request.form.get('year', '2024'),
-        "fuel": request.form.get('fuel', 'Petrol'),
-        "transmission": request.form.get('transmission', 'Auto'),
-        "seats": request.form.get('seats', '4'),
-        "health": request.form.get('health', '100'),
-        "kms": request.form.get('kms', '0'),
-        "status": request.form.get('status', 'Available'),
-        "image": ""
-    }
-
-    f = request.files.get('image')
-    if f:
-        fname = secure_filename(f"{uuid.uuid4()}_{f.filename}")
-        f.save(os.path.join(app.config['UPLOAD_FOLDER'], fname))
-        v_data['image'] = fname
-
-    if v_id and v_id != 'null':
-        for v in vehicles:
-            if str(v.get('id')).strip() == str(v_id).strip():
-                v.update(v_data)
-    else:
-        v_data['id'] = str(uuid.uuid4().int)[:6]
-        vehicles.append(v_data)
-
-    save_db('vehicles', vehicles)
-    return jsonify({"status": "success"})
-
-
-@app.route('/api/vehicle/delete', methods=['POST'])
-def delete_vehicle():
-    if not session.get('user') or session['user']['role'] != 'admin':
-        return jsonify({"error": "Unauthorized"}), 403
-
-    v_id = request.json.get('id')
-    vehicles = load_db('vehicles')
-
-    vehicles = [v for v in vehicles if str(v.get('id')).strip() != str(v_id).strip()]
-
-    save_db('vehicles', vehicles)
-    return jsonify({"status": "success"})
-
-
-@app.route('/api/rent/create', methods=['POST'])
-def create_rental():
-    data = request.json
-    user = session.get('user')
-
-    vehicles = load_db('vehicles')
-    rentals = load_db('rentals')
-
-    target = next((v for v in vehicles if str(v.get('id')) == str(data['v_id'])), None)
-
-    if not target or target.get('status') != 'Available':
-        return jsonify({"error": "Unavailable"})
-
-    target['status'] = 'Rented'
-
-    tx_id = f"TX-{uuid.uuid4().hex[:8].upper()}"
-
-    rentals.append({
-        "tx_id": tx_id,
-        "user_email": user['email'],
-        "user_name": user['name'],
-        "vehicle_id": data['v_id'],
-        "vehicle_model": target['model'],
-        "price": str(data['price']),
-        "total": str(data['price']),
-        "payment_method": "UPI",
-        "payment_id": data.get('pay_id', 'N/A'),
-        "status": "Active",
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M")
-    })
-
-    save_db('vehicles', vehicles)
-    save_db('rentals', rentals)
-
-    return jsonify({
-        "status": "success",
-        "tx_id": tx_id,
-        "date": datetime.now().strftime("%Y-%m-%d %H:%M")
-    })
-
-
-@app.route('/api/rent/return', methods=['POST'])
-def process_return():
-    if not session.get('user') or session['user']['role'] != 'admin':
-        return jsonify({"error": "Unauthorized"}), 403
-
-    data = request.json
-    rentals = load_db('rentals')
-    vehicles = load_db('vehicles')
-
-    rental = next((r for r in rentals if r.get('tx_id') == data['tx_id']), None)
-
-    if not rental:
-        return jsonify({"error": "Not found"})
-
-    vehicle = next((v for v in vehicles if str(v.get('id')) == str(rental['vehicle_id'])), None)
-
-    kms = int(data.get('kms', 0))
-    fine = float(data.get('fine', 0))
-
-    rental['status'] = 'Closed'
-    rental['total'] = str(float(rental.get('price', 0)) + fine)
-    rental['return_date'] = datetime.now().strftime("%Y-%m-%d %H:%M")
-
-    if vehicle:
-      new_kms = int(vehicle.get('kms', 0)) + kms
-      new_health = max(0, int(vehicle.get('health', 100)) - int(kms/50))
-
-      vehicle['kms'] = str(new_kms)
-      vehicle['health'] = str(new_health)
-
-      if new_health < 40:
-         vehicle['status'] = 'Maintenance'
-         vehicle['maintenance_start'] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-      else:
-         vehicle['status'] = 'Available'
-
-    save_db('rentals', rentals)
-    save_db('vehicles', vehicles)
-
-    return jsonify({"status": "success"})
-
-
-@app.route('/api/auth/logout', methods=['POST'])
-def logout():
-    session.clear()
-    return jsonify({"status": "success"})
-
-
-
-# ==========================================
-# YOUR FULL UI_CODE GOES HERE
-# ==========================================
-
-UI_CODE = """
-<!DOCTYPE html>
-<html lang="en">
-<head>
-    <meta charset="UTF-8">
-    <title>Drive Hub</title>
-    <link href="https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700;800&display=swap" rel="stylesheet">
-    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
-    <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
-    <script src="https://cdn.jsdelivr.net/npm/canvas-confetti@1.6.0/dist/confetti.browser.min.js"></script>
-    <style>
-        :root { --p: #4F46E5; --p-dark: #3730A3; --bg: #F8FAFC; --txt: #0F172A; --border: #E2E8F0; }
-        * { box-sizing: border-box; font-family: 'Plus Jakarta Sans', sans-serif; }
-        body { margin: 0; background: var(--bg); color: var(--txt); height: 100vh; display: flex; }
-        .input-error {
-    border-color: #EF4444 !important;
-    box-shadow: 0 0 0 2px rgba(239,68,68,0.2);
-}
-        
-        /* AUTH PAGE - CINEMATIC */
-        .auth-container { position: fixed; inset: 0; background: white; z-index: 9999; display: flex; }
-        .auth-left { flex: 1.2; background: linear-gradient(135deg, #1e1b4b, #312e81); color: white; display: flex; flex-direction: column; justify-content: center; padding: 100px; position: relative; overflow: hidden; }
-        .auth-left::before { content: ''; position: absolute; top:0; left:0; width:100%; height:100%; background: url('https://images.unsplash.com/photo-1568605117036-5fe5e7bab0b7?q=80&w=2070') center/cover; opacity: 0.3; mix-blend-mode: overlay; }
-        .auth-content { position: relative; z-index: 2; }
-        .auth-content h1 { font-size: 4rem; line-height: 1.1; margin-bottom: 25px; font-weight: 800; letter-spacing: -1px; }
-        .highlight { color: #818CF8; background: rgba(255,255,255,0.1); padding: 0 10px; border-radius: 8px; }
-        .auth-right { flex: 1; display: flex; align-items: center; justify-content: center; background: #fff; }
-        .auth-box { width: 420px; padding: 50px; }
-        
-        .input-group { margin-bottom: 20px; }
-        .input-group label { display: block; font-size: 0.85rem; font-weight: 700; margin-bottom: 8px; color: #475569; }
-        .inp { width: 100%; padding: 14px; border: 1px solid var(--border); border-radius: 12px; font-size: 1rem; transition: 0.2s; background: #F8FAFC; }
-        .inp:focus { border-color: var(--p); background: white; outline: none; box-shadow: 0 0 0 3px rgba(79, 70, 229, 0.1); }
-        
-        /* APP LAYOUT */
-        .sidebar { width: 280px; background: white; border-right: 1px solid var(--border); padding: 30px; display: flex; flex-direction: column; }
-        .brand { font-size: 1.6rem; font-weight: 800; color: var(--txt); display: flex; align-items: center; gap: 10px; margin-bottom: 50px; }
-        .brand span { color: var(--p); }
-        
-        .nav-item { padding: 14px 16px; margin-bottom: 8px; border-radius: 12px; color: #64748B; cursor: pointer; font-weight: 600; display: flex; gap: 12px; align-items: center; transition: 0.2s; }
-        .nav-item:hover { background: #F1F5F9; color: var(--txt); }
-        .nav-item.active { background: #EEF2FF; color: var(--p); }
-        
-        .main { flex: 1; padding: 40px; overflow-y: auto; background: var(--bg); }
-        .header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 30px; }
-        .pg-title { font-size: 2rem; font-weight: 800; letter-spacing: -0.5px; }
-        
-        /* CARDS */
-        .stat-grid { display: grid; grid-template-columns: repeat(4, 1fr); gap: 24px; margin-bottom: 40px; }
-        .stat-card { background: white; padding: 24px; border-radius: 20px; border: 1px solid var(--border); box-shadow: 0 4px 6px -1px rgba(0,0,0,0.02); }
-        .stat-lbl { font-size: 0.75rem; font-weight: 800; color: #94A3B8; text-transform: uppercase; letter-spacing: 0.5px; }
-        .stat-val { font-size: 2rem; font-weight: 800; margin-top: 5px; color: var(--txt); }
-
-        .fleet-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(320px, 1fr)); gap: 30px; }
-        .car-card { background: white; border-radius: 24px; border: 1px solid var(--border); overflow: hidden; transition: 0.3s; position: relative; }
-        .car-card:hover { transform: translateY(-5px); box-shadow: 0 20px 30px -10px rgba(0,0,0,0.1); }
-        .car-img { width: 100%; height: 220px; object-fit: cover; background: #F1F5F9; }
-        .car-body { padding: 24px; }
-        .tags { display: flex; gap: 8px; margin-bottom: 15px; flex-wrap: wrap; }
-        .tag { padding: 4px 10px; border-radius: 6px; background: #F8FAFC; color: #64748B; font-size: 0.75rem; font-weight: 700; border: 1px solid #F1F5F9; }
-        
-        .badge { padding: 6px 12px; border-radius: 30px; font-size: 0.75rem; font-weight: 800; color: white; position: absolute; top: 15px; right: 15px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
-        .st-Available { background: #10B981; } .st-Rented { background: #EF4444; } .st-Maintenance { background: #F59E0B; }
-        
-        .btn { padding: 12px 24px; border: none; border-radius: 12px; font-weight: 700; cursor: pointer; transition: 0.2s; font-size: 0.95rem; }
-        .btn-p { background: var(--p); color: white; } .btn-p:hover { background: var(--p-dark); box-shadow: 0 4px 12px rgba(79, 70, 229, 0.3); }
-        .btn-o { background: white; border: 1px solid var(--border); color: #64748B; } .btn-o:hover { border-color: #94A3B8; }
-        .btn-d { background: #FEF2F2; color: #EF4444; padding: 10px; border-radius: 10px; }
-
-        /* TABLES */
-        .tbl { width: 100%; border-collapse: collapse; background: white; border-radius: 16px; overflow: hidden; border: 1px solid var(--border); }
-        .tbl th { background: #F8FAFC; padding: 16px; text-align: left; font-size: 0.8rem; font-weight: 700; color: #64748B; text-transform: uppercase; }
-        .tbl td { padding: 16px; border-bottom: 1px solid #F1F5F9; color: #334155; font-size: 0.9rem; }
-        .tbl tr:last-child td { border-bottom: none; }
-
-        /* MODALS */
-        .modal { position: fixed; inset: 0; background: rgba(0,0,0,0.6); backdrop-filter: blur(8px); display: none; align-items: center; justify-content: center; z-index: 2000; }
-        .modal.active { display: flex; animation: fadeUp 0.3s ease; }
-        @keyframes fadeUp { from { opacity: 0; transform: translateY(20px); } to { opacity: 1; transform: translateY(0); } }
-        .modal-box { background: white; width: 500px; padding: 40px; border-radius: 30px; box-shadow: 0 25px 50px -12px rgba(0,0,0,0.25); }
-        
-        .receipt { background: #F8FAFC; padding: 20px; border: 1px dashed var(--border); border-radius: 12px; margin-bottom: 20px; font-family: monospace; font-size: 0.9rem; }
-        .receipt div { display: flex; justify-content: space-between; margin-bottom: 5px; }
-
-        .hidden { display: none !important; }
-        #qr-ph {
-    animation: pulseQR 2s infinite;
-}
-@keyframes pulseQR {
-    0% { box-shadow: 0 0 0px #4F46E5; }
-    50% { box-shadow: 0 0 20px #4F46E5; }
-    100% { box-shadow: 0 0 0px #4F46E5; }
-}
-
-    </style>
-</head>
-<body>
-
-    <div id="auth" class="auth-container">
-        <div class="auth-left">
-            <div class="auth-content">
-                <h1>"The Road is Open.<br> <span class="highlight">Drive the Future.</span>"</h1>
-                <p style="font-size: 1.3rem; opacity: 0.9; margin-top: 20px;">Select your role to access the premium fleet.</p>
-            </div>
-        </div>
-        <div class="auth-right">
-            <div class="auth-box">
-                <div style="text-align: center; margin-bottom: 40px;">
-                    <i class="fas fa-layer-group" style="font-size: 3rem; color: var(--p);"></i>
-                    <h2 style="margin-top: 10px;">Welcome Back</h2>
-                </div>
-                
-                <div id="login-form">
-                    <div class="input-group">
-                        <label>Email Address</label>
-                        <input id="l-email" class="inp" placeholder="admin@rental.com">
-                    </div>
-                    <div class="input-group">
-                        <label>Password</label>
-                        <input id="l-pass" type="password" class="inp" placeholder="••••••••">
-                    </div>
-                    <button class="btn btn-p" style="width:100%" onclick="login()"> 
-                    Access Dashboard
-                    </button>
-                    <p style="text-align:center; margin-top:20px; color:#64748B; cursor:pointer;" onclick="toggleAuth()">Create an account</p>
-                </div>
-
-                <div id="reg-form" class="hidden">
-                    <div class="input-group"><label>Full Name</label><input id="r-name" class="inp"></div>
-                    <div class="input-group"><label>Email</label><input id="r-email" class="inp"></div>
-                    <div class="input-group"><label>Password</label><input id="r-pass" type="password" class="inp"></div>
-                    <button class="btn btn-p" style="width:100%" onclick="register()">Create Account</button>
-                    <p style="text-align:center; margin-top:20px; color:#64748B; cursor:pointer;" onclick="toggleAuth()">Back to Login</p>
-                </div>
-            </div>
-        </div>
-    </div>
-
-    <div id="app" class="hidden" style="width:100%; height:100%; display:flex;">
-        <aside class="sidebar">
-            <div class="brand"><i class="fas fa-layer-group"></i> Drive<span>Hub</span></div>
-            
-            <div id="nav-admin" class="hidden">
-                <div class="nav-item active" onclick="nav('dash', this)"><i class="fas fa-chart-pie"></i> Mission Control</div>
-                <div class="nav-item" onclick="nav('fleet', this)"><i class="fas fa-car-side"></i> Fleet Command</div>
-                <div class="nav-item" onclick="nav('ledger', this)"><i class="fas fa-file-invoice"></i> Ledger</div>
-            </div>
-
-            <div id="nav-user" class="hidden">
-                <div class="nav-item active" onclick="nav('garage', this)"><i class="fas fa-warehouse"></i> My Garage</div>
-                <div class="nav-item" onclick="nav('fleet', this)"><i class="fas fa-search"></i> Browse Fleet</div>
-            </div>
-
-            <div style="margin-top:auto;">
-                <div style="display:flex; align-items:center; gap:12px; margin-bottom:20px; padding: 12px; background: #F8FAFC; border-radius: 12px;">
-                    <div style="width:40px; height:40px; background:var(--p); border-radius:50%; display:flex; align-items:center; justify-content:center; font-weight:700; color:white;">U</div>
-                    <div><div id="u-name" style="font-weight:700; font-size:0.9rem;">User</div><div id="u-role" style="font-size:0.75rem; color:#94A3B8; text-transform: uppercase;">Role</div></div>
-                </div>
-                <button class="btn btn-o" style="width:100%" onclick="logout()">Sign Out</button>
-            </div>
-        </aside>
-
-        <main class="main">
-            <div id="view-dash" class="hidden">
-                <div class="header"><div class="pg-title">Mission Control</div></div>
-                <div class="stat-grid">
-                    <div class="stat-card"><div class="stat-lbl">Total Revenue</div><span class="stat-val" id="st-rev">₹0</span></div>
-                    <div class="stat-card"><div class="stat-lbl">Active Missions</div><span class="stat-val" id="st-act">0</span></div>
-                    <div class="stat-card"><div class="stat-lbl">Fleet Size</div><span class="stat-val" id="st-flt">0</span></div>
-                    <div class="stat-card"><div class="stat-lbl">Total Distance</div><span class="stat-val" id="st-kms">0 km</span></div>
-                </div>
-                <h3 style="margin-bottom:20px;">Pending Returns</h3>
-                <div id="active-list" style="display:grid; gap:15px;"></div>
-            </div>
-
-            <div id="view-garage" class="hidden">
-                <div class="header"><div class="pg-title">My Garage</div></div>
-                <div id="my-rentals" style="display:grid; gap:20px;"></div>
-            </div>
-
-            <div id="view-fleet" class="hidden">
-                <div class="header">
-                    <div class="pg-title">Fleet Command</div>
-                    <button id="btn-add" class="btn btn-p hidden" onclick="openModal('mod-add')"><i class="fas fa-plus"></i> Add Vehicle</button>
-                </div>
-                <div id="fleet-grid" class="fleet-grid"></div>
-            </div>
-
-            <div id="view-ledger" class="hidden">
-                <div class="header"><div class="pg-title">Transaction Ledger</div></div>
-                <table class="tbl">
-                    <thead><tr><th>TX ID</th><th>User</th><th>Vehicle</th><th>Amount</th><th>Status</th></tr></thead>
-                    <tbody id="ledger-body"></tbody>
-                </table>
-            </div>
-        </main>
-    </div>
-
-    <div id="mod-add" class="modal"><div class="modal-box">
-        <h2 style="margin-bottom:25px;">Register Vehicle</h2>
-        <div class="input-group"><label>Model Name</label><input id="mv-model" class="inp" placeholder="e.g. Porsche 911"></div>
-        <div style="display:grid; grid-template-columns: 1fr 1fr; gap:15px;">
-            <div class="input-group"><label>Price / Hr</label><input id="mv-price" type="number" class="inp"></div>
-            <div class="input-group"><label>Year</label><input id="mv-year" type="number" class="inp" value="2024"></div>
-        </div>
-        <div style="display:grid; grid-template-columns: 1fr 1fr 1fr; gap:15px;">
-            <div class="input-group"><label>Fuel</label>
-                <select id="mv-fuel" class="inp"><option>Petrol</option><option>Electric</option><option>Diesel</option></select>
-            </div>
-            <div class="input-group"><label>Trans.</label>
-                <select id="mv-trans" class="inp"><option>Auto</option><option>Manual</option></select>
-            </div>
-            <div class="input-group"><label>Seats</label><input id="mv-seats" type="number" class="inp" value="4"></div>
-        </div>
-        <div class="input-group"><label>Image</label><input id="mv-img" type="file" class="inp"></div>
-        <button class="btn btn-p" style="width:100%" onclick="saveVehicle()">Add to Fleet</button>
-        <button class="btn btn-o" style="width:100%; margin-top:10px;" onclick="closeAll()">Cancel</button>
-    </div></div>
-
-    <div id="mod-rent" class="modal"><div class="modal-box">
-        <h2 style="margin-bottom:10px;">Secure Checkout</h2>
-        <p id="rent-info" style="color:#64748B; margin-bottom:20px;"></p>
-        
-        <div style="display:flex; gap:10px; margin-bottom:20px;">
-            <div style="flex:1; text-align:center;">
-                <img id="qr-ph" src="" style="width:140px; border-radius:10px; border:1px solid #eee;">
-                <div style="font-size:0.8rem; margin-top:5px; color:#64748B;">Scan UPI</div>
-                <div id="final-amt" style="margin-top:8px; font-weight:700;"></div>
-
-            </div>
-            <div style="flex:1;">
-                <div class="input-group">
-    <label>Card / UPI ID</label>
-    <input id="pay-id" class="inp" placeholder="user@okhdfcbank">
-    <div id="pay-error" style="color:#EF4444; font-size:0.8rem; margin-top:6px; display:none;">
-        Invalid UPI ID
-    </div>
-</div>
-
-                <div class="input-group">
-    <label>Coupon</label>
-    <div style="display:flex; gap:8px;">
-        <input id="pay-coup" class="inp" placeholder="Optional">
-        <button class="btn btn-o" onclick="applyCoupon()">Apply</button>
-    </div>
-</div>
-
-            </div>
-        </div>
-        
-        <button class="btn btn-p" style="width:100%" onclick="confirmRent()">Confirm Payment</button>
-        <button class="btn btn-o" style="width:100%; margin-top:10px;" onclick="closeAll()">Cancel</button>
-    </div></div>
-
-    <div id="mod-success" class="modal"><div class="modal-box" style="text-align:center;">
-        <div style="font-size:4rem; color:#10B981; margin-bottom:10px;"><i class="fas fa-check-circle"></i></div>
-        <h2>Payment Verified!</h2>
-        <p style="color:#64748B; margin-bottom:20px;">Your vehicle has been unlocked.</p>
-        <div class="receipt" id="receipt-box"></div>
-        <button class="btn btn-p" onclick="closeAll()">Close & Drive</button>
-    </div></div>
-    <div id="mod-processing" class="modal">
-        <div class="modal-box" style="text-align:center;">
-    
-    <div style="font-size:3rem; margin-bottom:15px;">
-      <i class="fas fa-lock" style="color:#4F46E5;"></i>
-    </div>
-
-    <h2>Securing Payment</h2>
-    <p style="color:#64748B; margin-bottom:20px;">
-      Locking amount & verifying transaction...
-    </p>
-
-    <div style="height:8px; background:#E5E7EB; border-radius:10px; overflow:hidden;">
-      <div id="pay-progress"
-           style="width:0%; height:100%; 
-           background:linear-gradient(90deg,#4F46E5,#6366F1);
-           transition:0.4s;">
-      </div>
-    </div>
-
-    <div style="margin-top:15px; font-size:0.85rem; color:#94A3B8;">
-      Please do not close this window
-    </div>
-
-  </div>
-</div>
-
-
-    <div id="mod-ret" class="modal"><div class="modal-box">
-        <h3>Vehicle Check-in</h3>
-        <div class="input-group"><label>Kilometers Driven</label><input id="ret-kms" type="number" class="inp"></div>
-        <div class="input-group"><label>Damage Fine (₹)</label><input id="ret-fine" type="number" class="inp" value="0"></div>
-        <button class="btn btn-p" style="width:100%" onclick="processReturn()">Complete Return</button>
-        <button class="btn btn-o" style="width:100%; margin-top:10px;" onclick="closeAll()">Cancel</button>
-    </div></div>
-
-    <script>
-        let curV=null, curTx=null, role=null;
-        let finalAmount = 0;
-
-        function toggleAuth() { document.getElementById('login-form').classList.toggle('hidden'); document.getElementById('reg-form').classList.toggle('hidden'); }
-
-        async function login() {
-            const res = await fetch('/api/auth/login', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({email:document.getElementById('l-email').value, password:document.getElementById('l-pass').value})});
-            const d = await res.json();
-            if(d.status==='success') init(d.user); else Swal.fire('Error', d.message, 'error');
-        }
-
-        async function register() {
-            const res = await fetch('/api/auth/register', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({name:document.getElementById('r-name').value, email:document.getElementById('r-email').value, password:document.getElementById('r-pass').value})});
-            const d = await res.json();
-            if(d.status==='success') { Swal.fire('Success', 'Login now', 'success'); toggleAuth(); } else Swal.fire('Error', d.message, 'error');
-        }
-
-        function init(user) {
-            role = user.role;
-            document.getElementById('auth').classList.add('hidden');
-            document.getElementById('app').classList.remove('hidden');
-            document.getElementById('u-name').innerText = user.name;
-            document.getElementById('u-role').innerText = user.role.toUpperCase();
-
-            if(role === 'admin') {
-                document.getElementById('nav-admin').classList.remove('hidden');
-                document.getElementById('btn-add').classList.remove('hidden');
-                nav('dash', document.querySelector('#nav-admin .nav-item'));
-            } else {
-                document.getElementById('nav-user').classList.remove('hidden');
-                nav('garage', document.querySelector('#nav-user .nav-item'));
-            }
-            sync();
-        }
-
-        async function sync() {
-            const res = await fetch('/api/data/sync');
-            const d = await res.json();
-            const data = d.data;
-
-            // RENDER FLEET
-            document.getElementById('fleet-grid').innerHTML = data.vehicles.map(v => `
-                <div class="car-card">
-                    <span class="badge st-${v.status}">${v.status}</span>
-                    <img class="car-img" src="${v.image ? '/static/uploads/'+v.image : 'https://placehold.co/400x250'}">
-                    <div class="car-body">
-                        <div style="display:flex; justify-content:space-between; align-items:start;">
-                            <div>
-                                <h3 style="margin:0 0 5px 0; font-size:1.2rem;">${v.model}</h3>
-                                <div class="tags">
-                                    <span class="tag"><i class="fas fa-calendar"></i> ${v.year}</span>
-                                    <span class="tag"><i class="fas fa-cog"></i> ${v.transmission}</span>
-                                    <span class="tag"><i class="fas fa-user"></i> ${v.seats}</span>
-                                    <span class="tag"><i class="fas fa-gas-pump"></i> ${v.fuel}</span>
-                                    <span class="tag"><i class="fas fa-road"></i> ${v.kms} km</span>
-                                    <span class="tag"><i class="fas fa-heartbeat"></i> ${v.health}%</span>
-
-                                </div>
-                            </div>
-                        </div>
-                        <div style="display:flex; justify-content:space-between; align-items:center; margin-top:15px; padding-top:15px; border-top:1px solid #F1F5F9;">
-                            <div><span style="font-size:1.4rem; font-weight:800; color:var(--p);">₹${v.price}</span> <span style="font-size:0.8rem; color:#94A3B8;">/ hr</span></div>
-                            <div style="display:flex; gap:10px;">
-                                ${role==='user' && v.status==='Available' ? `<button class="btn btn-p" style="padding:10px 20px;" onclick="openRent('${v.id}','${v.model}',${v.price})">Rent</button>` : ''}
-                                ${role==='admin' ? `<button class="btn btn-d" onclick="delCar('${v.id}')"><i class="fas fa-trash"></i></button>` : ''}
-                            </div>
-                        </div>
-                    </div>
-                </div>`).join('');
-
-            // RENDER ADMIN
-            if(role === 'admin') {
-                document.getElementById('st-rev').innerText = '₹' + data.stats.revenue.toLocaleString();
-                document.getElementById('st-act').innerText = data.stats.active;
-                document.getElementById('st-flt').innerText = data.stats.fleet;
-                document.getElementById('st-kms').innerText = data.stats.kms;
-
-                const active = data.rentals.filter(r => r.status === 'Active');
-                document.getElementById('active-list').innerHTML = active.length ? active.map(r => `
-                    <div style="background:white; padding:20px; border-radius:16px; border:1px solid #E2E8F0; display:flex; justify-content:space-between; align-items:center;">
-                        <div>
-                            <div style="font-weight:700; font-size:1.1rem;">${r.vehicle_model}</div>
-                            <div style="color:#64748B; font-size:0.9rem;">Renter: ${r.user_name} • ${r.user_email}</div>
-                        </div>
-                        <button class="btn btn-p" onclick="openRet('${r.tx_id}')">Check-in</button>
-                    </div>`).join('') : '<p style="color:#94A3B8;">No vehicles pending return.</p>';
-
-                document.getElementById('ledger-body').innerHTML = data.rentals.map(r => `
-                    <tr>
-                        <td><code>${r.tx_id}</code></td>
-                        <td>${r.user_name}</td>
-                        <td>${r.vehicle_model}</td>
-                        <td>₹${r.total}</td>
-                        <td><span style="font-weight:700; color:${r.status==='Active'?'#10B981':'#64748B'}">${r.status}</span></td>
-                    </tr>`).join('');
-            }
-
-            // RENDER USER
-            if(role === 'user') {
-                const myActive = data.rentals.filter(r => r.status === 'Active');
-                document.getElementById('my-rentals').innerHTML = myActive.length ? myActive.map(r => `
-                    <div style="background:white; padding:30px; border-radius:20px; border:1px solid #E2E8F0; text-align:center;">
-                        <div style="font-size:3rem; margin-bottom:10px;">🚗</div>
-                        <h2 style="margin:0 0 10px 0;">${r.vehicle_model}</h2>
-                        <div style="background:#FEF2F2; color:#EF4444; padding:8px 16px; border-radius:30px; display:inline-block; font-weight:700; font-size:0.8rem; margin-bottom:15px;">ACTIVE RENTAL</div>
-                        <p style="color:#64748B;">Please drive safely. Return to the station for check-in.</p>
-                    </div>`).join('') : '<p style="color:#94A3B8;">No active rentals.</p>';
-            }
-        }
-
-        function openRent(id, model, price) {
-
-    curV = { v_id: id, price: price };
-    finalAmount = price;
-
-    document.getElementById('rent-info').innerText =
-        `${model} - ₹${price}/day`;
-
-    generateQR(finalAmount);
-
-    openModal('mod-rent');
-}
-
-        
-        async function confirmRent() {
-
-    const payId = document.getElementById('pay-id').value;
-    const payInput = document.getElementById('pay-id');
-const errorBox = document.getElementById('pay-error');
-
-// Simple UPI validation
-const upiPattern = /^[a-zA-Z0-9._-]+@[a-zA-Z]+$/;
-
-if(!upiPattern.test(payId)) {
-
-    payInput.classList.add("input-error");
-    errorBox.style.display = "block";
-    errorBox.innerText = "Enter valid UPI ID (example: name@bank)";
-
-    return;
-
-} else {
-    payInput.classList.remove("input-error");
-    errorBox.style.display = "none";
-}
-
-
-    closeAll();
-    openModal('mod-processing');
-
-    let progress = 0;
-
-    const progressBar = document.getElementById('pay-progress');
-
-    const interval = setInterval(() => {
-        progress += 25;
-        progressBar.style.width = progress + "%";
-    }, 400);
-
-    // Simulated fintech processing
-    setTimeout(async () => {
-
-        clearInterval(interval);
-        progressBar.style.width = "100%";
-
-        const res = await fetch('/api/rent/create', {
-            method:'POST',
-            headers:{'Content-Type':'application/json'},
-           body:JSON.stringify({
-               v_id: curV.v_id,
-               price: finalAmount,
-               pay_id: payId
-})
-
-
-        });
-
-        const d = await res.json();
-
-        closeAll();
-        sync();
-
-        confetti({
-            particleCount: 180,
-            spread: 90,
-            origin: { y: 0.6 }
-        });
-
-        document.getElementById('receipt-box').innerHTML = `
-            <div><span>Transaction ID:</span> <b>${d.tx_id}</b></div>
-            <div><span>Amount Paid:</span> <b>₹${finalAmount}</b></div>
-            <div><span>Method:</span> <b>${payId}</b></div>
-            <div><span>Status:</span> <b style="color:#10B981">SUCCESS</b></div>
-        `;
-
-        openModal('mod-success');
-
-    }, 2000); // 2 second premium delay
-}
-
-function generateQR(amount) {
-    const upiLink = `upi://pay?pa=nsuryachandra16@okicici&pn=DriveHub&am=${amount}&cu=INR`;
-    const qrURL = 
-        `https://api.qrserver.com/v1/create-qr-code/?size=200x200&data=${encodeURIComponent(upiLink)}`;
-
-    document.getElementById('qr-ph').src = qrURL;
-}
-function applyCoupon() {
-    const code = document.getElementById('pay-coup').value.trim().toUpperCase();
-
-    if(code === "HUB20") {
-        finalAmount = Math.round(curV.price * 0.8);
-        Swal.fire('Coupon Applied', '20% Discount Activated!', 'success');
-    } else if(code === "") {
-        finalAmount = curV.price;
-    } else {
-        finalAmount = curV.price;
-        Swal.fire('Invalid Code', 'No discount applied', 'warning');
-    }
-
-    document.getElementById('final-amt').innerText = "₹" + finalAmount;
-    generateQR(finalAmount);
-}
-
-
-        function openRet(tx) { curTx=tx; openModal('mod-ret'); }
-        async function processReturn() { 
-            await fetch('/api/rent/return', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({
-                tx_id:curTx, kms:document.getElementById('ret-kms').value, fine:document.getElementById('ret-fine').value
-            })});
-            closeAll(); sync(); Swal.fire('Success', 'Return Processed', 'success');
-        }
-
-        async function saveVehicle() {
-            const fd = new FormData();
-            ['model','price','year','fuel','trans','seats'].forEach(k => fd.append(k.replace('mv-',''), document.getElementById('mv-'+k).value));
-            const f = document.getElementById('mv-img').files[0]; if(f) fd.append('image', f);
-            await fetch('/api/vehicle/manage', {method:'POST', body:fd});
-            closeAll(); sync();
-        }
-
-        async function delCar(id) { if(confirm('Delete vehicle?')) { await fetch('/api/vehicle/delete', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({id:id})}); sync(); } }
-        async function logout() { await fetch('/api/auth/logout', {method:'POST'}); location.reload(); }
-        function nav(v, el) { 
-            document.querySelectorAll('.nav-item').forEach(x=>x.classList.remove('active')); el.classList.add('active');
-            ['dash','garage','fleet','ledger'].forEach(x=>document.getElementById('view-'+x).classList.add('hidden'));
-            document.getElementById('view-'+v).classList.remove('hidden');
-        }
-        function openModal(id) { document.getElementById(id).classList.add('active'); }
-        function closeAll() { document.querySelectorAll('.modal').forEach(x=>x.classList.remove('active')); }
-    
-
-    </script>
-</body>
-</html>
-"""
-
-# ==========================================
-# RUN
-# ==========================================
-
-if __name__ == "__main__":
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
-
+import os
+import sys
+import uuid
+import hashlib
+import hmac
+import io
+import math
+import json
+import random
+import secrets
+import sqlite3
+import time
+import threading
+import base64
+import gzip
+import csv
+import zipfile
+import re
+from bisect import bisect_left, bisect_right, insort
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import Flask, Response, g, request, jsonify, session, send_from_directory
+from flask.json.provider import DefaultJSONProvider
+from flask.sessions import SessionInterface, SessionMixin
+from werkzeug.datastructures import CallbackDict
+from werkzeug.middleware.proxy_fix import ProxyFix
+from werkzeug.security import check_password_hash, generate_password_hash
+from werkzeug.utils import secure_filename
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+try:
+    import fcntl
+except ImportError:  # Windows: locks only hold within one process
+    fcntl = None
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+try:
+    import orjson
+except ImportError:  # stdlib json
+    orjson = None
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # No thumbnails, cards fall back to the original upload
+    Image = None
+
+# ==========================================
+# 1. CONFIGURATION
+# ==========================================
+class FastJSONProvider(DefaultJSONProvider):
+    # jsonify() through orjson when it is installed; key order is left as
+    # built since nothing relies on sorted keys
+    sort_keys = False
+
+    @staticmethod
+    def default(obj):
+        if isinstance(obj, Record):
+            return obj.to_json()
+        return DefaultJSONProvider.default(obj)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=self.default).decode('utf-8')
+
+    def response(self, *args, **kwargs):
+        with METRICS.timer('drivehub_json_encode_seconds'):
+            if orjson is None:
+                return super().response(*args, **kwargs)
+            obj = self._prepare_response_obj(args, kwargs)
+            return self._app.response_class(orjson.dumps(obj, default=self.default), mimetype=self.mimetype)
+
+
+app = Flask(__name__)
+app.json = FastJSONProvider(app)
+app.secret_key = 'TITANIUM_PAYMASTER_KEY_V16'
+app.config['UPLOAD_FOLDER'] = 'static/uploads'
+app.config['THUMB_FOLDER'] = 'static/uploads/thumbs'
+app.config['THUMB_SIZE'] = (640, 440)
+app.config['IMAGE_WORKERS'] = int(os.environ.get('IMAGE_WORKERS', 2))
+app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024
+app.config['IMPORT_MAX_CONTENT_LENGTH'] = int(os.environ.get('IMPORT_MAX_CONTENT_LENGTH', 512 * 1024 * 1024))
+app.config['IMPORT_MAX_ROWS'] = int(os.environ.get('IMPORT_MAX_ROWS', 10000))
+app.config['RETURN_BATCH_LIMIT'] = int(os.environ.get('RETURN_BATCH_LIMIT', 500))
+
+app.config['PAYMENT_VERIFIER'] = os.environ.get('PAYMENT_VERIFIER', 'stub')
+app.config['PAYMENT_STUB_DELAY'] = float(os.environ.get('PAYMENT_STUB_DELAY', 0))
+app.config['PAYMENT_WORKERS'] = int(os.environ.get('PAYMENT_WORKERS', 2))
+app.config['PAYMENT_HOLD_SECONDS'] = int(os.environ.get('PAYMENT_HOLD_SECONDS', 300))
+app.config['PAYMENT_SWEEP_INTERVAL'] = int(os.environ.get('PAYMENT_SWEEP_INTERVAL', 15))
+app.config['MEDIA_MAX_AGE'] = 365 * 24 * 3600
+# JSON responses at least this big are gzip/brotli encoded on the way out
+app.config['COMPRESS_MIN_SIZE'] = int(os.environ.get('COMPRESS_MIN_SIZE', 1024))
+app.config['COMPRESS_LEVEL'] = int(os.environ.get('COMPRESS_LEVEL', 6))
+# Serve the UI's inline CSS/JS as separate fingerprinted, long-cached files
+app.config['SPLIT_ASSETS'] = os.environ.get('SPLIT_ASSETS', '0') == '1'
+# Let Apache/lighttpd (X-Sendfile) stream uploads instead of Python
+app.config['USE_X_SENDFILE'] = os.environ.get('USE_X_SENDFILE', '0') == '1'
+app.config['BACKGROUND_JOBS'] = os.environ.get('BACKGROUND_JOBS', '1') == '1'
+app.config['MAINTENANCE_INTERVAL'] = int(os.environ.get('MAINTENANCE_INTERVAL', 60))
+app.config['JOURNAL_COMPACT_INTERVAL'] = int(os.environ.get('JOURNAL_COMPACT_INTERVAL', 300))
+app.config['CHANGE_LOG_LIMIT'] = int(os.environ.get('CHANGE_LOG_LIMIT', 1000))
+app.config['SSE_MAX_AGE'] = int(os.environ.get('SSE_MAX_AGE', 300))
+app.config['SSE_POLL_INTERVAL'] = float(os.environ.get('SSE_POLL_INTERVAL', 1))
+# Each open stream pins a worker thread; the rest must stay free for requests
+app.config['SSE_MAX_STREAMS'] = int(os.environ.get('SSE_MAX_STREAMS', 2))
+app.config['STORAGE_ENGINE'] = os.environ.get('STORAGE_ENGINE', 'xml')
+app.config['SQLITE_PATH'] = os.environ.get('SQLITE_PATH', 'drivehub.db')
+# /metrics is open unless a token is set (then: Authorization: Bearer <token>)
+app.config['METRICS_TOKEN'] = os.environ.get('METRICS_TOKEN')
+# Login token buckets: BURST attempts at once, then one per REFILL seconds
+app.config['LOGIN_THROTTLE'] = os.environ.get('LOGIN_THROTTLE', '1') == '1'
+app.config['LOGIN_BURST'] = int(os.environ.get('LOGIN_BURST', 5))
+app.config['LOGIN_REFILL_SECONDS'] = float(os.environ.get('LOGIN_REFILL_SECONDS', 12))
+app.config['LOGIN_IP_BURST'] = int(os.environ.get('LOGIN_IP_BURST', 30))
+app.config['LOGIN_IP_REFILL_SECONDS'] = float(os.environ.get('LOGIN_IP_REFILL_SECONDS', 1))
+# Proxies in front of the app (e.g. the PaaS router) whose X-Forwarded-For /
+# X-Forwarded-Proto are trusted; without it every client has the router's IP
+app.config['PROXY_HOPS'] = int(os.environ.get('PROXY_HOPS', 0))
+# Server-side sessions: 'memory' (one worker) or 'sqlite' (shared by workers)
+app.config['SESSION_STORE'] = os.environ.get('SESSION_STORE', 'memory')
+app.config['SESSION_PATH'] = os.environ.get('SESSION_PATH', 'sessions.db')
+app.config['SESSION_TTL'] = int(os.environ.get('SESSION_TTL', 7 * 24 * 3600))
+app.config['SESSION_MAX_ENTRIES'] = int(os.environ.get('SESSION_MAX_ENTRIES', 100000))
+app.config['SESSION_PURGE_INTERVAL'] = int(os.environ.get('SESSION_PURGE_INTERVAL', 600))
+# Sample stacks of requests slower than this many ms into PROFILE_DIR (0: off)
+app.config['PROFILE_SLOW_MS'] = int(os.environ.get('PROFILE_SLOW_MS', 0))
+app.config['PROFILE_INTERVAL'] = float(os.environ.get('PROFILE_INTERVAL', 0.005))
+app.config['PROFILE_DIR'] = os.environ.get('PROFILE_DIR', 'profiles')
+
+for folder in (app.config['UPLOAD_FOLDER'], app.config['THUMB_FOLDER']):
+    if not os.path.exists(folder):
+        os.makedirs(folder)
+
+if app.config['PROXY_HOPS']:
+    app.wsgi_app = ProxyFix(app.wsgi_app, x_for=app.config['PROXY_HOPS'], x_proto=app.config['PROXY_HOPS'])
+
+DB_FILES = {
+    'users': 'users.xml',
+    'vehicles': 'vehicles.xml',
+    'rentals': 'rentals.xml',
+    'stats': 'stats.xml',
+    'changes': 'changes.xml'
+}
+
+# Append-only tables: writes go to a JSON-lines journal, compacted into
+# the XML snapshot by a background job
+DB_JOURNALS = {
+    'rentals': 'rentals.journal',
+    'changes': 'changes.journal'
+}
+
+# Field each table is keyed on for single-record reads and writes
+PRIMARY_KEYS = {
+    'users': 'email',
+    'vehicles': 'id',
+    'rentals': 'tx_id',
+    'stats': 'name',
+    'changes': 'version'
+}
+
+# Extra hash indexes kept on the in-memory copy of each table
+SECONDARY_INDEXES = {
+    'vehicles': ('status', 'fuel', 'transmission'),
+    'rentals': ('user_email', 'status', 'vehicle_id')
+}
+
+
+def _as_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+# Ordered indexes (field -> sort key) backing paginated listings
+SORTED_INDEXES = {
+    'vehicles': {'price': _as_float, 'year': _as_float, 'seats': _as_float},
+    'rentals': {'date': str, 'total': _as_float}
+}
+
+# A rental holds its car from start to end while Pending (payment being
+# verified), Booked (paid, not picked up yet) or Active (on the road)
+HOLDING_STATUSES = ('Pending', 'Booked', 'Active')
+# Never paid for, so there is nothing to check in
+UNPAID_STATUSES = ('Pending', 'Failed', 'Expired')
+
+
+def _booking_span(rental):
+    if rental.get('status') not in HOLDING_STATUSES:
+        return None
+    start = rental.get('start') or rental.get('date')
+    if start is None:
+        return None
+    # Rentals from before advance booking have no end: held until returned
+    return start, rental.get('end') or datetime.max
+
+
+# Interval indexes: per value of the group field, the (start, end) spans
+# that a table's records hold, kept sorted for overlap checks
+CALENDARS = {
+    'rentals': ('vehicle_id', _booking_span)
+}
+
+# ==========================================
+# 2. INSTRUMENTATION
+# ==========================================
+# In-process counters and histograms, rendered in the Prometheus text format
+# by /metrics. Each gunicorn worker keeps and reports its own numbers.
+
+METRIC_TYPES = {
+    'drivehub_requests_total': ('counter', "HTTP requests by route, method and status"),
+    'drivehub_request_seconds': ('histogram', "HTTP request latency by route"),
+    'drivehub_slow_requests_total': ('counter', "Requests over PROFILE_SLOW_MS that were profiled"),
+    'drivehub_json_encode_seconds': ('histogram', "Time spent encoding JSON responses"),
+    'drivehub_table_ops_total': ('counter', "Data API calls by table and operation"),
+    'drivehub_storage_seconds': ('histogram', "Storage engine time by table and step"),
+    'drivehub_storage_bytes_total': ('counter', "Bytes read from / written to storage by table"),
+    'drivehub_table_records': ('gauge', "Records per table"),
+    'drivehub_store_version': ('gauge', "Newest change log version"),
+    'drivehub_sessions': ('gauge', "Live sessions in the session store"),
+    'drivehub_import_rows_total': ('counter', "Bulk import rows by result"),
+    'drivehub_payments_total': ('counter', "Settled payments by outcome"),
+    'drivehub_payment_verify_seconds': ('histogram', "Time spent in the payment verifier")
+}
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+class Metrics:
+    def __init__(self, types, buckets=LATENCY_BUCKETS):
+        self.types = types
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._values = defaultdict(float)    # (name, labels) -> counter
+        self._histograms = {}                # (name, labels) -> [counts, sum, count]
+        self._collectors = []
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._values[(name, tuple(sorted(labels.items())))] += value
+
+    def observe(self, name, value, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = self._histograms[key] = [[0] * len(self.buckets), 0.0, 0]
+            i = bisect_left(self.buckets, value)
+            if i < len(self.buckets):
+                hist[0][i] += 1
+            hist[1] += value
+            hist[2] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started, **labels)
+
+    def collector(self, fn):
+        # fn() -> [(name, labels, value)], read at scrape time (gauges)
+        self._collectors.append(fn)
+        return fn
+
+    def render(self):
+        samples = defaultdict(list)
+        with self._lock:
+            for (name, labels), value in self._values.items():
+                samples[name].append((name, labels, value))
+            for (name, labels), (counts, total, count) in self._histograms.items():
+                cumulative = 0
+                for bound, n in zip(self.buckets, counts):
+                    cumulative += n
+                    samples[name].append((name + '_bucket', labels + (('le', repr(float(bound))),), cumulative))
+                samples[name].append((name + '_bucket', labels + (('le', '+Inf'),), count))
+                samples[name].append((name + '_sum', labels, total))
+                samples[name].append((name + '_count', labels, count))
+        for fn in self._collectors:
+            try:
+                for name, labels, value in fn():
+                    samples[name].append((name, tuple(sorted(labels.items())), value))
+            except Exception:
+                app.logger.exception("Metrics collector %s failed", fn.__name__)
+
+        lines = []
+        for name in sorted(samples):
+            kind, text = self.types.get(name, ('untyped', name))
+            lines.append(f"# HELP {name} {text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for sample, labels, value in samples[name]:
+                label_text = ','.join(f'{k}="{_escape_label(v)}"' for k, v in labels)
+                lines.append(f"{sample}{{{label_text}}} {value}" if labels else f"{sample} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+def _escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+METRICS = Metrics(METRIC_TYPES)
+
+
+class SlowRequestProfiler:
+    # Samples the stacks of in-flight request threads every `interval`
+    # seconds. Requests that finish slower than the threshold have their
+    # samples written out in the folded format flamegraph.pl / speedscope
+    # read ("frame;frame;frame count" per line).
+
+    def __init__(self, interval, directory):
+        self.interval = interval
+        self.directory = directory
+        self._active = {}   # thread id -> {folded stack: samples}
+        self._started = False
+        self._lock = threading.Lock()
+
+    def begin(self):
+        with self._lock:
+            if not self._started:
+                self._started = True
+                threading.Thread(target=self._run, name="drivehub-profiler", daemon=True).start()
+            self._active[threading.get_ident()] = defaultdict(int)
+
+    def discard(self):
+        self._active.pop(threading.get_ident(), None)
+
+    def end(self, label, elapsed, threshold):
+        stacks = self._active.pop(threading.get_ident(), None)
+        if not stacks or elapsed < threshold:
+            return None
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}-{re.sub(r'[^A-Za-z0-9_.-]+', '_', label)}.folded")
+        with open(path, 'w') as f:
+            for stack, count in sorted(stacks.items()):
+                f.write(f"{stack} {count}\n")
+        return path
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            frames = sys._current_frames()
+            for ident, stacks in list(self._active.items()):
+                frame = frames.get(ident)
+                if frame is not None:
+                    stacks[_fold(frame)] += 1
+
+
+def _fold(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+        frame = frame.f_back
+    return ';'.join(reversed(names))
+
+
+PROFILER = SlowRequestProfiler(app.config['PROFILE_INTERVAL'], app.config['PROFILE_DIR'])
+
+# ==========================================
+# 3. STORAGE ENGINES
+# ==========================================
+# Every table is a list of records (typed Record objects for users,
+# vehicles and rentals, string dicts otherwise). Routes talk to the active
+# engine through load_db / save_db (whole table) and get_db / put_db /
+# delete_db (one record, addressed by PRIMARY_KEYS). Read-modify-write
+# sequences go inside db_transaction(...) so they are isolated from other
+# threads and gunicorn workers.
+
+class StorageEngine:
+    name = None
+
+    def transaction(self, *keys):
+        raise NotImplementedError
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def load(self, key):
+        raise NotImplementedError
+
+    def save(self, key, data):
+        raise NotImplementedError
+
+    def scan(self, key):
+        # Records one at a time, for read-only passes over a whole table
+        raise NotImplementedError
+
+    def get(self, key, pk):
+        raise NotImplementedError
+
+    def put(self, key, record):
+        raise NotImplementedError
+
+    def put_many(self, key, records):
+        with self.transaction(key):
+            for record in records:
+                self.put(key, record)
+
+    def delete(self, key, pk):
+        raise NotImplementedError
+
+    def select(self, key, field, value):
+        raise NotImplementedError
+
+    def count(self, key):
+        raise NotImplementedError
+
+    def last(self, key):
+        raise NotImplementedError
+
+    def after(self, key, pk):
+        raise NotImplementedError
+
+    def compact(self):
+        return []
+
+    def overlapping(self, key, value, start, end):
+        # Records of `key` whose CALENDARS span for `value` meets [start, end)
+        table = self._indexed(key)
+        if table is not None:
+            return [r.copy() for r in table.overlapping(value, start, end)]
+        # Uncommitted writes aren't indexed yet
+        group, span_of = CALENDARS[key]
+        found = []
+        for record in self.select(key, group, value):
+            span = span_of(record)
+            if span and span[0] < end and start < span[1]:
+                found.append(record)
+        return found
+
+    def page(self, key, sort, **options):
+        # Listings read the committed, indexed copy of the table
+        records, next_cursor = self._table(key).page(sort, **options)
+        return [r.copy() for r in records], next_cursor
+
+
+# ---------- Typed records ----------
+# users, vehicles and rentals are held as slotted Record objects with native
+# int / float / datetime fields: text is parsed once when a record enters the
+# store and formatted once on its way to disk. Records also answer the dict
+# protocol (get, [], items) so the table code treats every table alike; the
+# internal tables (stats, changes) stay plain string dicts.
+
+def _parse_text(value):
+    return str(value).strip()
+
+
+def _parse_int(value):
+    if isinstance(value, int):
+        return value
+    value = _parse_float(value)
+    return int(value) if value is not None else None
+
+
+def _parse_float(value):
+    if not isinstance(value, float):
+        value = str(value).strip()
+        if not value:
+            return None
+        value = float(value)
+    # float() also takes "inf" and "nan", which no field can hold
+    if not math.isfinite(value):
+        raise ValueError(f"{value!r} is not a finite number")
+    return value
+
+
+def _format_float(value):
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _timestamp(fmt):
+    def parse(value):
+        # Round-trip datetimes too, so memory holds exactly what disk will
+        if isinstance(value, datetime):
+            value = value.strftime(fmt)
+        value = str(value).strip()
+        return datetime.strptime(value, fmt) if value else None
+    return parse, lambda value: value.strftime(fmt)
+
+
+# (parse, format) per field type
+TEXT = (_parse_text, str)
+INT = (_parse_int, str)
+FLOAT = (_parse_float, _format_float)
+
+
+class Record:
+    __slots__ = ('extra',)
+    FIELDS = {}
+
+    def __init__(self, values=()):
+        self.extra = {}     # fields outside the schema, kept as text
+        for name in self.FIELDS:
+            setattr(self, name, None)
+        self.update(values)
+
+    @classmethod
+    def coerce(cls, record):
+        if isinstance(record, cls):
+            return record.copy()
+        coerced = cls()
+        for name, value in dict(record).items():
+            try:
+                coerced[name] = value
+            except ValueError:
+                # Older files can hold junk like "None" in a number field;
+                # keep the text as it is rather than fail the whole table
+                app.logger.warning("%s.%s: unparseable value %r kept as text", cls.__name__, name, value)
+                coerced.extra[name] = _parse_text(value)
+        return coerced
+
+    def copy(self):
+        clone = self.__class__.__new__(self.__class__)
+        for name in self.FIELDS:
+            setattr(clone, name, getattr(self, name))
+        clone.extra = dict(self.extra)
+        return clone
+
+    def get(self, name, default=None):
+        value = getattr(self, name) if name in self.FIELDS else self.extra.get(name)
+        return default if value is None else value
+
+    def __getitem__(self, name):
+        value = self.get(name)
+        if value is None:
+            raise KeyError(name)
+        return value
+
+    def __setitem__(self, name, value):
+        if name in self.FIELDS:
+            setattr(self, name, None if value is None else self.FIELDS[name][0](value))
+            if self.extra:
+                self.extra.pop(name, None)
+        elif value is None:
+            self.extra.pop(name, None)
+        else:
+            self.extra[name] = _parse_text(value)
+
+    def __contains__(self, name):
+        return self.get(name) is not None
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return [name for name in self.FIELDS if getattr(self, name) is not None] + list(self.extra)
+
+    def _typed(self):
+        return [(name, getattr(self, name)) for name in self.FIELDS if getattr(self, name) is not None]
+
+    def items(self):
+        # extra may also hold a schema field whose stored text didn't parse
+        return self._typed() + list(self.extra.items())
+
+    def update(self, values):
+        for name, value in dict(values).items():
+            self[name] = value
+
+    def pop(self, name, default=None):
+        value = self.get(name, default)
+        self[name] = None
+        return value
+
+    def dump(self):
+        # Storage form: every field as text
+        data = {name: self.FIELDS[name][1](value) for name, value in self._typed()}
+        data.update(self.extra)
+        return data
+
+    def to_json(self):
+        data = {name: self.FIELDS[name][1](value) if isinstance(value, datetime) else value
+                for name, value in self._typed()}
+        data.update(self.extra)
+        return data
+
+    def __repr__(self):
+        return f"{self.__class__.__name__}({self.to_json()!r})"
+
+
+class User(Record):
+    # password: legacy plaintext, replaced by password_hash on first login
+    FIELDS = {'id': TEXT, 'name': TEXT, 'email': TEXT, 'password': TEXT, 'password_hash': TEXT, 'role': TEXT}
+    __slots__ = tuple(FIELDS)
+
+
+class Vehicle(Record):
+    FIELDS = {
+        'id': TEXT, 'model': TEXT, 'price': FLOAT, 'year': INT, 'fuel': TEXT,
+        'transmission': TEXT, 'seats': INT, 'health': INT, 'kms': INT,
+        'status': TEXT, 'image': TEXT, 'thumb': TEXT,
+        'maintenance_start': _timestamp("%Y-%m-%d %H:%M:%S")
+    }
+    __slots__ = tuple(FIELDS)
+
+
+class Rental(Record):
+    FIELDS = {
+        'tx_id': TEXT, 'user_email': TEXT, 'user_name': TEXT, 'vehicle_id': TEXT,
+        'vehicle_model': TEXT, 'price': FLOAT, 'total': FLOAT,
+        'payment_method': TEXT, 'payment_id': TEXT, 'status': TEXT,
+        'date': _timestamp("%Y-%m-%d %H:%M"), 'return_date': _timestamp("%Y-%m-%d %H:%M"),
+        'start': _timestamp("%Y-%m-%d %H:%M"), 'end': _timestamp("%Y-%m-%d %H:%M"),
+        'hold_until': _timestamp("%Y-%m-%d %H:%M:%S")
+    }
+    __slots__ = tuple(FIELDS)
+
+
+MODELS = {
+    'users': User,
+    'vehicles': Vehicle,
+    'rentals': Rental
+}
+
+
+def _pk(key, record):
+    return str(record.get(PRIMARY_KEYS[key], '')).strip()
+
+
+def _normalise(key, record):
+    # Typed record for modelled tables, otherwise the same string dict a
+    # record is after a round trip through the XML files
+    model = MODELS.get(key)
+    if model:
+        return model.coerce(record)
+    return {k: str(v).strip() for k, v in record.items()}
+
+
+def _encode(record):
+    return record.dump() if isinstance(record, Record) else record
+
+
+class Table:
+    # In-memory copy of one table: records in storage order, a hash index on
+    # the primary key, one per SECONDARY_INDEXES field and a sorted
+    # (sort key, pk) list per SORTED_INDEXES field, plus the CALENDARS spans.
+    # Once an engine hands a Table to readers it is never modified again:
+    # writes go to patched(), a copy the engine swaps in.
+
+    def __init__(self, key, records=()):
+        self.key = key
+        self.fields = SECONDARY_INDEXES.get(key, ())
+        self.sort_keys = SORTED_INDEXES.get(key, {})
+        self.records = []
+        self.pos = {}
+        self.by = {field: defaultdict(dict) for field in self.fields}
+        self.sorted = {field: [] for field in self.sort_keys}
+        self.calendar = CALENDARS.get(key)
+        self.spans = defaultdict(list)      # group value -> [(start, end, pk)]
+        self._owned = None                  # see patched()
+
+        # Bulk load: index everything, then sort each ordered index once
+        self._loading = True
+        for record in records:
+            self.put(record)
+        self._loading = False
+        for entries in (*self.sorted.values(), *self.spans.values()):
+            entries.sort()
+
+    def __len__(self):
+        return len(self.records)
+
+    def patched(self, changes):
+        # A copy with `changes` ((op, record or pk) pairs) applied. The copy
+        # shares the records and every index bucket and span list the changes
+        # don't reach; those are copied on first write (_owned tracks which).
+        if not changes:
+            return self
+        table = self.__class__.__new__(self.__class__)
+        table.key = self.key
+        table.fields = self.fields
+        table.sort_keys = self.sort_keys
+        table.calendar = self.calendar
+        table.records = list(self.records)
+        table.pos = dict(self.pos)
+        table.by = {field: defaultdict(dict, buckets) for field, buckets in self.by.items()}
+        table.sorted = {field: list(entries) for field, entries in self.sorted.items()}
+        table.spans = defaultdict(list, self.spans)
+        table._owned = set()
+        table._loading = False
+        table.apply(changes)
+        return table
+
+    def apply(self, changes):
+        for op, value in changes:
+            if op == 'delete':
+                self.delete(value)
+            else:
+                self.put(value)
+
+    def _writable(self, index, name, value):
+        # index[value], copied first if it is still shared
+        entries = index[value]
+        if self._owned is not None and (name, value) not in self._owned:
+            entries = index[value] = entries.copy()
+            self._owned.add((name, value))
+        return entries
+
+    def get(self, pk):
+        i = self.pos.get(pk)
+        return self.records[i] if i is not None else None
+
+    def select(self, field, value):
+        return list(self.by[field].get(value, {}).values())
+
+    def last(self):
+        return self.records[-1] if self.records else None
+
+    def after(self, pk):
+        i = self.pos.get(pk)
+        return self.records[i + 1:] if i is not None else None
+
+    def put(self, record):
+        pk = _pk(self.key, record)
+        i = self.pos.get(pk)
+        if i is None:
+            self.pos[pk] = len(self.records)
+            self.records.append(record)
+        else:
+            self._unindex(pk, self.records[i])
+            self.records[i] = record
+        for field in self.fields:
+            self._writable(self.by[field], field, record.get(field, ''))[pk] = record
+        for field, sort_key in self.sort_keys.items():
+            entry = (sort_key(record.get(field, '')), pk)
+            if self._loading:
+                self.sorted[field].append(entry)
+            else:
+                insort(self.sorted[field], entry)
+        span = self._span(pk, record)
+        if span:
+            if self._loading:
+                self.spans[span[0]].append(span[1])
+            else:
+                insort(self._writable(self.spans, None, span[0]), span[1])
+
+    def _span(self, pk, record):
+        if self.calendar is None:
+            return None
+        group, span_of = self.calendar
+        interval = span_of(record)
+        return (record.get(group, ''), (*interval, pk)) if interval else None
+
+    def overlapping(self, value, start, end):
+        # Records whose span meets [start, end). Spans of one group never
+        # overlap each other (bookings are checked under the table lock), so
+        # walking back from the last span starting before `end` stops at the
+        # first one that finishes by `start`.
+        spans = self.spans.get(value, ())
+        i = bisect_left(spans, (end,))
+        found = []
+        while i > 0 and spans[i - 1][1] > start:
+            i -= 1
+            found.append(self.get(spans[i][2]))
+        return found[::-1]
+
+    def delete(self, pk):
+        i = self.pos.pop(pk, None)
+        if i is None:
+            return False
+        self._unindex(pk, self.records[i])
+        # Copy rather than pop so readers iterating the old list are unaffected
+        self.records = self.records[:i] + self.records[i + 1:]
+        for other, j in self.pos.items():
+            if j > i:
+                self.pos[other] = j - 1
+        return True
+
+    def _unindex(self, pk, record):
+        for field in self.fields:
+            value = record.get(field, '')
+            if value in self.by[field]:
+                bucket = self._writable(self.by[field], field, value)
+                bucket.pop(pk, None)
+                if not bucket:
+                    del self.by[field][value]
+        for field, sort_key in self.sort_keys.items():
+            entries = self.sorted[field]
+            entry = (sort_key(record.get(field, '')), pk)
+            i = bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+        span = self._span(pk, record)
+        if span and span[0] in self.spans:
+            entries = self._writable(self.spans, None, span[0])
+            i = bisect_left(entries, span[1])
+            if i < len(entries) and entries[i] == span[1]:
+                del entries[i]
+
+    def page(self, sort, descending=False, equals=None, between=None, exclude=None, where=None, after=None, limit=50):
+        # One page of records ordered by `sort`, resuming after the
+        # (sort key, pk) cursor `after`. Returns (records, next cursor).
+        equals = equals or {}
+        between = between or {}
+        exclude = exclude or {}
+        sort_key = self.sort_keys[sort]
+
+        # A selective equality filter is cheaper to sort than walking the
+        # whole ordered index
+        buckets = [self.by[f].get(v, {}) for f, v in equals.items() if f in self.fields]
+        bucket = min(buckets, key=len) if buckets else None
+        if bucket is not None and len(bucket) * 4 < len(self.records):
+            entries = sorted((sort_key(r.get(sort, '')), pk) for pk, r in bucket.items())
+        else:
+            entries = self.sorted[sort]
+
+        lo, hi = 0, len(entries)
+        if sort in between:
+            low, high = between[sort]
+            if low is not None:
+                lo = bisect_left(entries, (low,))
+            if high is not None:
+                hi = bisect_right(entries, (high, chr(0x10FFFF)))
+        if after is not None:
+            after = tuple(after)
+            if descending:
+                hi = min(hi, bisect_left(entries, after))
+            else:
+                lo = max(lo, bisect_right(entries, after))
+
+        def matches(record):
+            if any(record.get(f, '') != v for f, v in equals.items()):
+                return False
+            if any(record.get(f, '') == v for f, v in exclude.items()):
+                return False
+            if where is not None and not where(record):
+                return False
+            for f, (low, high) in between.items():
+                value = self.sort_keys.get(f, str)(record.get(f, ''))
+                if (low is not None and value < low) or (high is not None and value > high):
+                    return False
+            return True
+
+        found = []
+        positions = range(hi - 1, lo - 1, -1) if descending else range(lo, hi)
+        for i in positions:
+            record = self.get(entries[i][1])
+            if record is not None and matches(record):
+                found.append((entries[i], record))
+                if len(found) > limit:
+                    break
+
+        next_cursor = found[limit - 1][0] if len(found) > limit else None
+        return [record for _, record in found[:limit]], next_cursor
+
+
+# ---------- XML files (default) ----------
+
+class XmlEngine(StorageEngine):
+    name = 'xml'
+
+    def __init__(self, files, journals=None):
+        self.files = files
+        # Tables listed here are append-only: writes go to a JSON-lines
+        # journal and the XML file is only a periodically compacted snapshot.
+        self.journals = journals or {}
+        # Parsed tables are cached per worker and only re-read from disk when
+        # the file's stamp changes (another gunicorn worker may have written it).
+        self._cache = {}
+        # Materialised snapshot + journal for journaled tables
+        self._views = {}
+        self._view_locks = defaultdict(threading.Lock)
+        self._local = threading.local()
+        self._thread_locks = defaultdict(threading.Lock)
+
+    # ---- locking / transactions ----
+
+    def _acquire(self, key):
+        # The thread lock serialises threads in this worker, flock on the
+        # side-car .lock file serialises workers.
+        lock = self._thread_locks[key]
+        lock.acquire()
+        handle = None
+        try:
+            handle = open(self.files[key] + '.lock', 'a')
+            if fcntl:
+                fcntl.flock(handle, fcntl.LOCK_EX)
+        except BaseException:
+            # Otherwise the table stays locked for this worker for good
+            if handle is not None:
+                handle.close()
+            lock.release()
+            raise
+        return lock, handle
+
+    def _tx(self):
+        return getattr(self._local, 'tx', None)
+
+    @contextmanager
+    def transaction(self, *keys):
+        tx = self._tx()
+        if tx is not None:
+            missing = set(keys) - tx['keys']
+            if missing:
+                raise RuntimeError(f"{sorted(missing)} not locked by the current transaction")
+            yield
+            return
+
+        held = []
+        try:
+            # Always lock in the same order so two transactions can't deadlock
+            for key in sorted(set(keys)):
+                held.append(self._acquire(key))
+            tx = {
+                'keys': set(keys),
+                'tables': {},                   # full working copies
+                'dirty': set(),
+                'overlay': defaultdict(dict),   # journaled: pk -> record / None
+                'events': defaultdict(list),    # journaled: lines to append
+                'compacted': {}                 # journaled: key -> view folded into the snapshot
+            }
+            self._local.tx = tx
+            yield
+            self._commit(tx)
+        finally:
+            self._local.tx = None
+            for lock, handle in reversed(held):
+                handle.close()
+                lock.release()
+
+    def _commit(self, tx):
+        with METRICS.timer('drivehub_storage_seconds', engine=self.name, table=','.join(sorted(tx['keys'])), step='commit'):
+            self._commit_tables(tx)
+
+    def _commit_tables(self, tx):
+        # Stage every table first, so a failure while writing leaves the old
+        # files untouched, then swap them in. The swaps are not atomic as a
+        # group: a crash between two renames, or before the journal appends
+        # below, can leave some of the transaction's tables committed and
+        # others not.
+        staged = []
+        try:
+            for key in sorted(tx['dirty']):
+                staged.append((key, self._stage(key, tx['tables'][key])))
+        except BaseException:
+            for _, tmp in staged:
+                os.remove(tmp)
+            raise
+        for key, tmp in staged:
+            os.replace(tmp, self.files[key])
+            if key in self.journals:
+                self._fold(key, tx['tables'][key], tx['compacted'].get(key))
+            else:
+                self._cache[key] = (self._stamp(key), Table(key, tx['tables'][key]))
+        if staged:
+            _fsync_dir(self.files[staged[0][0]])
+
+        for key, events in tx['events'].items():
+            if events and key not in tx['dirty']:
+                self._append(key, events)
+
+    def _indexed(self, key):
+        # The committed table, unless this transaction has changed `key`
+        tx = self._tx()
+        if tx is not None and (key in tx['tables'] or tx['overlay'].get(key)):
+            return None
+        return self._table(key)
+
+    def _working(self, key):
+        tx = self._tx()
+        if tx is None or key not in tx['keys']:
+            raise RuntimeError(f"{key} is not locked by the current transaction")
+        if key not in tx['tables']:
+            records = [r.copy() for r in self._table(key).records]
+            for pk, record in tx['overlay'].pop(key, {}).items():
+                records = [r for r in records if _pk(key, r) != pk]
+                if record is not None:
+                    records.append(record)
+            tx['events'].pop(key, None)
+            tx['tables'][key] = records
+        return tx['tables'][key]
+
+    def _changed(self, key, records=None):
+        tx = self._tx()
+        if records is not None:
+            tx['tables'][key] = records
+        tx['dirty'].add(key)
+
+    def _journaling(self, key):
+        # Single-record writes to a journaled table become events, unless the
+        # transaction already holds a full working copy of it.
+        tx = self._tx()
+        return key in self.journals and key not in tx['tables']
+
+    # ---- file format ----
+
+    def _stamp(self, key):
+        try:
+            st = os.stat(self.files[key])
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+    def _parse(self, key):
+        # Stream the file: each <record> is converted as soon as it closes
+        # and then dropped from the tree, so a long rentals history never
+        # sits in memory as elements and records at the same time
+        events = ET.iterparse(self.files[key], events=('start', 'end'))
+        _, root = next(events)
+        for event, elem in events:
+            if event == 'end' and elem.tag == 'record':
+                entry = {}
+                for child in elem:
+                    value = child.text.strip() if child.text else ""
+                    entry[child.tag] = value
+                root.clear()
+                yield _normalise(key, entry)
+
+    def _stage(self, key, data):
+        # Write next to the real file and fsync, the caller os.replace()s it
+        # in. Records are written one at a time rather than built into a tree.
+        tmp = f"{self.files[key]}.{os.getpid()}.{threading.get_ident()}.tmp"
+        try:
+            with open(tmp, 'wb') as f:
+                with METRICS.timer('drivehub_storage_seconds', engine=self.name, table=key, step='serialize'):
+                    f.write(f"<?xml version='1.0' encoding='utf-8'?>\n<{key}>".encode('utf-8'))
+                    for item in data:
+                        fields = ''.join(f"<{k}>{escape(str(v))}</{k}>" for k, v in _encode(item).items())
+                        f.write(f"<record>{fields}</record>".encode('utf-8'))
+                    f.write(f"</{key}>".encode('utf-8'))
+                    f.flush()
+                METRICS.inc('drivehub_storage_bytes_total', f.tell(), table=key, direction='written')
+                with METRICS.timer('drivehub_storage_seconds', engine=self.name, table=key, step='fsync'):
+                    os.fsync(f.fileno())
+        except BaseException:
+            os.remove(tmp)
+            raise
+        return tmp
+
+    def _table(self, key):
+        if key in self.journals:
+            return self._view(key)['table']
+
+        stamp = self._stamp(key)
+        if stamp is None:
+            return Table(key)
+
+        cached = self._cache.get(key)
+        if cached is None or cached[0] != stamp:
+            cached = (stamp, self._load(key, stamp))
+            self._cache[key] = cached
+        return cached[1]
+
+    def _load(self, key, stamp):
+        with METRICS.timer('drivehub_storage_seconds', engine=self.name, table=key, step='parse'):
+            table = Table(key, self._parse(key))
+        METRICS.inc('drivehub_storage_bytes_total', stamp[1], table=key, direction='read')
+        return table
+
+    # ---- journal ----
+
+    def _append(self, key, events):
+        path = self.journals[key]
+        lines = b''.join(json.dumps(e).encode('utf-8') + b'\n' for e in events)
+        with open(path, 'a+b') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size:
+                # A crash mid-append leaves a torn last line; fence it off
+                f.seek(size - 1)
+                if f.read(1) != b'\n':
+                    lines = b'\n' + lines
+            f.write(lines)
+            f.flush()
+            with METRICS.timer('drivehub_storage_seconds', engine=self.name, table=key, step='fsync'):
+                os.fsync(f.fileno())
+        METRICS.inc('drivehub_storage_bytes_total', len(lines), table=key, direction='written')
+        if not size:
+            _fsync_dir(path)
+
+    def _reset_journal(self, key, header=None):
+        # Returns the new journal's (inode, size)
+        path = self.journals[key]
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            if header is not None:
+                f.write(json.dumps(header).encode('utf-8') + b'\n')
+            offset = f.tell()
+            ino = os.fstat(f.fileno()).st_ino
+        os.replace(tmp, path)
+        return ino, offset
+
+    def _fold(self, key, records, base):
+        # The snapshot was just rewritten with everything in it: start an
+        # empty journal and keep what we wrote as the view, rather than have
+        # the next read parse the snapshot straight back
+        with self._view_locks[key]:
+            stamp = self._stamp(key)
+            header = None
+            if base is None:
+                table = Table(key, records)
+            else:
+                # A compaction: the snapshot holds exactly the `base` view, so
+                # keep its table. The header lets other workers whose view is
+                # at the same point do the same (see _adopt).
+                table = base['table']
+                header = {'op': 'compacted', 'snapshot': stamp, 'base': self._position(base)}
+            ino, offset = self._reset_journal(key, header)
+            self._views[key] = {'snapshot': stamp, 'ino': ino, 'offset': offset, 'table': table}
+
+    def _position(self, view):
+        # How far into the files a view has read, in JSON terms
+        return [list(view['snapshot']) if view['snapshot'] else None, view['ino'], view['offset']]
+
+    def _view(self, key):
+        # Views are replaced, never updated: other threads may be reading
+        # the table of the one they got last time
+        with self._view_locks[key]:
+            view = self._views.get(key)
+            stamp = self._stamp(key)
+            if view is not None and view['snapshot'] != stamp:
+                view = self._adopt(key, view, stamp)
+            if view is not None:
+                view = self._catch_up(key, view)
+            if view is None:
+                view = self._rebuild(key)
+            self._views[key] = view
+            return view
+
+    def _adopt(self, key, view, stamp):
+        # Another worker compacted the journal. If our view had replayed all
+        # of it, the new snapshot holds exactly our table: move the view onto
+        # the new files instead of parsing them.
+        try:
+            with open(self.journals[key], 'rb') as f:
+                ino = os.fstat(f.fileno()).st_ino
+                line = f.readline()
+        except FileNotFoundError:
+            return None
+        try:
+            header = json.loads(line)
+        except ValueError:
+            return None
+        if (not isinstance(header, dict) or header.get('op') != 'compacted'
+                or header.get('snapshot') != list(stamp or ()) or header.get('base') != self._position(view)):
+            return None
+        return dict(view, snapshot=stamp, ino=ino, offset=len(line))
+
+    def _catch_up(self, key, view):
+        # Same journal as last time: only read what was appended. None if
+        # the view has to be rebuilt.
+        try:
+            with open(self.journals[key], 'rb') as f:
+                st = os.fstat(f.fileno())
+                if view['ino'] is None:
+                    # First append since the view was built
+                    view = dict(view, ino=st.st_ino)
+                if st.st_ino != view['ino'] or st.st_size < view['offset']:
+                    return None
+                if st.st_size == view['offset']:
+                    return view
+                f.seek(view['offset'])
+                read, changes = self._replay(key, f.read(st.st_size - view['offset']))
+        except FileNotFoundError:
+            return view if view['ino'] is None else None
+        return dict(view, offset=view['offset'] + read, table=view['table'].patched(changes))
+
+    def _rebuild(self, key):
+        # Open the journal before reading the snapshot: if a compaction runs in
+        # between we replay already-compacted events, which is harmless since
+        # every event carries the full record.
+        try:
+            journal = open(self.journals[key], 'rb')
+        except FileNotFoundError:
+            journal = None
+        try:
+            stamp = self._stamp(key)
+            view = {
+                'snapshot': stamp,
+                'ino': None,
+                'offset': 0,
+                'table': self._load(key, stamp) if stamp else Table(key)
+            }
+            if journal:
+                view['ino'] = os.fstat(journal.fileno()).st_ino
+                view['offset'], changes = self._replay(key, journal.read())
+                # Not handed out yet, so it can be patched in place
+                view['table'].apply(changes)
+        finally:
+            if journal:
+                journal.close()
+        return view
+
+    def _replay(self, key, data):
+        # (bytes consumed, table changes). Only whole lines are consumed, a
+        # concurrent append may still be in flight.
+        end = data.rfind(b'\n') + 1
+        METRICS.inc('drivehub_storage_bytes_total', end, table=key, direction='read')
+        changes = []
+        for line in data[:end].splitlines():
+            if not line.strip():
+                continue
+            try:
+                event = json.loads(line)
+            except ValueError:
+                app.logger.warning("Skipping torn %s journal line", key)
+                continue
+            if event['op'] == 'compacted':
+                continue
+            if event['op'] == 'delete':
+                changes.append(('delete', event['pk']))
+            else:
+                changes.append(('put', _normalise(key, event['record'])))
+        return end, changes
+
+    def _event(self, key, pk, record):
+        if record is None:
+            op = 'delete'
+        else:
+            before = self.get(key, pk)
+            if before is None:
+                op = 'create'
+            elif record.get('status') == 'Closed' and before.get('status') != 'Closed':
+                op = 'close'
+            else:
+                op = 'update'
+        event = {'op': op, 'pk': pk, 'at': datetime.now().strftime("%Y-%m-%d %H:%M:%S")}
+        if record is not None:
+            event['record'] = _encode(record)
+        return event
+
+    def compact(self):
+        compacted = []
+        for key in self.journals:
+            try:
+                if not os.path.getsize(self.journals[key]):
+                    continue
+            except FileNotFoundError:
+                continue
+            with self.transaction(key):
+                view = self._view(key)
+                self._working(key)
+                self._changed(key)
+                self._tx()['compacted'][key] = view
+            compacted.append(key)
+        return compacted
+
+    # ---- engine API ----
+
+    def exists(self, key):
+        return os.path.exists(self.files[key])
+
+    def load(self, key):
+        tx = self._tx()
+        if tx is not None and key in tx['tables']:
+            records = tx['tables'][key]
+        elif tx is not None and tx['overlay'].get(key):
+            records = self._table(key).records
+            overlay = tx['overlay'][key]
+            records = [overlay.get(_pk(key, r), r) for r in records]
+            seen = {_pk(key, r) for r in records}
+            records += [r for pk, r in overlay.items() if pk not in seen]
+            records = [r for r in records if r is not None]
+        else:
+            records = self._table(key).records
+        # Callers mutate what they get back before saving, so hand out copies
+        return [r.copy() for r in records]
+
+    def save(self, key, data):
+        with self.transaction(key):
+            self._working(key)
+            self._changed(key, [_normalise(key, item) for item in data])
+
+    def get(self, key, pk):
+        pk = str(pk).strip()
+        tx = self._tx()
+        if tx is not None and key in tx['tables']:
+            records = tx['tables'][key]
+        elif tx is not None and pk in tx['overlay'].get(key, {}):
+            record = tx['overlay'][key][pk]
+            return record.copy() if record is not None else None
+        else:
+            record = self._table(key).get(pk)
+            return record.copy() if record is not None else None
+
+        for r in records:
+            if _pk(key, r) == pk:
+                return r.copy()
+        return None
+
+    def scan(self, key):
+        tx = self._tx()
+        if tx is not None and (key in tx['tables'] or tx['overlay'].get(key)):
+            yield from self.load(key)
+            return
+        for record in self._table(key).records:
+            yield record.copy()
+
+    def select(self, key, field, value):
+        tx = self._tx()
+        if tx is not None and (key in tx['tables'] or tx['overlay'].get(key)):
+            # Uncommitted changes aren't indexed yet
+            return [r for r in self.load(key) if r.get(field, '') == value]
+        return [r.copy() for r in self._table(key).select(field, value)]
+
+    def count(self, key):
+        tx = self._tx()
+        if tx is not None and (key in tx['tables'] or tx['overlay'].get(key)):
+            return len(self.load(key))
+        return len(self._table(key))
+
+    # last/after only see committed records, which is all the append-only
+    # change log needs
+
+    def last(self, key):
+        record = self._table(key).last()
+        return record.copy() if record is not None else None
+
+    def after(self, key, pk):
+        records = self._table(key).after(str(pk).strip())
+        return [r.copy() for r in records] if records is not None else None
+
+    def put(self, key, record):
+        with self.transaction(key):
+            pk = _pk(key, record)
+            record = _normalise(key, record)
+
+            if self._journaling(key):
+                tx = self._tx()
+                tx['events'][key].append(self._event(key, pk, record))
+                tx['overlay'][key][pk] = record
+                return
+
+            records = self._working(key)
+            for i, r in enumerate(records):
+                if _pk(key, r) == pk:
+                    records[i] = record
+                    break
+            else:
+                records.append(record)
+            self._changed(key)
+
+    def put_many(self, key, records):
+        # One pass over the working copy rather than a scan per record
+        with self.transaction(key):
+            if self._journaling(key):
+                super().put_many(key, records)
+                return
+
+            incoming = {}
+            for record in records:
+                incoming[_pk(key, record)] = _normalise(key, record)
+            working = self._working(key)
+            for i, r in enumerate(working):
+                pk = _pk(key, r)
+                if pk in incoming:
+                    working[i] = incoming.pop(pk)
+            working.extend(incoming.values())
+            self._changed(key)
+
+    def delete(self, key, pk):
+        pk = str(pk).strip()
+        with self.transaction(key):
+            if self._journaling(key):
+                if self.get(key, pk) is None:
+                    return False
+                tx = self._tx()
+                tx['events'][key].append(self._event(key, pk, None))
+                tx['overlay'][key][pk] = None
+                return True
+
+            records = self._working(key)
+            kept = [r for r in records if _pk(key, r) != pk]
+            if len(kept) == len(records):
+                return False
+            self._changed(key, kept)
+            return True
+
+
+def _fsync_dir(path):
+    # Make the rename itself durable; not every platform can open a directory
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+# ---------- SQLite (WAL) ----------
+
+# Every row carries the table version (meta.version) that last wrote it, and
+# deleted keys leave a tombstone, so a worker can bring its cached copy up to
+# date with just the rows written since. Replacing a whole table moves
+# meta.horizon up: copies older than that are re-read in full.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (tbl TEXT PRIMARY KEY, version INTEGER NOT NULL, horizon INTEGER NOT NULL DEFAULT 0);
+CREATE TABLE IF NOT EXISTS users (pos INTEGER PRIMARY KEY AUTOINCREMENT, email TEXT NOT NULL, ver INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS vehicles (pos INTEGER PRIMARY KEY AUTOINCREMENT, id TEXT NOT NULL, ver INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS rentals (pos INTEGER PRIMARY KEY AUTOINCREMENT, tx_id TEXT NOT NULL, user_email TEXT, ver INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS stats (pos INTEGER PRIMARY KEY AUTOINCREMENT, name TEXT NOT NULL, ver INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS changes (pos INTEGER PRIMARY KEY AUTOINCREMENT, version TEXT NOT NULL, ver INTEGER NOT NULL DEFAULT 0, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS tombstones (tbl TEXT NOT NULL, pk TEXT NOT NULL, ver INTEGER NOT NULL, PRIMARY KEY (tbl, pk));
+CREATE UNIQUE INDEX IF NOT EXISTS idx_users_email ON users (email);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_vehicles_id ON vehicles (id);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_rentals_tx_id ON rentals (tx_id);
+CREATE INDEX IF NOT EXISTS idx_rentals_user_email ON rentals (user_email);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_stats_name ON stats (name);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_changes_version ON changes (version);
+"""
+
+# Added after the first release; _upgrade() brings older files up to date
+# before these indexes are created
+SQLITE_VERSIONED = """
+CREATE INDEX IF NOT EXISTS idx_users_ver ON users (ver);
+CREATE INDEX IF NOT EXISTS idx_vehicles_ver ON vehicles (ver);
+CREATE INDEX IF NOT EXISTS idx_rentals_ver ON rentals (ver);
+CREATE INDEX IF NOT EXISTS idx_stats_ver ON stats (ver);
+CREATE INDEX IF NOT EXISTS idx_changes_ver ON changes (ver);
+CREATE INDEX IF NOT EXISTS idx_tombstones_ver ON tombstones (tbl, ver);
+"""
+
+# Columns pulled out of the JSON blob so they can be indexed
+SQLITE_COLUMNS = {
+    'users': ('email',),
+    'vehicles': ('id',),
+    'rentals': ('tx_id', 'user_email'),
+    'stats': ('name',),
+    'changes': ('version',)
+}
+
+
+class SqliteEngine(StorageEngine):
+    name = 'sqlite'
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+        # Indexed copies of each table, cached against the version in meta
+        # and replaced by a patched copy on every commit, ours or another
+        # worker's
+        self._cache = {}
+        conn = self._conn()
+        conn.executescript(SQLITE_SCHEMA)
+        self._upgrade(conn)
+        conn.executescript(SQLITE_VERSIONED)
+
+    def _upgrade(self, conn):
+        # Files from before row versions: existing rows count as version 0
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for key in ('meta',) + tuple(SQLITE_COLUMNS):
+                columns = {row[1] for row in conn.execute(f"PRAGMA table_info({key})")}
+                if key == 'meta' and 'horizon' not in columns:
+                    conn.execute("ALTER TABLE meta ADD COLUMN horizon INTEGER NOT NULL DEFAULT 0")
+                elif key != 'meta' and 'ver' not in columns:
+                    conn.execute(f"ALTER TABLE {key} ADD COLUMN ver INTEGER NOT NULL DEFAULT 0")
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _version(self, key):
+        row = self._conn().execute("SELECT version FROM meta WHERE tbl = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _tx(self):
+        return getattr(self._local, 'tx', None)
+
+    @contextmanager
+    def transaction(self, *keys):
+        # BEGIN IMMEDIATE takes SQLite's write lock up front, which already
+        # covers every table, so the keys only matter to the XML engine.
+        if self._tx() is not None:
+            yield
+            return
+
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        tx = self._local.tx = {}       # key -> (new version, [changes])
+        try:
+            yield
+            with METRICS.timer('drivehub_storage_seconds', engine=self.name, table=','.join(sorted(tx)), step='commit'):
+                conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            for key in tx:
+                self._cache.pop(key, None)
+            raise
+        finally:
+            self._local.tx = None
+
+        for key, (version, changes) in tx.items():
+            self._patch(key, version, changes)
+
+    def _bump(self, key):
+        self._conn().execute(
+            "INSERT INTO meta (tbl, version) VALUES (?, 1) "
+            "ON CONFLICT (tbl) DO UPDATE SET version = version + 1",
+            (key,)
+        )
+        return self._version(key)
+
+    def _patch(self, key, version, changes):
+        # We held the write lock, so if the cache was one version behind it
+        # is missing exactly our changes
+        cached = self._cache.get(key)
+        replaced = next((c[1] for c in reversed(changes) if c[0] == 'replace'), None)
+        if replaced is not None:
+            table = Table(key, replaced)
+            table.apply(changes[max(i for i, c in enumerate(changes) if c[0] == 'replace') + 1:])
+        elif cached is not None and cached[0] == version - 1:
+            table = cached[1].patched(changes)
+        else:
+            # Also behind on other workers' commits: the next read catches up
+            return
+        self._cache[key] = (version, table)
+
+    def _indexed(self, key):
+        # We hold the write lock inside a transaction, so the committed table
+        # is current for any key this transaction hasn't written yet
+        tx = self._tx()
+        if tx is not None and key in tx:
+            return None
+        return self._table(key)
+
+    def _write(self, key, fn, change):
+        # fn(conn, version) does the SQL; rows it writes carry `version`
+        with self.transaction(key):
+            tx = self._tx()
+            if key not in tx:
+                tx[key] = (self._bump(key), [])
+            version, changes = tx[key]
+            result = fn(self._conn(), version)
+            changes.append(change)
+        return result
+
+    def _table(self, key):
+        version = self._version(key)
+        if version is None:
+            return Table(key)
+
+        cached = self._cache.get(key)
+        if cached is not None and cached[0] == version:
+            return cached[1]
+        if self._tx() is not None:
+            # We hold the write lock, nothing can change while we read
+            cached = self._refresh(key, cached)
+        else:
+            # Read the version and the rows from one snapshot
+            conn = self._conn()
+            conn.execute("BEGIN")
+            try:
+                cached = self._refresh(key, cached)
+            finally:
+                conn.execute("COMMIT")
+        self._cache[key] = cached
+        return cached[1]
+
+    def _refresh(self, key, cached):
+        # (version, table) for the current version: the cached table patched
+        # with the rows written since, unless it predates the horizon
+        conn = self._conn()
+        version, horizon = conn.execute("SELECT version, horizon FROM meta WHERE tbl = ?", (key,)).fetchone()
+        if cached is None or not horizon <= cached[0] <= version:
+            return version, Table(key, self._read(key))
+
+        with METRICS.timer('drivehub_storage_seconds', engine=self.name, table=key, step='parse'):
+            # Deletes first: a key deleted and then written again was
+            # re-inserted at the end, which is where put() appends it
+            changes = [('delete', pk) for (pk,) in conn.execute(
+                "SELECT pk FROM tombstones WHERE tbl = ? AND ver > ?", (key, cached[0]))]
+            rows = conn.execute(f"SELECT data FROM {key} WHERE ver > ? ORDER BY pos", (cached[0],)).fetchall()
+            changes += [('put', _normalise(key, json.loads(row[0]))) for row in rows]
+        METRICS.inc('drivehub_storage_bytes_total', sum(len(row[0]) for row in rows), table=key, direction='read')
+        return version, cached[1].patched(changes)
+
+    def _row(self, key, record, version):
+        cols = [record.get(c, '') for c in SQLITE_COLUMNS[key]]
+        data = json.dumps(_encode(record))
+        METRICS.inc('drivehub_storage_bytes_total', len(data), table=key, direction='written')
+        return cols + [version, data]
+
+    def exists(self, key):
+        return self._version(key) is not None
+
+    def load(self, key):
+        # Inside a transaction we may be looking at our own uncommitted rows,
+        # which must never end up in the shared cache
+        if self._tx() is not None:
+            return self._read(key)
+        return [r.copy() for r in self._table(key).records]
+
+    def _read(self, key):
+        with METRICS.timer('drivehub_storage_seconds', engine=self.name, table=key, step='parse'):
+            rows = self._conn().execute(f"SELECT data FROM {key} ORDER BY pos").fetchall()
+            records = [_normalise(key, json.loads(row[0])) for row in rows]
+        METRICS.inc('drivehub_storage_bytes_total', sum(len(row[0]) for row in rows), table=key, direction='read')
+        return records
+
+    def save(self, key, data):
+        cols = SQLITE_COLUMNS[key]
+        sql = f"INSERT INTO {key} ({', '.join(cols)}, ver, data) VALUES ({', '.join('?' * (len(cols) + 2))})"
+        records = [_normalise(key, item) for item in data]
+
+        def replace_all(conn, version):
+            conn.execute(f"DELETE FROM {key}")
+            conn.executemany(sql, [self._row(key, r, version) for r in records])
+            conn.execute("DELETE FROM tombstones WHERE tbl = ?", (key,))
+            conn.execute("UPDATE meta SET horizon = ? WHERE tbl = ?", (version, key))
+
+        self._write(key, replace_all, ('replace', records))
+
+    def scan(self, key):
+        if self._tx() is None:
+            for record in self._table(key).records:
+                yield record.copy()
+            return
+        for (data,) in self._conn().execute(f"SELECT data FROM {key} ORDER BY pos"):
+            yield _normalise(key, json.loads(data))
+
+    def get(self, key, pk):
+        pk = str(pk).strip()
+        if self._tx() is None:
+            record = self._table(key).get(pk)
+            return record.copy() if record is not None else None
+
+        row = self._conn().execute(
+            f"SELECT data FROM {key} WHERE {PRIMARY_KEYS[key]} = ?", (pk,)
+        ).fetchone()
+        return _normalise(key, json.loads(row[0])) if row else None
+
+    def select(self, key, field, value):
+        if self._tx() is None:
+            return [r.copy() for r in self._table(key).select(field, value)]
+        if field not in SQLITE_COLUMNS[key]:
+            return [r for r in self._read(key) if r.get(field, '') == value]
+
+        rows = self._conn().execute(
+            f"SELECT data FROM {key} WHERE {field} = ? ORDER BY pos", (value,)
+        ).fetchall()
+        return [_normalise(key, json.loads(row[0])) for row in rows]
+
+    def count(self, key):
+        if self._tx() is None:
+            return len(self._table(key))
+        return self._conn().execute(f"SELECT COUNT(*) FROM {key}").fetchone()[0]
+
+    def last(self, key):
+        if self._tx() is None:
+            record = self._table(key).last()
+            return record.copy() if record is not None else None
+
+        row = self._conn().execute(f"SELECT data FROM {key} ORDER BY pos DESC LIMIT 1").fetchone()
+        return _normalise(key, json.loads(row[0])) if row else None
+
+    def after(self, key, pk):
+        pk = str(pk).strip()
+        if self._tx() is None:
+            records = self._table(key).after(pk)
+            return [r.copy() for r in records] if records is not None else None
+
+        conn = self._conn()
+        row = conn.execute(f"SELECT pos FROM {key} WHERE {PRIMARY_KEYS[key]} = ?", (pk,)).fetchone()
+        if row is None:
+            return None
+        rows = conn.execute(f"SELECT data FROM {key} WHERE pos > ? ORDER BY pos", (row[0],)).fetchall()
+        return [_normalise(key, json.loads(r[0])) for r in rows]
+
+    def put(self, key, record):
+        record = _normalise(key, record)
+        cols = SQLITE_COLUMNS[key]
+        updates = ', '.join(f"{c} = excluded.{c}" for c in cols[1:] + ('ver', 'data'))
+        sql = (
+            f"INSERT INTO {key} ({', '.join(cols)}, ver, data) VALUES ({', '.join('?' * (len(cols) + 2))}) "
+            f"ON CONFLICT ({PRIMARY_KEYS[key]}) DO UPDATE SET {updates}"
+        )
+        self._write(key, lambda conn, version: conn.execute(sql, self._row(key, record, version)), ('put', record))
+
+    def delete(self, key, pk):
+        pk = str(pk).strip()
+
+        def delete_row(conn, version):
+            if not conn.execute(f"DELETE FROM {key} WHERE {PRIMARY_KEYS[key]} = ?", (pk,)).rowcount:
+                return False
+            conn.execute(
+                "INSERT INTO tombstones (tbl, pk, ver) VALUES (?, ?, ?) "
+                "ON CONFLICT (tbl, pk) DO UPDATE SET ver = excluded.ver",
+                (key, pk, version)
+            )
+            return True
+
+        return self._write(key, delete_row, ('delete', pk))
+
+
+def create_engine(name):
+    if name == 'sqlite':
+        return SqliteEngine(app.config['SQLITE_PATH'])
+    if name == 'xml':
+        return XmlEngine(DB_FILES, DB_JOURNALS)
+    raise ValueError(f"Unknown storage engine: {name}")
+
+
+STORAGE = create_engine(app.config['STORAGE_ENGINE'])
+
+
+# ---------- Change log ----------
+# Every transaction that writes a TRACKED_TABLES table also appends one
+# record to 'changes' listing the keys it touched ("*" when a whole table
+# was replaced). The version of the newest record is the store's version,
+# which clients use to ask for just what changed since they last synced.
+
+TRACKED_TABLES = ('vehicles', 'rentals', 'stats')
+
+_changes = threading.local()
+
+
+@contextmanager
+def db_transaction(*keys):
+    if getattr(_changes, 'touched', None) is not None:
+        with STORAGE.transaction(*keys):
+            yield
+        return
+
+    if any(key in TRACKED_TABLES for key in keys):
+        keys += ('changes',)
+
+    changed = False
+    _changes.touched = defaultdict(set)
+    try:
+        with STORAGE.transaction(*keys):
+            yield
+            if _changes.touched:
+                _log_change(_changes.touched)
+                changed = True
+    finally:
+        _changes.touched = None
+
+    if changed:
+        _notify_change()
+
+
+def _touch(key, pk):
+    if key in TRACKED_TABLES:
+        _changes.touched[key].add(pk)
+
+
+def _log_change(touched):
+    last = STORAGE.last('changes')
+    record = {
+        "version": str(int(last['version']) + 1 if last else 1),
+        "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    }
+    for key, pks in touched.items():
+        record[key] = json.dumps(sorted(pks))
+    STORAGE.put('changes', record)
+
+
+# Wakes event streams in this worker right after a commit. Other workers'
+# commits are picked up by polling current_version(), which only stats the
+# change log.
+_change_signal = threading.Condition()
+
+
+def _notify_change():
+    with _change_signal:
+        _change_signal.notify_all()
+
+
+def wait_for_change(version, timeout):
+    deadline = time.monotonic() + timeout
+    while True:
+        latest = current_version()
+        remaining = deadline - time.monotonic()
+        if latest != version or remaining <= 0:
+            return latest
+        with _change_signal:
+            _change_signal.wait(min(remaining, app.config['SSE_POLL_INTERVAL']))
+
+
+def current_version():
+    last = STORAGE.last('changes')
+    return int(last['version']) if last else 0
+
+
+def changes_since(version):
+    # None means the caller has to start over: unknown or trimmed version,
+    # or a whole table was replaced in the meantime
+    records = STORAGE.after('changes', version)
+    if records is None:
+        return None
+
+    touched = defaultdict(set)
+    for record in records:
+        for key in TRACKED_TABLES:
+            touched[key].update(json.loads(record.get(key) or '[]'))
+    if any('*' in pks for pks in touched.values()):
+        return None
+    return touched
+
+
+def load_db(key):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='load')
+    return STORAGE.load(key)
+
+
+def iter_db(key):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='scan')
+    return STORAGE.scan(key)
+
+
+def save_db(key, data):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='save')
+    with db_transaction(key):
+        STORAGE.save(key, data)
+        _touch(key, '*')
+
+
+def get_db(key, pk):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='get')
+    return STORAGE.get(key, pk)
+
+
+def select_db(key, field, value):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='select')
+    return STORAGE.select(key, field, value)
+
+
+def count_db(key):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='count')
+    return STORAGE.count(key)
+
+
+def page_db(key, sort, **options):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='page')
+    return STORAGE.page(key, sort, **options)
+
+
+def overlapping_db(key, value, start, end):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='overlapping')
+    return STORAGE.overlapping(key, value, start, end)
+
+
+def put_db(key, record):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='put')
+    with db_transaction(key):
+        STORAGE.put(key, record)
+        _touch(key, _pk(key, record))
+
+
+def put_many_db(key, records):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='put_many')
+    records = list(records)
+    if not records:
+        return
+    with db_transaction(key):
+        STORAGE.put_many(key, records)
+        for record in records:
+            _touch(key, _pk(key, record))
+
+
+def delete_db(key, pk):
+    METRICS.inc('drivehub_table_ops_total', table=key, op='delete')
+    with db_transaction(key):
+        deleted = STORAGE.delete(key, pk)
+        if deleted:
+            _touch(key, str(pk).strip())
+    return deleted
+
+
+def migrate_xml_to_sqlite(sqlite_path=None):
+    source = XmlEngine(DB_FILES, DB_JOURNALS)
+    target = SqliteEngine(sqlite_path or app.config['SQLITE_PATH'])
+    counts = {}
+    for key in DB_FILES:
+        if not source.exists(key):
+            continue
+        target.save(key, source.scan(key))
+        counts[key] = target.count(key)
+
+    # Rebuilt from what was imported rather than trusting stats.xml, which
+    # may be missing or stale
+    rentals = target.scan('rentals') if target.exists('rentals') else []
+    vehicles = target.scan('vehicles') if target.exists('vehicles') else []
+    target.save('stats', [{"name": STATS_KEY, **_compute_stats(rentals, vehicles)}])
+    counts['stats'] = target.count('stats')
+    return counts
+
+
+@app.cli.command('migrate-sqlite')
+def migrate_sqlite_command():
+    """Import the XML tables into SQLITE_PATH."""
+    for key, count in migrate_xml_to_sqlite().items():
+        print(f"{key}: {count} records")
+
+
+# ---------- Running aggregates ----------
+# The admin dashboard numbers live in the 'stats' table and are adjusted by
+# every route that changes them, inside that route's transaction (which
+# must include 'stats'). recompute_stats() rebuilds them from scratch.
+
+STATS_KEY = 'admin'
+
+
+def _stats_from(record):
+    return {
+        "revenue": float(record.get('revenue') or 0),
+        "active": int(record.get('active') or 0),
+        "fleet": int(record.get('fleet') or 0),
+        "kms": int(record.get('kms') or 0)
+    }
+
+
+def read_stats():
+    return _stats_from(get_db('stats', STATS_KEY) or {})
+
+
+def adjust_stats(revenue=0, active=0, fleet=0, kms=0):
+    stats = read_stats()
+    stats['revenue'] = round(stats['revenue'] + revenue, 2)
+    stats['active'] += active
+    stats['fleet'] += fleet
+    stats['kms'] += kms
+    put_db('stats', {"name": STATS_KEY, **stats})
+
+
+def _compute_stats(rentals, vehicles):
+    stats = {"revenue": 0.0, "active": 0, "fleet": 0, "kms": 0}
+    for r in rentals:
+        stats['revenue'] += r.total or 0
+        stats['active'] += r.status == 'Active'
+    for v in vehicles:
+        stats['fleet'] += 1
+        stats['kms'] += v.kms or 0
+    stats['revenue'] = round(stats['revenue'], 2)
+    return stats
+
+
+def recompute_stats():
+    with db_transaction('vehicles', 'rentals', 'stats'):
+        stats = _compute_stats(iter_db('rentals'), iter_db('vehicles'))
+        put_db('stats', {"name": STATS_KEY, **stats})
+    return stats
+
+
+def repair_db():
+    # USERS
+    if not STORAGE.exists('users'):
+        users = [
+            {"id": "1", "name": "Drive Hub", "email": "admin@rental.com", "password_hash": generate_password_hash("admin"), "role": "admin"},
+            {"id": "2", "name": "Client One", "email": "user@gmail.com", "password_hash": generate_password_hash("user"), "role": "user"}
+        ]
+        save_db('users', users)
+
+    # VEHICLES
+    if not STORAGE.exists('vehicles'):
+        vehicles = [{
+            "id": "101",
+            "model": "Tesla Model S",
+            "price": "1200",
+            "status": "Available",
+            "health": "100",
+            "kms": "5000",
+            "fuel": "Electric",
+            "year": "2024",
+            "transmission": "Auto",
+            "seats": "5",
+            "image": ""
+        }]
+        save_db('vehicles', vehicles)
+
+    # RENTALS
+    if not STORAGE.exists('rentals'):
+        save_db('rentals', [])
+
+    # STATS
+    if not STORAGE.exists('stats'):
+        recompute_stats()
+
+
+# ---------- Sessions ----------
+# The cookie carries only a random session id; the session itself (just the
+# signed-in email) lives server side. 'memory' suits a single worker,
+# 'sqlite' is shared by every gunicorn worker on the host.
+
+class MemorySessionStore:
+    name = 'memory'
+
+    def __init__(self, ttl, max_entries):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = {}      # sid -> (expires, data), least recently used first
+
+    def get(self, sid):
+        with self._lock:
+            entry = self._entries.pop(sid, None)
+            if entry is None:
+                return None
+            if entry[0] <= time.time():
+                return None
+            self._entries[sid] = entry
+            return entry[1]
+
+    def set(self, sid, data):
+        with self._lock:
+            self._entries.pop(sid, None)
+            self._entries[sid] = (time.time() + self.ttl, data)
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+    def delete(self, sid):
+        with self._lock:
+            self._entries.pop(sid, None)
+
+    def purge(self):
+        now = time.time()
+        with self._lock:
+            expired = [sid for sid, (expires, _) in self._entries.items() if expires <= now]
+            for sid in expired:
+                del self._entries[sid]
+        return len(expired)
+
+    def count(self):
+        return len(self._entries)
+
+
+class SqliteSessionStore:
+    name = 'sqlite'
+
+    def __init__(self, path, ttl):
+        self.path = path
+        self.ttl = ttl
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS sessions (sid TEXT PRIMARY KEY, data TEXT NOT NULL, expires REAL NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def get(self, sid):
+        row = self._conn().execute(
+            "SELECT data FROM sessions WHERE sid = ? AND expires > ?", (sid, time.time())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, sid, data):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO sessions (sid, data, expires) VALUES (?, ?, ?)",
+            (sid, json.dumps(data), time.time() + self.ttl)
+        )
+
+    def delete(self, sid):
+        self._conn().execute("DELETE FROM sessions WHERE sid = ?", (sid,))
+
+    def purge(self):
+        return self._conn().execute("DELETE FROM sessions WHERE expires <= ?", (time.time(),)).rowcount
+
+    def count(self):
+        return self._conn().execute("SELECT COUNT(*) FROM sessions").fetchone()[0]
+
+
+def create_session_store(name):
+    if name == 'memory':
+        return MemorySessionStore(app.config['SESSION_TTL'], app.config['SESSION_MAX_ENTRIES'])
+    if name == 'sqlite':
+        return SqliteSessionStore(app.config['SESSION_PATH'], app.config['SESSION_TTL'])
+    raise ValueError(f"Unknown session store: {name}")
+
+
+class ServerSession(CallbackDict, SessionMixin):
+    def __init__(self, initial=None, sid=None):
+        def on_update(self):
+            self.modified = True
+        super().__init__(initial, on_update)
+        self.sid = sid
+        self.stale_sid = None
+        self.modified = False
+
+    def rotate(self):
+        # New id on login, so an id planted before sign-in is never promoted
+        self.stale_sid = self.sid
+        self.sid = None
+        self.modified = True
+
+
+class StoreSessionInterface(SessionInterface):
+    def __init__(self, store):
+        self.store = store
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        data = self.store.get(sid) if sid else None
+        if data is None:
+            return ServerSession()
+        return ServerSession(data, sid=sid)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.stale_sid:
+            self.store.delete(session.stale_sid)
+        if not session:
+            if session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+        if not session.modified:
+            return
+
+        if session.sid is None:
+            session.sid = secrets.token_urlsafe(32)
+        self.store.set(session.sid, dict(session))
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app),
+            domain=domain,
+            path=path
+        )
+
+
+SESSIONS = create_session_store(app.config['SESSION_STORE'])
+app.session_interface = StoreSessionInterface(SESSIONS)
+
+
+# ==========================================
+# 4. BACKGROUND SCHEDULER
+# ==========================================
+
+MAINTENANCE_WINDOW = timedelta(hours=1)
+
+_JOBS = []
+_scheduler_started = False
+
+
+def background_job(interval_key):
+    def register(fn):
+        _JOBS.append({"fn": fn, "interval_key": interval_key, "next": 0.0})
+        return fn
+    return register
+
+
+def _run_scheduler():
+    while True:
+        now = time.monotonic()
+        for job in _JOBS:
+            if now < job["next"]:
+                continue
+            job["next"] = now + app.config[job["interval_key"]]
+            try:
+                job["fn"]()
+            except Exception:
+                app.logger.exception("Background job %s failed", job["fn"].__name__)
+        time.sleep(1)
+
+
+def start_scheduler():
+    global _scheduler_started
+    if _scheduler_started or not app.config['BACKGROUND_JOBS']:
+        return
+    _scheduler_started = True
+    threading.Thread(target=_run_scheduler, name="drivehub-scheduler", daemon=True).start()
+
+
+def _maintenance_due(v, now):
+    if v.status != 'Maintenance' or v.maintenance_start is None:
+        return False
+    return now - v.maintenance_start >= MAINTENANCE_WINDOW
+
+
+@background_job('MAINTENANCE_INTERVAL')
+def release_maintenance(now=None):
+    now = now or datetime.now()
+
+    # Cheap unlocked check first, most ticks have nothing to release
+    if not any(_maintenance_due(v, now) for v in iter_db('vehicles')):
+        return False
+
+    released = False
+    with db_transaction('vehicles'):
+        for v in load_db('vehicles'):
+            if _maintenance_due(v, now):
+                v.health = 100
+                v.status = "Available"
+                v.maintenance_start = None
+                put_db('vehicles', v)
+                released = True
+    return released
+
+
+@background_job('MAINTENANCE_INTERVAL')
+def start_bookings(now=None):
+    # Advance bookings go live once due, as soon as their car is back;
+    # until then they are simply retried on the next tick
+    now = now or datetime.now()
+    if not any(r.start and r.start <= now for r in select_db('rentals', 'status', 'Booked')):
+        return 0
+
+    started = 0
+    with db_transaction('vehicles', 'rentals', 'stats'):
+        due = [r for r in select_db('rentals', 'status', 'Booked')
+               if r.start and r.start <= now and not (r.end and r.end <= now)]
+        for rental in sorted(due, key=lambda r: r.start):
+            vehicle = get_db('vehicles', rental.vehicle_id)
+            if not vehicle or vehicle.status != 'Available':
+                continue
+            rental.status = 'Active'
+            vehicle.status = 'Rented'
+            put_db('rentals', rental)
+            put_db('vehicles', vehicle)
+            adjust_stats(active=1)
+            started += 1
+    return started
+
+
+@background_job('MAINTENANCE_INTERVAL')
+def cancel_missed_bookings(now=None):
+    # A booking whose window ended before its car came back can never start:
+    # cancel and refund it, which also frees its span on the calendar
+    now = now or datetime.now()
+    if not any(r.end and r.end <= now for r in select_db('rentals', 'status', 'Booked')):
+        return 0
+
+    cancelled = 0
+    with db_transaction('rentals', 'stats'):
+        for rental in select_db('rentals', 'status', 'Booked'):
+            if not (rental.end and rental.end <= now):
+                continue
+            app.logger.warning("Booking %s for vehicle %s ended before the car was back; cancelled, refund %s",
+                               rental.tx_id, rental.vehicle_id, rental.total)
+            adjust_stats(revenue=-(rental.total or 0))
+            rental.status = 'Cancelled'
+            rental.total = 0.0
+            put_db('rentals', rental)
+            cancelled += 1
+    return cancelled
+
+
+@background_job('SESSION_PURGE_INTERVAL')
+def purge_sessions():
+    return SESSIONS.purge()
+
+
+@background_job('PAYMENT_SWEEP_INTERVAL')
+def sweep_payments():
+    pending = select_db('rentals', 'status', 'Pending')
+    for rental in pending:
+        queue_payment(rental.tx_id)
+    return len(pending)
+
+
+@background_job('JOURNAL_COMPACT_INTERVAL')
+def compact_storage():
+    compacted = STORAGE.compact()
+    if compacted:
+        app.logger.info("Compacted journals: %s", ", ".join(compacted))
+    return compacted
+
+
+@background_job('JOURNAL_COMPACT_INTERVAL')
+def trim_changes():
+    # Clients further behind than the retained log just get a full sync
+    limit = app.config['CHANGE_LOG_LIMIT']
+    if count_db('changes') <= 2 * limit:
+        return 0
+
+    with db_transaction('changes'):
+        records = load_db('changes')
+        save_db('changes', records[-limit:])
+    return len(records) - limit
+
+
+# ---------- Payment confirmation ----------
+# create_rental() only records a Pending rental, which holds the car for
+# PAYMENT_HOLD_SECONDS. The payment is verified on the pool below, off the
+# request thread, and the rental then goes Active/Booked or Failed.
+# sweep_payments() retries undecided ones (other workers', or from before
+# a restart) and lets holds nobody paid for expire.
+
+class StubPaymentVerifier:
+    # Stands in for a gateway: well-formed UPI ids pay, anything else is
+    # declined
+    name = 'stub'
+    UPI_ID = re.compile(r'[A-Za-z0-9._-]+@[A-Za-z]+')
+
+    def __init__(self, delay):
+        self.delay = delay
+
+    def verify(self, rental):
+        # True paid, False declined, None not settled yet
+        if self.delay:
+            time.sleep(self.delay)
+        return bool(self.UPI_ID.fullmatch(rental.payment_id or ''))
+
+
+def create_payment_verifier(name):
+    if name == 'stub':
+        return StubPaymentVerifier(app.config['PAYMENT_STUB_DELAY'])
+    raise ValueError(f"Unknown payment verifier: {name}")
+
+
+PAYMENTS = create_payment_verifier(app.config['PAYMENT_VERIFIER'])
+
+_payment_pool = ThreadPoolExecutor(max_workers=app.config['PAYMENT_WORKERS'], thread_name_prefix="drivehub-payments")
+_payments_queued = set()
+_payments_lock = threading.Lock()
+
+
+def queue_payment(tx_id):
+    with _payments_lock:
+        if tx_id in _payments_queued:
+            return
+        _payments_queued.add(tx_id)
+    _payment_pool.submit(_settle_queued, tx_id)
+
+
+def _settle_queued(tx_id):
+    try:
+        settle_payment(tx_id)
+    except Exception:
+        app.logger.exception("Settling payment %s failed", tx_id)
+    finally:
+        with _payments_lock:
+            _payments_queued.discard(tx_id)
+
+
+def settle_payment(tx_id, now=None):
+    # Verifies one Pending rental and applies the outcome; returns the
+    # rental's status afterwards
+    rental = get_db('rentals', tx_id)
+    if not rental or rental.status != 'Pending':
+        return rental.status if rental else None
+
+    # The gateway call happens outside any lock
+    try:
+        with METRICS.timer('drivehub_payment_verify_seconds', verifier=PAYMENTS.name):
+            paid = PAYMENTS.verify(rental)
+    except Exception:
+        app.logger.exception("Payment verifier failed for %s", tx_id)
+        paid = None
+
+    now = now or datetime.now()
+    if paid is None and rental.hold_until and rental.hold_until > now:
+        return 'Pending'
+
+    with db_transaction('vehicles', 'rentals', 'stats'):
+        rental = get_db('rentals', tx_id)
+        if not rental or rental.status != 'Pending':
+            return rental.status if rental else None
+
+        if paid is None:
+            rental.status = 'Expired'
+        elif not paid:
+            rental.status = 'Failed'
+        elif rental.start and rental.start > now:
+            rental.status = 'Booked'
+        else:
+            vehicle = get_db('vehicles', rental.vehicle_id)
+            if vehicle and vehicle.status == 'Available':
+                vehicle.status = 'Rented'
+                put_db('vehicles', vehicle)
+                rental.status = 'Active'
+            else:
+                # Pulled from the fleet while the payment was checked; the
+                # gateway side has to refund
+                rental.status = 'Failed'
+
+        if rental.status in HOLDING_STATUSES:
+            rental.total = rental.price
+            adjust_stats(revenue=rental.total, active=1 if rental.status == 'Active' else 0)
+        put_db('rentals', rental)
+
+    METRICS.inc('drivehub_payments_total', result=rental.status)
+    return rental.status
+
+
+# ==========================================
+# 5. IMAGE PIPELINE
+# ==========================================
+# Uploads are stored under their SHA-256, so the same photo uploaded twice
+# is kept once. Card thumbnails (WebP, THUMB_SIZE) are encoded by a small
+# worker pool after the request returns; the vehicle record gets its
+# 'thumb' field once the file exists.
+
+_image_pool = ThreadPoolExecutor(max_workers=app.config['IMAGE_WORKERS'], thread_name_prefix="drivehub-images")
+
+
+def store_upload(f):
+    return store_stream(f.stream, f.filename)
+
+
+def store_stream(stream, filename):
+    # Hash while streaming to a temp file instead of holding the upload
+    digest = hashlib.sha256()
+    folder = app.config['UPLOAD_FOLDER']
+    tmp = os.path.join(folder, f".upload-{uuid.uuid4().hex}.tmp")
+    with open(tmp, 'wb') as out:
+        for chunk in iter(lambda: stream.read(64 * 1024), b''):
+            digest.update(chunk)
+            out.write(chunk)
+
+    ext = os.path.splitext(secure_filename(filename or ''))[1].lower()
+    fname = digest.hexdigest() + ext
+    path = os.path.join(folder, fname)
+    if os.path.exists(path):
+        os.remove(tmp)
+    else:
+        os.replace(tmp, path)
+    return fname
+
+
+def thumb_name(fname):
+    return os.path.splitext(fname)[0] + '.webp'
+
+
+def thumb_ready(fname):
+    return os.path.exists(os.path.join(app.config['THUMB_FOLDER'], thumb_name(fname)))
+
+
+def make_thumbnail(fname):
+    if Image is None:
+        return None
+
+    name = thumb_name(fname)
+    target = os.path.join(app.config['THUMB_FOLDER'], name)
+    if os.path.exists(target):
+        return name
+
+    with Image.open(os.path.join(app.config['UPLOAD_FOLDER'], fname)) as im:
+        im = ImageOps.exif_transpose(im)
+        im.thumbnail(app.config['THUMB_SIZE'])
+        if im.mode not in ('RGB', 'RGBA'):
+            im = im.convert('RGBA' if 'A' in im.getbands() else 'RGB')
+        tmp = f"{target}.{uuid.uuid4().hex}.tmp"
+        im.save(tmp, 'WEBP', quality=80, method=4)
+    os.replace(tmp, target)
+    return name
+
+
+def _attach_thumbnail(v_id, fname):
+    try:
+        name = make_thumbnail(fname)
+    except Exception:
+        app.logger.exception("Thumbnail failed for %s", fname)
+        return
+    if not name:
+        return
+
+    with db_transaction('vehicles'):
+        vehicle = get_db('vehicles', v_id)
+        # The image may have been replaced while we were encoding
+        if vehicle and vehicle.image == fname and vehicle.thumb != name:
+            vehicle.thumb = name
+            put_db('vehicles', vehicle)
+
+
+def queue_thumbnail(v_id, fname):
+    if Image is not None and not thumb_ready(fname):
+        _image_pool.submit(_attach_thumbnail, v_id, fname)
+
+
+def _media_etag(filename):
+    # Originals are named after their SHA-256, which is the best ETag there is
+    stem = os.path.splitext(filename)[0]
+    if '/' not in filename and len(stem) == 64 and all(c in '0123456789abcdef' for c in stem):
+        return stem
+    return True
+
+
+@app.route('/media/<path:filename>')
+def media(filename):
+    # Upload names never get reused (content hash or uuid prefix), so
+    # browsers may keep them forever. send_file handles If-None-Match,
+    # Range/If-Range, and hands the file to wsgi.file_wrapper so gunicorn
+    # can use sendfile().
+    resp = send_from_directory(
+        app.config['UPLOAD_FOLDER'], filename,
+        max_age=app.config['MEDIA_MAX_AGE'],
+        conditional=True,
+        etag=_media_etag(filename)
+    )
+    resp.cache_control.public = True
+    resp.cache_control.immutable = True
+    return resp
+
+
+@app.cli.command('build-thumbnails')
+def build_thumbnails_command():
+    """Generate missing thumbnails for vehicles that already have an image."""
+    for vehicle in iter_db('vehicles'):
+        if vehicle.get('image') and not vehicle.get('thumb'):
+            _attach_thumbnail(vehicle['id'], vehicle['image'])
+
+
+# ==========================================
+# 6. BACKEND ROUTES (UNCHANGED LOGIC)
+# ==========================================
+
+# ---------- Pre-rendered UI shell ----------
+# UI_CODE is rendered once at startup (see RUN) and kept in memory together
+# with its gzip/brotli encodings, so a page load is a dict lookup.
+
+UI_ASSETS = {}
+
+
+def _precompress(body, content_type):
+    body = body.encode('utf-8')
+    variants = {'identity': body, 'gzip': gzip.compress(body, 9)}
+    if brotli:
+        variants['br'] = brotli.compress(body, quality=11)
+    return {
+        "content_type": content_type,
+        "etag": hashlib.sha256(body).hexdigest()[:32],
+        "variants": variants
+    }
+
+
+def build_ui(source):
+    with app.app_context():
+        html = app.jinja_env.from_string(source).render()
+
+    if app.config['SPLIT_ASSETS']:
+        def extract(pattern, ext, content_type, tag):
+            nonlocal html
+            match = re.search(pattern, html, re.S)
+            if not match:
+                return
+            asset = _precompress(match.group(1), content_type)
+            name = f"app.{asset['etag'][:12]}.{ext}"
+            UI_ASSETS[name] = asset
+            html = html[:match.start()] + tag.format(name=name) + html[match.end():]
+
+        extract(r'<style>(.*?)</style>', 'css', 'text/css; charset=utf-8',
+                '<link rel="stylesheet" href="/assets/{name}">')
+        extract(r'<script>(.*?)</script>', 'js', 'text/javascript; charset=utf-8',
+                '<script src="/assets/{name}"></script>')
+
+    UI_ASSETS['index.html'] = _precompress(html, 'text/html; charset=utf-8')
+
+
+def _serve_precompressed(asset, cache_control):
+    accepted = request.accept_encodings
+    encoding = next((e for e in ('br', 'gzip') if e in asset['variants'] and accepted[e]), 'identity')
+    # Each encoding is its own representation, so it gets its own strong ETag
+    etag = asset['etag'] if encoding == 'identity' else f"{asset['etag']}-{encoding}"
+
+    if request.if_none_match.contains(etag):
+        resp = app.response_class(status=304)
+    else:
+        resp = app.response_class(asset['variants'][encoding], content_type=asset['content_type'])
+        if encoding != 'identity':
+            resp.headers['Content-Encoding'] = encoding
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = cache_control
+    resp.vary.add('Accept-Encoding')
+    return resp
+
+
+# ---------- Request metrics ----------
+# Registered before compress_json so its after_request runs last and the
+# timing includes compression.
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+    if app.config['PROFILE_SLOW_MS']:
+        PROFILER.begin()
+
+
+@app.after_request
+def record_request(resp):
+    started = g.pop('request_started', None)
+    if started is None:
+        return resp
+    elapsed = time.perf_counter() - started
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    METRICS.observe('drivehub_request_seconds', elapsed, route=route, method=request.method)
+    METRICS.inc('drivehub_requests_total', route=route, method=request.method, status=resp.status_code)
+
+    if app.config['PROFILE_SLOW_MS']:
+        path = PROFILER.end(f"{request.method} {route}", elapsed, app.config['PROFILE_SLOW_MS'] / 1000)
+        if path:
+            METRICS.inc('drivehub_slow_requests_total', route=route)
+            app.logger.info("Slow request %s %s (%.0f ms), stacks in %s", request.method, route, elapsed * 1000, path)
+    return resp
+
+
+@app.teardown_request
+def discard_profile(exc):
+    # Requests that failed before after_request ran still hold a slot
+    PROFILER.discard()
+
+
+@METRICS.collector
+def table_gauges():
+    samples = [('drivehub_table_records', {"table": key}, STORAGE.count(key))
+               for key in DB_FILES if STORAGE.exists(key)]
+    samples.append(('drivehub_store_version', {}, current_version()))
+    samples.append(('drivehub_sessions', {"store": SESSIONS.name}, SESSIONS.count()))
+    return samples
+
+
+@app.route('/metrics')
+def metrics():
+    token = app.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return jsonify({"error": "Unauthorized"}), 403
+    return Response(METRICS.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.after_request
+def compress_json(resp):
+    # Pre-rendered assets and media carry their own encodings; streams
+    # (SSE) are flushed event by event and left alone
+    if (resp.status_code != 200 or resp.mimetype != 'application/json'
+            or resp.direct_passthrough or resp.is_streamed
+            or 'Content-Encoding' in resp.headers):
+        return resp
+
+    resp.vary.add('Accept-Encoding')
+    accepted = request.accept_encodings
+    encoding = next((e for e in ('br', 'gzip') if accepted[e] and (e != 'br' or brotli)), None)
+    body = resp.get_data()
+    if encoding is None or len(body) < app.config['COMPRESS_MIN_SIZE']:
+        return resp
+
+    level = app.config['COMPRESS_LEVEL']
+    if encoding == 'br':
+        resp.set_data(brotli.compress(body, quality=min(level, 11)))
+    else:
+        resp.set_data(gzip.compress(body, level))
+    resp.headers['Content-Encoding'] = encoding
+
+    etag, weak = resp.get_etag()
+    if etag:
+        resp.set_etag(f"{etag}-{encoding}", weak)
+    return resp
+
+
+def _matching_etag(etag):
+    # The tag a client holds may be for any of the encoded representations
+    for tag in (etag, f"{etag}-br", f"{etag}-gzip"):
+        if request.if_none_match.contains(tag):
+            return tag
+    return None
+
+
+def _columnar(records):
+    # Compact form: field names once, then one value array per record
+    records = [r.to_json() if isinstance(r, Record) else r for r in records]
+    columns = list(dict.fromkeys(field for record in records for field in record))
+    return {"columns": columns, "rows": [[record.get(c) for c in columns] for record in records]}
+
+
+def _wants_compact():
+    return request.args.get('compact') == '1'
+
+
+@app.route('/')
+def root():
+    # Revalidated on every visit so a deploy shows up straight away; the
+    # answer is usually a 304
+    return _serve_precompressed(UI_ASSETS['index.html'], 'no-cache')
+
+
+@app.route('/assets/<name>')
+def ui_asset(name):
+    asset = UI_ASSETS.get(name)
+    if asset is None or name == 'index.html':
+        return jsonify({"error": "Not found"}), 404
+    return _serve_precompressed(asset, f"public, max-age={app.config['MEDIA_MAX_AGE']}, immutable")
+
+# ---------- Credentials ----------
+# Users are looked up through the primary-key index on email and only ever
+# hold a salted hash. Plaintext entries from older data files are checked
+# once and rehashed on that first successful login. Attempts are rate
+# limited per email and per client IP (per worker) before any lookup, and
+# repeat logins are checked against a cache instead of the slow hash.
+
+class Throttle:
+    # Token bucket per key: `burst` attempts straight away, then one more
+    # every `refill` seconds
+
+    def __init__(self, burst, refill, max_keys=100000):
+        self.burst = burst
+        self.refill = refill
+        self.max_keys = max_keys
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def take(self, key):
+        # Seconds until `key` may try again, 0 when this attempt is allowed
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last) / self.refill)
+            if tokens < 1:
+                self._buckets[key] = (tokens, now)
+                return (1 - tokens) * self.refill
+            self._buckets[key] = (tokens - 1, now)
+            if len(self._buckets) > self.max_keys:
+                self._prune(now)
+            return 0
+
+    def _prune(self, now):
+        # Buckets that have refilled completely are the same as no bucket
+        full = [k for k, (tokens, last) in self._buckets.items()
+                if tokens + (now - last) / self.refill >= self.burst]
+        for key in full:
+            del self._buckets[key]
+
+
+class CredentialCache:
+    # Passwords that verified recently, as HMACs under a random per-process
+    # key, tied to the hash they were checked against so a password change
+    # invalidates them
+
+    def __init__(self, max_entries=10000):
+        self.max_entries = max_entries
+        self._key = os.urandom(32)
+        self._entries = {}      # email -> (password_hash, digest)
+        self._lock = threading.Lock()
+
+    def _digest(self, password):
+        return hmac.new(self._key, password.encode('utf-8'), 'sha256').digest()
+
+    def check(self, user, password):
+        entry = self._entries.get(user.email)
+        return (entry is not None and user.password_hash is not None and entry[0] == user.password_hash
+                and hmac.compare_digest(entry[1], self._digest(password)))
+
+    def remember(self, user, password):
+        with self._lock:
+            self._entries.pop(user.email, None)
+            self._entries[user.email] = (user.password_hash, self._digest(password))
+            while len(self._entries) > self.max_entries:
+                del self._entries[next(iter(self._entries))]
+
+
+CREDENTIALS = CredentialCache()
+
+LOGIN_THROTTLES = (
+    ('email', Throttle(app.config['LOGIN_BURST'], app.config['LOGIN_REFILL_SECONDS'])),
+    ('ip', Throttle(app.config['LOGIN_IP_BURST'], app.config['LOGIN_IP_REFILL_SECONDS']))
+)
+
+
+def verify_password(user, password):
+    if CREDENTIALS.check(user, password):
+        return True
+    if user.password_hash:
+        if not check_password_hash(user.password_hash, password):
+            return False
+        CREDENTIALS.remember(user, password)
+        return True
+    if user.password is None:
+        return False
+    return hmac.compare_digest(user.password.encode('utf-8'), password.encode('utf-8'))
+
+
+def _rehash_password(email, password):
+    # Hashing is slow by design; keep it out of the users lock
+    password_hash = generate_password_hash(password)
+    with db_transaction('users'):
+        user = get_db('users', email)
+        if user and user.password is not None:
+            user.password_hash = password_hash
+            user.password = None
+            put_db('users', user)
+            CREDENTIALS.remember(user, password)
+
+
+def current_user():
+    # Looked up through the users index on every request, so role changes
+    # and removed accounts take effect at once
+    if 'user' not in g:
+        email = session.get('email')
+        g.user = get_db('users', email) if email else None
+    return g.user
+
+
+def public_user(user):
+    data = user.to_json()
+    data.pop('password', None)
+    data.pop('password_hash', None)
+    return data
+
+
+@app.route('/api/auth/login', methods=['POST'])
+def login():
+    data = request.json
+    email = str(data.get('email', '')).strip()
+    password = str(data.get('password', ''))
+
+    if app.config['LOGIN_THROTTLE']:
+        keys = {'email': email.lower(), 'ip': request.remote_addr or ''}
+        wait = max(throttle.take(keys[name]) for name, throttle in LOGIN_THROTTLES)
+        if wait:
+            resp = jsonify({"status": "error", "message": "Too many attempts, try again later"})
+            resp.status_code = 429
+            resp.headers['Retry-After'] = str(math.ceil(wait))
+            return resp
+
+    user = get_db('users', email)
+
+    if user and verify_password(user, password):
+        if user.password is not None:
+            _rehash_password(email, password)
+        session.rotate()
+        session['email'] = user.email
+        return jsonify({"status": "success", "user": public_user(user)})
+
+    return jsonify({"status": "error", "message": "Invalid Credentials"})
+
+
+@app.route('/api/auth/register', methods=['POST'])
+def register():
+    data = request.json
+    if get_db('users', data['email']):
+        return jsonify({"status": "error", "message": "Email exists"})
+
+    # Hash before taking the users lock, then check again under it
+    password_hash = generate_password_hash(data['password'])
+    with db_transaction('users'):
+        if get_db('users', data['email']):
+            return jsonify({"status": "error", "message": "Email exists"})
+
+        put_db('users', {
+            "id": str(count_db('users') + 1),
+            "name": data['name'],
+            "email": data['email'],
+            "password_hash": password_hash,
+            "role": "user"
+        })
+    return jsonify({"status": "success"})
+
+
+
+
+def sync_payload(user, touched=None, compact=False):
+    # Full snapshot when touched is None, otherwise just the touched records
+    is_admin = user['role'] == 'admin'
+
+    if touched is None:
+        vehicles = load_db('vehicles')
+        if is_admin:
+            # The full ledger is paged through /api/rentals
+            rentals = select_db('rentals', 'status', 'Active')
+        else:
+            rentals = select_db('rentals', 'user_email', user['email'])
+        deleted = {"vehicles": [], "rentals": []}
+    else:
+        vehicles, rentals = [], []
+        deleted = {"vehicles": [], "rentals": []}
+        for v_id in sorted(touched['vehicles']):
+            vehicle = get_db('vehicles', v_id)
+            if vehicle:
+                vehicles.append(vehicle)
+            else:
+                deleted['vehicles'].append(v_id)
+        for tx_id in sorted(touched['rentals']):
+            rental = get_db('rentals', tx_id)
+            if rental and (is_admin or rental.user_email == user['email']):
+                rentals.append(rental)
+            elif not rental and is_admin:
+                deleted['rentals'].append(tx_id)
+
+    return {
+        "role": user['role'],
+        "vehicles": _columnar(vehicles) if compact else vehicles,
+        "rentals": _columnar(rentals) if compact else rentals,
+        "deleted": deleted,
+        "stats": read_stats() if is_admin else {}
+    }
+
+
+@app.route('/api/data/sync')
+def sync():
+    user = current_user()
+    if not user:
+        return jsonify({"status": "error"}), 401
+
+    # Everything in the payload is derived from the store version and who is
+    # asking, so that is all the ETag needs
+    version = current_version()
+    compact = _wants_compact()
+    etag = hashlib.sha1(f"{version}:{user['role']}:{user['email']}:{compact}".encode()).hexdigest()
+    matched = _matching_etag(etag)
+    if matched:
+        not_modified = app.response_class(status=304)
+        not_modified.set_etag(matched)
+        return not_modified
+
+    since = request.args.get('since')
+    touched = changes_since(since) if since else None
+
+    resp = jsonify({"status": "success", "version": version, "full": touched is None, "data": sync_payload(user, touched, compact)})
+    resp.set_etag(etag)
+    resp.headers['Cache-Control'] = 'private, no-cache'
+    return resp
+
+
+_event_streams = threading.BoundedSemaphore(app.config['SSE_MAX_STREAMS'])
+
+
+@app.route('/api/events')
+def events():
+    user = current_user()
+    if not user:
+        return jsonify({"status": "error"}), 401
+    # Streams are a scarce per-worker resource, kept for the admin views;
+    # everyone else polls /api/data/sync
+    if user.role != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    # Over the cap the client falls back to polling /api/data/sync
+    if not _event_streams.acquire(blocking=False):
+        resp = jsonify({"status": "error", "message": "Too many event streams"})
+        resp.status_code = 503
+        resp.headers['Retry-After'] = str(app.config['SSE_MAX_AGE'])
+        return resp
+
+    # EventSource resends the last id it saw when it reconnects
+    last_id = request.headers.get('Last-Event-ID') or request.args.get('since')
+    version = int(last_id) if last_id and last_id.isdigit() else current_version()
+    compact = _wants_compact()
+
+    def stream(version):
+        yield "retry: 3000\n\n"
+        # Streams are recycled so a worker thread is never pinned for good;
+        # the browser reconnects and resumes from its last id
+        deadline = time.monotonic() + app.config['SSE_MAX_AGE']
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return
+
+            latest = wait_for_change(version, timeout=min(15, remaining))
+            if latest == version:
+                yield ": keepalive\n\n"
+                continue
+
+            touched = changes_since(version)
+            payload = {"version": latest, "full": touched is None, "data": sync_payload(user, touched, compact)}
+            yield f"id: {latest}\nevent: sync\ndata: {app.json.dumps(payload)}\n\n"
+            version = latest
+
+    resp = Response(stream(version), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # Runs when the server closes the response, however the stream ended
+    resp.call_on_close(_event_streams.release)
+    return resp
+
+
+def _encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode() if cursor else None
+
+
+def _decode_cursor(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode()))
+    except ValueError:
+        return None
+
+
+def _is_page_key(after, sort_key):
+    # A (sort key, pk) pair as page() hands them out; anything else would
+    # fail to compare against the ordered index
+    return (isinstance(after, list) and len(after) == 2 and isinstance(after[1], str)
+            and sort_key(after[0]) == after[0])
+
+
+@app.route('/api/rentals')
+def list_rentals():
+    user = current_user()
+    if not user:
+        return jsonify({"status": "error"}), 401
+
+    args = request.args
+    sort = args.get('sort', 'date')
+    if sort not in SORTED_INDEXES['rentals']:
+        return jsonify({"status": "error", "message": "Unknown sort"}), 400
+
+    equals = {f: args[f] for f in ('status', 'user_email', 'vehicle_id') if args.get(f)}
+    if user['role'] != 'admin':
+        equals['user_email'] = user['email']
+
+    between = {}
+    if args.get('date_from') or args.get('date_to'):
+        # Dates are stored as "YYYY-MM-DD HH:MM", so a bare day must still
+        # match everything on that day
+        date_to = args.get('date_to')
+        between['date'] = (args.get('date_from'), date_to + '~' if date_to else None)
+
+    after = None
+    if args.get('cursor'):
+        after = _decode_cursor(args['cursor'])
+        if not _is_page_key(after, SORTED_INDEXES['rentals'][sort]):
+            return jsonify({"status": "error", "message": "Bad cursor"}), 400
+
+    limit = max(1, min(request.args.get('limit', 50, type=int), 200))
+    rentals, next_cursor = page_db(
+        'rentals', sort,
+        descending=args.get('order', 'desc') == 'desc',
+        equals=equals,
+        between=between,
+        after=after,
+        limit=limit
+    )
+
+    return jsonify({
+        "status": "success",
+        "rentals": _columnar(rentals) if _wants_compact() else rentals,
+        "next_cursor": _encode_cursor(next_cursor)
+    })
+
+
+@app.route('/api/vehicles/search')
+def search_vehicles():
+    user = current_user()
+    if not user:
+        return jsonify({"status": "error"}), 401
+
+    args = request.args
+    sort = args.get('sort', 'price')
+    if sort not in SORTED_INDEXES['vehicles']:
+        return jsonify({"status": "error", "message": "Unknown sort"}), 400
+
+    equals = {f: args[f] for f in SECONDARY_INDEXES['vehicles'] if args.get(f)}
+    between = {}
+    for field in SORTED_INDEXES['vehicles']:
+        low = args.get(f'{field}_min', type=float)
+        high = args.get(f'{field}_max', type=float)
+        if low is not None or high is not None:
+            between[field] = (low, high)
+
+    # ?free_from=...&free_to=... keeps vehicles with nothing booked in between
+    where = None
+    if args.get('free_from') or args.get('free_to'):
+        window = _booking_window({'start': args.get('free_from'), 'end': args.get('free_to')})
+        if window is None:
+            return jsonify({"status": "error", "message": "Bad date range"}), 400
+        where = lambda v: not overlapping_db('rentals', v.id, *window)
+
+    # ?prefer=fuel:Electric lists the matching vehicles first and then the
+    # rest, as two passes over the indexes; the cursor records the pass
+    passes = [(equals, {})]
+    if args.get('prefer'):
+        field, _, value = args['prefer'].partition(':')
+        if field not in SECONDARY_INDEXES['vehicles'] or not value:
+            return jsonify({"status": "error", "message": "Bad prefer"}), 400
+        if field not in equals:
+            passes = [({**equals, field: value}, {}), (equals, {field: value})]
+
+    stage, after = 0, None
+    if args.get('cursor'):
+        cursor = _decode_cursor(args['cursor'])
+        if (not isinstance(cursor, list) or not cursor
+                or type(cursor[0]) is not int or not 0 <= cursor[0] < len(passes)
+                or (len(cursor) > 1 and not _is_page_key(cursor[1:], SORTED_INDEXES['vehicles'][sort]))):
+            return jsonify({"status": "error", "message": "Bad cursor"}), 400
+        stage, after = cursor[0], cursor[1:] or None
+
+    limit = max(1, min(args.get('limit', 20, type=int), 100))
+    vehicles, next_cursor = [], None
+    for i in range(stage, len(passes)):
+        if len(vehicles) == limit:
+            next_cursor = [i]
+            break
+        only, exclude = passes[i]
+        found, next_after = page_db(
+            'vehicles', sort,
+            descending=args.get('order', 'asc') == 'desc',
+            equals=only,
+            between=between,
+            exclude=exclude,
+            where=where,
+            after=after if i == stage else None,
+            limit=limit - len(vehicles)
+        )
+        vehicles += found
+        if next_after is not None:
+            next_cursor = [i, *next_after]
+            break
+
+    return jsonify({
+        "status": "success",
+        "vehicles": _columnar(vehicles) if _wants_compact() else vehicles,
+        "next_cursor": _encode_cursor(next_cursor)
+    })
+
+
+@app.route('/api/vehicle/manage', methods=['POST'])
+def manage_vehicle():
+    user = current_user()
+    if not user or user.role != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    v_id = request.form.get('id')
+
+    v_data = {
+        "model": request.form.get('model'),
+        "price": request.form.get('price'),
+        "year": request.form.get('year', '2024'),
+        "fuel": request.form.get('fuel', 'Petrol'),
+        "transmission": request.form.get('transmission', 'Auto'),
+        "seats": request.form.get('seats', '4'),
+        "health": request.form.get('health', '100'),
+        "kms": request.form.get('kms', '0'),
+        "status": request.form.get('status', 'Available'),
+        "image": "",
+        "thumb": ""
+    }
+
+    for field in ('price', 'year', 'seats', 'health', 'kms'):
+        try:
+            Vehicle.FIELDS[field][0](v_data[field])
+        except ValueError:
+            return jsonify({"error": f"{field} must be a number"}), 400
+
+    f = request.files.get('image')
+    if f:
+        v_data['image'] = store_upload(f)
+        if thumb_ready(v_data['image']):
+            v_data['thumb'] = thumb_name(v_data['image'])
+
+    if not v_id or v_id == 'null':
+        v_id = None
+
+    with db_transaction('vehicles', 'stats'):
+        if v_id:
+            vehicle = get_db('vehicles', v_id)
+            if vehicle:
+                kms_before = vehicle.kms or 0
+                vehicle.update(v_data)
+                put_db('vehicles', vehicle)
+                adjust_stats(kms=(vehicle.kms or 0) - kms_before)
+        else:
+            vehicle = Vehicle(v_data)
+            v_id = vehicle.id = str(uuid.uuid4().int)[:6]
+            put_db('vehicles', vehicle)
+            adjust_stats(fleet=1, kms=vehicle.kms or 0)
+
+    if v_data['image'] and not v_data['thumb']:
+        queue_thumbnail(v_id, v_data['image'])
+
+    return jsonify({"status": "success"})
+
+
+@app.route('/api/vehicle/delete', methods=['POST'])
+def delete_vehicle():
+    user = current_user()
+    if not user or user.role != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    v_id = request.json.get('id')
+
+    with db_transaction('vehicles', 'stats'):
+        vehicle = get_db('vehicles', v_id)
+        if vehicle and delete_db('vehicles', v_id):
+            adjust_stats(fleet=-1, kms=-(vehicle.kms or 0))
+
+    return jsonify({"status": "success"})
+
+
+# ---------- Bulk vehicle import ----------
+# A CSV or JSON-lines file of vehicles, optionally with a zip of the images
+# it names. Rows are checked as they stream in, then all the valid ones are
+# applied in one transaction, so vehicles is written once per import.
+
+IMPORT_FIELDS = ('model', 'price', 'year', 'fuel', 'transmission', 'seats', 'health', 'kms', 'status')
+IMPORT_DEFAULTS = {
+    "year": "2024", "fuel": "Petrol", "transmission": "Auto", "seats": "4",
+    "health": "100", "kms": "0", "status": "Available"
+}
+# Rented is only ever set by a rental
+IMPORT_STATUSES = ('Available', 'Maintenance')
+IMPORT_RANGES = {'year': (1900, 2100), 'seats': (1, 99), 'health': (0, 100), 'kms': (0, 10 ** 7)}
+IMPORT_MAX_ERRORS = 100
+VEHICLE_ID = re.compile(r'[A-Za-z0-9_-]{1,32}')
+
+
+def _import_format(upload):
+    fmt = request.args.get('format')
+    if fmt:
+        return fmt
+    name = (upload.filename or '').lower() if upload else ''
+    if name.endswith(('.jsonl', '.ndjson')) or 'json' in request.mimetype:
+        return 'jsonl'
+    return 'csv'
+
+
+def _import_rows(stream, fmt):
+    # (line number, row) pairs straight off the upload
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    if fmt == 'csv':
+        reader = csv.DictReader(text)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except ValueError:
+            yield line_no, None
+
+
+def _import_vehicle(row, existing):
+    # The vehicle `row` describes, on top of `existing` when it updates one;
+    # ValueError says what is wrong with the row
+    values = {}
+    for field in IMPORT_FIELDS:
+        value = row.get(field)
+        if value is not None and str(value).strip():
+            values[field] = str(value).strip()
+
+    if existing is None:
+        for field in ('model', 'price'):
+            if field not in values:
+                raise ValueError(f"{field} is required")
+        values = dict(IMPORT_DEFAULTS, **values)
+    if 'status' in values:
+        if values['status'] not in IMPORT_STATUSES:
+            raise ValueError(f"status must be one of {', '.join(IMPORT_STATUSES)}")
+        if existing is not None and existing.status == 'Rented':
+            raise ValueError("vehicle is out on a rental")
+
+    vehicle = existing.copy() if existing else Vehicle()
+    for field, value in values.items():
+        try:
+            vehicle[field] = value
+        except ValueError:
+            raise ValueError(f"{field} must be a number") from None
+
+    if vehicle.price is None or not math.isfinite(vehicle.price) or vehicle.price <= 0:
+        raise ValueError("price must be a positive number")
+    for field, (low, high) in IMPORT_RANGES.items():
+        value = vehicle.get(field)
+        if value is not None and not low <= value <= high:
+            raise ValueError(f"{field} must be between {low} and {high}")
+
+    # release_maintenance() times the window from maintenance_start
+    if vehicle.status == 'Maintenance' and vehicle.maintenance_start is None:
+        vehicle.maintenance_start = datetime.now().replace(microsecond=0)
+    elif vehicle.status != 'Maintenance':
+        vehicle.maintenance_start = None
+    return vehicle
+
+
+class ImportImages:
+    # Image names in an import resolve to entries of the uploaded zip, or
+    # without one to files already in the upload folder
+
+    def __init__(self, upload, store):
+        self.archive = zipfile.ZipFile(upload.stream) if upload else None
+        self.store = store
+        self._stored = {}
+
+    def resolve(self, name):
+        if name in self._stored:
+            return self._stored[name]
+
+        if self.archive is None:
+            if secure_filename(name) != name or not os.path.exists(os.path.join(app.config['UPLOAD_FOLDER'], name)):
+                raise ValueError(f"image {name} not found")
+            stored = name
+        else:
+            try:
+                info = self.archive.getinfo(name)
+            except KeyError:
+                raise ValueError(f"image {name} is not in the zip") from None
+            if info.file_size > app.config['MAX_CONTENT_LENGTH']:
+                raise ValueError(f"image {name} is too large")
+            stored = None
+            if self.store:
+                with self.archive.open(info) as f:
+                    stored = store_stream(f, name)
+
+        self._stored[name] = stored
+        return stored
+
+
+@app.route('/api/vehicles/import', methods=['POST'])
+def import_vehicles():
+    user = current_user()
+    if not user or user.role != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    # A whole fleet with its photos is well over the usual upload limit
+    request.max_content_length = app.config['IMPORT_MAX_CONTENT_LENGTH']
+    upload = request.files.get('file')
+    fmt = _import_format(upload)
+    if fmt not in ('csv', 'jsonl'):
+        return jsonify({"status": "error", "message": "Unknown format"}), 400
+    if upload:
+        stream = upload.stream
+    elif request.mimetype in ('text/csv', 'application/x-ndjson', 'application/jsonl'):
+        stream = request.stream
+    else:
+        return jsonify({"status": "error", "message": "No file"}), 400
+
+    dry_run = request.args.get('dry_run') == '1'
+    try:
+        images = ImportImages(request.files.get('images'), store=not dry_run)
+    except zipfile.BadZipFile:
+        return jsonify({"status": "error", "message": "images must be a zip file"}), 400
+
+    started = time.perf_counter()
+    max_rows = app.config['IMPORT_MAX_ROWS']
+    pending, errors, seen = [], [], set()
+    rows = inserts = 0
+
+    # First pass, unlocked: check each row against the committed table and
+    # store its image
+    for line, row in _import_rows(stream, fmt):
+        rows += 1
+        if rows > max_rows:
+            errors.append({"line": line, "error": f"more than {max_rows} rows"})
+            rows -= 1
+            break
+        try:
+            if not isinstance(row, dict):
+                raise ValueError("not a JSON object")
+            v_id = str(row.get('id') or '').strip() or None
+            if v_id is not None:
+                if not VEHICLE_ID.fullmatch(v_id):
+                    raise ValueError("id must be 1-32 letters, digits, '-' or '_'")
+                if v_id in seen:
+                    raise ValueError(f"id {v_id} appears more than once")
+                seen.add(v_id)
+            existing = get_db('vehicles', v_id) if v_id else None
+            _import_vehicle(row, existing)
+            image = str(row.get('image') or '').strip()
+            image = images.resolve(image) if image else None
+        except ValueError as e:
+            errors.append({"line": line, "error": str(e)})
+            continue
+        inserts += existing is None
+        pending.append((line, row, v_id, image))
+
+    inserted, updated = inserts, len(pending) - inserts
+    vehicles = []
+    if pending and not dry_run:
+        # Second pass under the lock re-applies each row to the current
+        # record, in case a rental or an edit got in between
+        inserted = updated = kms = 0
+        with db_transaction('vehicles', 'stats'):
+            for line, row, v_id, image in pending:
+                existing = get_db('vehicles', v_id) if v_id else None
+                try:
+                    vehicle = _import_vehicle(row, existing)
+                except ValueError as e:
+                    errors.append({"line": line, "error": str(e)})
+                    continue
+                if v_id is None:
+                    v_id = str(uuid.uuid4().int)[:6]
+                    while v_id in seen or get_db('vehicles', v_id):
+                        v_id = str(uuid.uuid4().int)[:6]
+                    seen.add(v_id)
+                vehicle.id = v_id
+                if image and image != vehicle.image:
+                    vehicle.image = image
+                    vehicle.thumb = thumb_name(image) if thumb_ready(image) else None
+                kms += (vehicle.kms or 0) - ((existing.kms or 0) if existing else 0)
+                inserted += existing is None
+                updated += existing is not None
+                vehicles.append(vehicle)
+
+            if vehicles:
+                put_many_db('vehicles', vehicles)
+                adjust_stats(fleet=inserted, kms=kms)
+
+        for vehicle in vehicles:
+            if vehicle.image and not vehicle.thumb:
+                queue_thumbnail(vehicle.id, vehicle.image)
+
+    elapsed = time.perf_counter() - started
+    if not dry_run:
+        METRICS.inc('drivehub_import_rows_total', inserted + updated, result='applied')
+    METRICS.inc('drivehub_import_rows_total', len(errors), result='rejected')
+    errors.sort(key=lambda e: e['line'])
+    return jsonify({
+        "status": "success",
+        "dry_run": dry_run,
+        "rows": rows,
+        "inserted": inserted,
+        "updated": updated,
+        "failed": len(errors),
+        "errors": errors[:IMPORT_MAX_ERRORS],
+        "seconds": round(elapsed, 3),
+        "rows_per_second": round(rows / elapsed, 1) if elapsed else None
+    })
+
+
+def _parse_when(value):
+    # "YYYY-MM-DD", "YYYY-MM-DD HH:MM" or an <input type=datetime-local> value
+    try:
+        return datetime.fromisoformat(str(value).strip()).replace(second=0, microsecond=0, tzinfo=None)
+    except ValueError:
+        return None
+
+
+def _booking_window(args, default_days=1):
+    now = datetime.now().replace(second=0, microsecond=0)
+    start = _parse_when(args['start']) if args.get('start') else now
+    end = _parse_when(args['end']) if args.get('end') else start and start + timedelta(days=default_days)
+    if start is None or end is None:
+        return None
+    # A start in the past means now; the window must still be non-empty
+    # after that, or the span would be inverted
+    start = max(start, now)
+    if end <= start:
+        return None
+    return start, end
+
+
+@app.route('/api/vehicles/<v_id>/calendar')
+def vehicle_calendar(v_id):
+    if not current_user():
+        return jsonify({"status": "error"}), 401
+
+    args = {'start': request.args.get('from'), 'end': request.args.get('to')}
+    window = _booking_window(args, default_days=30)
+    if window is None:
+        return jsonify({"status": "error", "message": "Bad date range"}), 400
+
+    bookings = [{
+        "start": _booking_span(r)[0].strftime("%Y-%m-%d %H:%M"),
+        "end": r.end.strftime("%Y-%m-%d %H:%M") if r.end else None,
+        "status": r.status
+    } for r in overlapping_db('rentals', v_id, *window)]
+    return jsonify({"status": "success", "bookings": bookings})
+
+
+@app.route('/api/rent/create', methods=['POST'])
+def create_rental():
+    data = request.json
+    user = current_user()
+    if not user:
+        return jsonify({"status": "error"}), 401
+
+    window = _booking_window(data)
+    if window is None:
+        return jsonify({"error": "Bad dates"})
+    start, end = window
+    # Starting now means the keys change hands as soon as the payment is
+    # confirmed; anything later is an advance booking that start_bookings()
+    # activates when it is due
+    now = datetime.now()
+    immediate = start <= now
+
+    # The calendar check and the booking must be one atomic step, otherwise
+    # two workers can both hand out the same car
+    with db_transaction('vehicles', 'rentals', 'stats'):
+        target = get_db('vehicles', data['v_id'])
+
+        if not target or (immediate and target.status != 'Available'):
+            return jsonify({"error": "Unavailable"})
+        if overlapping_db('rentals', target.id, start, end):
+            return jsonify({"error": "Unavailable"})
+
+        tx_id = f"TX-{uuid.uuid4().hex[:8].upper()}"
+
+        rental = Rental({
+            "tx_id": tx_id,
+            "user_email": user['email'],
+            "user_name": user['name'],
+            "vehicle_id": data['v_id'],
+            "vehicle_model": target.model,
+            "price": data['price'],
+            "payment_method": "UPI",
+            "payment_id": data.get('pay_id', 'N/A'),
+            "status": "Pending",
+            "date": now,
+            "start": start,
+            "end": end,
+            "hold_until": now + timedelta(seconds=app.config['PAYMENT_HOLD_SECONDS'])
+        })
+        put_db('rentals', rental)
+
+    # settle_payment() confirms it (or not) in the background; the client
+    # polls /api/rent/<tx_id> or picks the outcome up from sync
+    queue_payment(tx_id)
+
+    return jsonify({
+        "status": "success",
+        "tx_id": tx_id,
+        "date": now.strftime("%Y-%m-%d %H:%M"),
+        "booking": rental.status,
+        "hold_until": rental.hold_until.strftime("%Y-%m-%d %H:%M:%S"),
+        "start": start.strftime("%Y-%m-%d %H:%M"),
+        "end": end.strftime("%Y-%m-%d %H:%M")
+    })
+
+
+@app.route('/api/rent/<tx_id>')
+def rental_status(tx_id):
+    user = current_user()
+    if not user:
+        return jsonify({"status": "error"}), 401
+
+    rental = get_db('rentals', tx_id)
+    if not rental or (user.role != 'admin' and rental.user_email != user.email):
+        return jsonify({"status": "error", "message": "Not found"}), 404
+    return jsonify({"status": "success", "rental": rental})
+
+
+def _check_in_error(rental):
+    # Why `rental` can't be checked in, or None; closing one twice would
+    # add its kms again and free a car that may be out on another rental
+    if not rental:
+        return "Not found"
+    if rental.status == 'Closed':
+        return "Already closed"
+    if rental.status == 'Cancelled':
+        return "Booking was cancelled"
+    if rental.status in UNPAID_STATUSES:
+        return "Not paid"
+    return None
+
+
+def _check_in(rental, vehicle, kms, fine, now):
+    # Closes `rental` and brings `vehicle` back in; both are changed in
+    # place and the caller saves them. Returns the adjust_stats() deltas.
+    was_active = rental.status == 'Active'
+    total_before = rental.total or 0
+
+    rental.status = 'Closed'
+    rental.total = (rental.price or 0) + fine
+    rental['return_date'] = now
+
+    if vehicle:
+        vehicle.kms = (vehicle.kms or 0) + kms
+        vehicle.health = max(0, vehicle.get('health', 100) - int(kms/50))
+
+        if vehicle.health < 40:
+            vehicle.status = 'Maintenance'
+            vehicle['maintenance_start'] = now
+        else:
+            vehicle.status = 'Available'
+
+    return {
+        "revenue": rental.total - total_before,
+        "active": -1 if was_active else 0,
+        "kms": kms if vehicle else 0
+    }
+
+
+@app.route('/api/rent/return', methods=['POST'])
+def process_return():
+    user = current_user()
+    if not user or user.role != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    data = request.json
+    with db_transaction('vehicles', 'rentals', 'stats'):
+        rental = get_db('rentals', data['tx_id'])
+
+        error = _check_in_error(rental)
+        if error:
+            return jsonify({"error": error})
+
+        # A booking that never started has no car out to check back in
+        vehicle = get_db('vehicles', rental.vehicle_id) if rental.status != 'Booked' else None
+
+        kms = int(data.get('kms', 0))
+        fine = float(data.get('fine', 0))
+
+        deltas = _check_in(rental, vehicle, kms, fine, datetime.now())
+        if vehicle:
+            put_db('vehicles', vehicle)
+        put_db('rentals', rental)
+        adjust_stats(**deltas)
+
+    return jsonify({"status": "success"})
+
+
+def _return_item(item):
+    # (tx_id, kms, fine) from one entry of a batch, or ValueError
+    if not isinstance(item, dict):
+        raise ValueError("Expected an object")
+    tx_id = str(item.get('tx_id') or '').strip()
+    if not tx_id:
+        raise ValueError("tx_id is required")
+    try:
+        kms = int(item.get('kms') or 0)
+    except (TypeError, ValueError, OverflowError):
+        raise ValueError("kms must be a whole number") from None
+    try:
+        fine = float(item.get('fine') or 0)
+    except (TypeError, ValueError):
+        raise ValueError("fine must be a number") from None
+    if kms < 0 or not math.isfinite(fine) or fine < 0:
+        raise ValueError("kms and fine can't be negative")
+    return tx_id, kms, fine
+
+
+@app.route('/api/rent/return/batch', methods=['POST'])
+def process_returns():
+    # End-of-day check-in: every return in one transaction, so rentals and
+    # vehicles are each written once however many cars come back
+    user = current_user()
+    if not user or user.role != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    items = (request.get_json(silent=True) or {}).get('returns')
+    if not isinstance(items, list) or not items:
+        return jsonify({"status": "error", "message": "returns must be a non-empty list"}), 400
+    if len(items) > app.config['RETURN_BATCH_LIMIT']:
+        return jsonify({"status": "error", "message": f"At most {app.config['RETURN_BATCH_LIMIT']} returns per batch"}), 400
+
+    now = datetime.now()
+    results = []
+    rentals, vehicles = {}, {}
+    totals = {"revenue": 0, "active": 0, "kms": 0}
+
+    with db_transaction('vehicles', 'rentals', 'stats'):
+        for item in items:
+            tx_id = item.get('tx_id') if isinstance(item, dict) else None
+            try:
+                tx_id, kms, fine = _return_item(item)
+                if tx_id in rentals:
+                    raise ValueError("Duplicate tx_id")
+                rental = get_db('rentals', tx_id)
+                error = _check_in_error(rental)
+                if error:
+                    raise ValueError(error)
+            except ValueError as e:
+                results.append({"tx_id": tx_id, "status": "error", "error": str(e)})
+                continue
+
+            # One car can be on several of the day's rentals, so later items
+            # build on the copy earlier ones changed
+            vehicle = None
+            if rental.status != 'Booked':
+                if rental.vehicle_id not in vehicles:
+                    vehicles[rental.vehicle_id] = get_db('vehicles', rental.vehicle_id)
+                vehicle = vehicles[rental.vehicle_id]
+
+            for name, delta in _check_in(rental, vehicle, kms, fine, now).items():
+                totals[name] += delta
+            rentals[tx_id] = rental
+            results.append({
+                "tx_id": tx_id,
+                "status": "success",
+                "total": rental.total,
+                "vehicle_status": vehicle.status if vehicle else None
+            })
+
+        if rentals:
+            put_many_db('rentals', rentals.values())
+            put_many_db('vehicles', [v for v in vehicles.values() if v])
+            adjust_stats(**totals)
+
+    return jsonify({
+        "status": "success",
+        "closed": len(rentals),
+        "failed": len(results) - len(rentals),
+        "results": results
+    })
+
+
+@app.route('/api/stats/reconcile', methods=['POST'])
+def reconcile_stats():
+    user = current_user()
+    if not user or user.role != 'admin':
+        return jsonify({"error": "Unauthorized"}), 403
+
+    before = read_stats()
+    stats = recompute_stats()
+    drift = {k: stats[k] - before[k] for k in stats if stats[k] != before[k]}
+
+    return jsonify({"status": "success", "stats": stats, "drift": drift})
+
+
+@app.route('/api/auth/logout', methods=['POST'])
+def logout():
+    session.clear()
+    return jsonify({"status": "success"})
+
+
+
+# ==========================================
+# YOUR FULL UI_CODE GOES HERE
+# ==========================================
+
+UI_CODE = """
+<!DOCTYPE html>
+<html lang="en">
+<head>
+    <meta charset="UTF-8">
+    <title>Drive Hub</title>
+    <link href="https://fonts.googleapis.com/css2?family=Plus+Jakarta+Sans:wght@400;500;600;700;800&display=swap" rel="stylesheet">
+    <link rel="stylesheet" href="https://cdnjs.cloudflare.com/ajax/libs/font-awesome/6.4.0/css/all.min.css">
+    <script src="https://cdn.jsdelivr.net/npm/sweetalert2@11"></script>
+    <script src="https://cdn.jsdelivr.net/npm/canvas-confetti@1.6.0/dist/confetti.browser.min.js"></script>
+    <style>
+        :root { --p: #4F46E5; --p-dark: #3730A3; --bg: #F8FAFC; --txt: #0F172A; --border: #E2E8F0; }
+        * { box-sizing: border-box; font-family: 'Plus Jakarta Sans', sans-serif; }
+        body { margin: 0; background: var(--bg); color: var(--txt); height: 100vh; display: flex; }
+        .input-error {
+    border-color: #EF4444 !important;
+    box-shadow: 0 0 0 2px rgba(239,68,68,0.2);
+}
+        
+        /* AUTH PAGE - CINEMATIC */
+        .auth-container { position: fixed; inset: 0; background: white; z-index: 9999; display: flex; }
+        .auth-left { flex: 1.2; background: linear-gradient(135deg, #1e1b4b, #312e81); color: white; display: flex; flex-direction: column; justify-content: center; padding: 100px; position: relative; overflow: hidden; }
+        .auth-left::before { content: ''; position: absolute; top:0; left:0; width:100%; height:100%; background: url('https://images.unsplash.com/photo-1568605117036-5fe5e7bab0b7?q=80&w=2070') center/cover; opacity: 0.3; mix-blend-mode: overlay; }
+        .auth-content { position: relative; z-index: 2; }
+        .auth-content h1 { font-size: 4rem; line-height: 1.1; margin-bottom: 25px; font-weight: 800; letter-spacing: -1px; }
+        .highlight { color: #818CF8; background: rgba(255,255,255,0.1); padding: 0 10px; border-radius: 8px; }
+        .auth-right { flex: 1; display: flex; align-items: center; justify-content: center; background: #fff; }
+        .auth-box { width: 420px; padding: 50px; }
+        
+        .input-group { margin-bottom: 20px; }
+        .input-group label { display: block; font-size: 0.85rem; font-weight: 700; margin-bottom: 8px; color: #475569; }
+        .inp { width: 100%; padding: 14px; border: 1px solid var(--border); border-radius: 12px; font-size: 1rem; transition: 0.2s; background: #F8FAFC; }
+        .inp:focus { border-color: var(--p); background: white; outline: none; box-shadow: 0 0 0 3px rgba(79, 70, 229, 0.1); }
+        
+        /* APP LAYOUT */
+        .sidebar { width: 280px; background: white; border-right: 1px solid var(--border); padding: 30px; display: flex; flex-direction: column; }
+        .brand { font-size: 1.6rem; font-weight: 800; color: var(--txt); display: flex; align-items: center; gap: 10px; margin-bottom: 50px; }
+        .brand span { color: var(--p); }
+        
+        .nav-item { padding: 14px 16px; margin-bottom: 8px; border-radius: 12px; color: #64748B; cursor: pointer; font-weight: 600; display: flex; gap: 12px; align-items: center; transition: 0.2s; }
+        .nav-item:hover { background: #F1F5F9; color: var(--txt); }
+        .nav-item.active { background: #EEF2FF; color: var(--p); }
+        
+        .main { flex: 1; padding: 40px; overflow-y: auto; background: var(--bg); }
+        .header { display: flex; justify-content: space-between; align-items: center; margin-bottom: 30px; }
+        .pg-title { font-size: 2rem; font-weight: 800; letter-spacing: -0.5px; }
+        
+        /* CARDS */
+        .stat-grid { display: grid; grid-template-columns: repeat(4, 1fr); gap: 24px; margin-bottom: 40px; }
+        .stat-card { background: white; padding: 24px; border-radius: 20px; border: 1px solid var(--border); box-shadow: 0 4px 6px -1px rgba(0,0,0,0.02); }
+        .stat-lbl { font-size: 0.75rem; font-weight: 800; color: #94A3B8; text-transform: uppercase; letter-spacing: 0.5px; }
+        .stat-val { font-size: 2rem; font-weight: 800; margin-top: 5px; color: var(--txt); }
+
+        .fleet-grid { display: grid; grid-template-columns: repeat(auto-fill, minmax(320px, 1fr)); gap: 30px; }
+        .car-card { background: white; border-radius: 24px; border: 1px solid var(--border); overflow: hidden; transition: 0.3s; position: relative; }
+        .car-card:hover { transform: translateY(-5px); box-shadow: 0 20px 30px -10px rgba(0,0,0,0.1); }
+        .car-img { width: 100%; height: 220px; object-fit: cover; background: #F1F5F9; }
+        .car-body { padding: 24px; }
+        .tags { display: flex; gap: 8px; margin-bottom: 15px; flex-wrap: wrap; }
+        .tag { padding: 4px 10px; border-radius: 6px; background: #F8FAFC; color: #64748B; font-size: 0.75rem; font-weight: 700; border: 1px solid #F1F5F9; }
+        
+        .badge { padding: 6px 12px; border-radius: 30px; font-size: 0.75rem; font-weight: 800; color: white; position: absolute; top: 15px; right: 15px; box-shadow: 0 4px 6px rgba(0,0,0,0.1); }
+        .st-Available { background: #10B981; } .st-Rented { background: #EF4444; } .st-Maintenance { background: #F59E0B; }
+        
+        .btn { padding: 12px 24px; border: none; border-radius: 12px; font-weight: 700; cursor: pointer; transition: 0.2s; font-size: 0.95rem; }
+        .btn-p { background: var(--p); color: white; } .btn-p:hover { background: var(--p-dark); box-shadow: 0 4px 12px rgba(79, 70, 229, 0.3); }
+        .btn-o { background: white; border: 1px solid var(--border); color: #64748B; } .btn-o:hover { border-color: #94A3B8; }
+        .btn-d { background: #FEF2F2; color: #EF4444; padding: 10px; border-radius: 10px; }
+
+        /* TABLES */
+        .tbl { width: 100%; border-collapse: collapse; background: white; border-radius: 16px; overflow: hidden; border: 1px solid var(--border); }
+        .tbl th { background: #F8FAFC; padding: 16px; text-align: left; font-size: 0.8rem; font-weight: 700; color: #64748B; text-transform: uppercase; }
+        .tbl td { padding: 16px; border-bottom: 1px solid #F1F5F9; color: #334155; font-size: 0.9rem; }
+        .tbl tr:last-child td { border-bottom: none; }
+
+        /* MODALS */
+        .modal { position: fixed; inset: 0; background: rgba(0,0,0,0.6); backdrop-filter: blur(8px); display: none; align-items: center; justify-content: center; z-index: 2000; }
+        .modal.active { display: flex; animation: fadeUp 0.3s ease; }
+        @keyframes fadeUp { from { opacity: 0; transform: translateY(20px); } to { opacity: 1; transform: translateY(0); } }
+        .modal-box { background: white; width: 500px; padding: 40px; border-radius: 30px; box-shadow: 0 25px 50px -12px rgba(0,0,0,0.25); }
+        
+        .receipt { background: #F8FAFC; padding: 20px; border: 1px dashed var(--border); border-radius: 12px; margin-bottom: 20px; font-family: monospace; font-size: 0.9rem; }
+        .receipt div { display: flex; justify-content: space-between; margin-bottom: 5px; }
+
+        .hidden { display: none !important; }
+        #qr-ph {
+    animation: pulseQR 2s infinite;
+}
+@keyframes pulseQR {
+    0% { box-shadow: 0 0 0px #4F46E5; }
+    50% { box-shadow: 0 0 20px #4F46E5; }
+    100% { box-shadow: 0 0 0px #4F46E5; }
+}
+
+    </style>
+</head>
+<body>
+
+    <div id="auth" class="auth-container">
+        <div class="auth-left">
+            <div class="auth-content">
+                <h1>"The Road is Open.<br> <span class="highlight">Drive the Future.</span>"</h1>
+                <p style="font-size: 1.3rem; opacity: 0.9; margin-top: 20px;">Select your role to access the premium fleet.</p>
+            </div>
+        </div>
+        <div class="auth-right">
+            <div class="auth-box">
+                <div style="text-align: center; margin-bottom: 40px;">
+                    <i class="fas fa-layer-group" style="font-size: 3rem; color: var(--p);"></i>
+                    <h2 style="margin-top: 10px;">Welcome Back</h2>
+                </div>
+                
+                <div id="login-form">
+                    <div class="input-group">
+                        <label>Email Address</label>
+                        <input id="l-email" class="inp" placeholder="admin@rental.com">
+                    </div>
+                    <div class="input-group">
+                        <label>Password</label>
+                        <input id="l-pass" type="password" class="inp" placeholder="••••••••">
+                    </div>
+                    <button class="btn btn-p" style="width:100%" onclick="login()"> 
+                    Access Dashboard
+                    </button>
+                    <p style="text-align:center; margin-top:20px; color:#64748B; cursor:pointer;" onclick="toggleAuth()">Create an account</p>
+                </div>
+
+                <div id="reg-form" class="hidden">
+                    <div class="input-group"><label>Full Name</label><input id="r-name" class="inp"></div>
+                    <div class="input-group"><label>Email</label><input id="r-email" class="inp"></div>
+                    <div class="input-group"><label>Password</label><input id="r-pass" type="password" class="inp"></div>
+                    <button class="btn btn-p" style="width:100%" onclick="register()">Create Account</button>
+                    <p style="text-align:center; margin-top:20px; color:#64748B; cursor:pointer;" onclick="toggleAuth()">Back to Login</p>
+                </div>
+            </div>
+        </div>
+    </div>
+
+    <div id="app" class="hidden" style="width:100%; height:100%; display:flex;">
+        <aside class="sidebar">
+            <div class="brand"><i class="fas fa-layer-group"></i> Drive<span>Hub</span></div>
+            
+            <div id="nav-admin" class="hidden">
+                <div class="nav-item active" onclick="nav('dash', this)"><i class="fas fa-chart-pie"></i> Mission Control</div>
+                <div class="nav-item" onclick="nav('fleet', this)"><i class="fas fa-car-side"></i> Fleet Command</div>
+                <div class="nav-item" onclick="nav('ledger', this)"><i class="fas fa-file-invoice"></i> Ledger</div>
+            </div>
+
+            <div id="nav-user" class="hidden">
+                <div class="nav-item active" onclick="nav('garage', this)"><i class="fas fa-warehouse"></i> My Garage</div>
+                <div class="nav-item" onclick="nav('fleet', this)"><i class="fas fa-search"></i> Browse Fleet</div>
+            </div>
+
+            <div style="margin-top:auto;">
+                <div style="display:flex; align-items:center; gap:12px; margin-bottom:20px; padding: 12px; background: #F8FAFC; border-radius: 12px;">
+                    <div style="width:40px; height:40px; background:var(--p); border-radius:50%; display:flex; align-items:center; justify-content:center; font-weight:700; color:white;">U</div>
+                    <div><div id="u-name" style="font-weight:700; font-size:0.9rem;">User</div><div id="u-role" style="font-size:0.75rem; color:#94A3B8; text-transform: uppercase;">Role</div></div>
+                </div>
+                <button class="btn btn-o" style="width:100%" onclick="logout()">Sign Out</button>
+            </div>
+        </aside>
+
+        <main class="main">
+            <div id="view-dash" class="hidden">
+                <div class="header"><div class="pg-title">Mission Control</div></div>
+                <div class="stat-grid">
+                    <div class="stat-card"><div class="stat-lbl">Total Revenue</div><span class="stat-val" id="st-rev">₹0</span></div>
+                    <div class="stat-card"><div class="stat-lbl">Active Missions</div><span class="stat-val" id="st-act">0</span></div>
+                    <div class="stat-card"><div class="stat-lbl">Fleet Size</div><span class="stat-val" id="st-flt">0</span></div>
+                    <div class="stat-card"><div class="stat-lbl">Total Distance</div><span class="stat-val" id="st-kms">0 km</span></div>
+                </div>
+                <h3 style="margin-bottom:20px;">Pending Returns</h3>
+                <div id="active-list" style="display:grid; gap:15px;"></div>
+            </div>
+
+            <div id="view-garage" class="hidden">
+                <div class="header"><div class="pg-title">My Garage</div></div>
+                <div id="my-rentals" style="display:grid; gap:20px;"></div>
+            </div>
+
+            <div id="view-fleet" class="hidden">
+                <div class="header">
+                    <div class="pg-title">Fleet Command</div>
+                    <button id="btn-add" class="btn btn-p hidden" onclick="openModal('mod-add')"><i class="fas fa-plus"></i> Add Vehicle</button>
+                </div>
+                <div id="fleet-grid" class="fleet-grid"></div>
+            </div>
+
+            <div id="view-ledger" class="hidden">
+                <div class="header"><div class="pg-title">Transaction Ledger</div></div>
+                <table class="tbl">
+                    <thead><tr><th>TX ID</th><th>User</th><th>Vehicle</th><th>Amount</th><th>Status</th></tr></thead>
+                    <tbody id="ledger-body"></tbody>
+                </table>
+                <button id="ledger-more" class="btn btn-o hidden" style="margin-top:15px;" onclick="loadLedger(false)">Load more</button>
+            </div>
+        </main>
+    </div>
+
+    <div id="mod-add" class="modal"><div class="modal-box">
+        <h2 style="margin-bottom:25px;">Register Vehicle</h2>
+        <div class="input-group"><label>Model Name</label><input id="mv-model" class="inp" placeholder="e.g. Porsche 911"></div>
+        <div style="display:grid; grid-template-columns: 1fr 1fr; gap:15px;">
+            <div class="input-group"><label>Price / Hr</label><input id="mv-price" type="number" class="inp"></div>
+            <div class="input-group"><label>Year</label><input id="mv-year" type="number" class="inp" value="2024"></div>
+        </div>
+        <div style="display:grid; grid-template-columns: 1fr 1fr 1fr; gap:15px;">
+            <div class="input-group"><label>Fuel</label>
+                <select id="mv-fuel" class="inp"><option>Petrol</option><option>Electric</option><option>Diesel</option></select>
+            </div>
+            <div class="input-group"><label>Trans.</label>
+                <select id="mv-trans" class="inp"><option>Auto</option><option>Manual</option></select>
+            </div>
+            <div class="input-group"><label>Seats</label><input id="mv-seats" type="number" class="inp" value="4"></div>
+        </div>
+        <div class="input-group"><label>Image</label><input id="mv-img" type="file" class="inp"></div>
+        <button class="btn btn-p" style="width:100%" onclick="saveVehicle()">Add to Fleet</button>
+        <button class="btn btn-o" style="width:100%; margin-top:10px;" onclick="closeAll()">Cancel</button>
+    </div></div>
+
+    <div id="mod-rent" class="modal"><div class="modal-box">
+        <h2 style="margin-bottom:10px;">Secure Checkout</h2>
+        <p id="rent-info" style="color:#64748B; margin-bottom:20px;"></p>
+        
+        <div style="display:flex; gap:10px; margin-bottom:20px;">
+            <div style="flex:1; text-align:center;">
+                <img id="qr-ph" src="" style="width:140px; border-radius:10px; border:1px solid #eee;">
+                <div style="font-size:0.8rem; margin-top:5px; color:#64748B;">Scan UPI</div>
+                <div id="final-amt" style="margin-top:8px; font-weight:700;"></div>
+
+            </div>
+            <div style="flex:1;">
+                <div class="input-group">
+    <label>Card / UPI ID</label>
+    <input id="pay-id" class="inp" placeholder="user@okhdfcbank">
+    <div id="pay-error" style="color:#EF4444; font-size:0.8rem; margin-top:6px; display:none;">
+        Invalid UPI ID
+    </div>
+</div>
+
+                <div class="input-group">
+    <label>Coupon</label>
+    <div style="display:flex; gap:8px;">
+        <input id="pay-coup" class="inp" placeholder="Optional">
+        <button class="btn btn-o" onclick="applyCoupon()">Apply</button>
+    </div>
+</div>
+
+            </div>
+        </div>
+        
+        <button class="btn btn-p" style="width:100%" onclick="confirmRent()">Confirm Payment</button>
+        <button class="btn btn-o" style="width:100%; margin-top:10px;" onclick="closeAll()">Cancel</button>
+    </div></div>
+
+    <div id="mod-success" class="modal"><div class="modal-box" style="text-align:center;">
+        <div style="font-size:4rem; color:#10B981; margin-bottom:10px;"><i class="fas fa-check-circle"></i></div>
+        <h2>Payment Verified!</h2>
+        <p style="color:#64748B; margin-bottom:20px;">Your vehicle has been unlocked.</p>
+        <div class="receipt" id="receipt-box"></div>
+        <button class="btn btn-p" onclick="closeAll()">Close & Drive</button>
+    </div></div>
+    <div id="mod-processing" class="modal">
+        <div class="modal-box" style="text-align:center;">
+    
+    <div style="font-size:3rem; margin-bottom:15px;">
+      <i class="fas fa-lock" style="color:#4F46E5;"></i>
+    </div>
+
+    <h2>Securing Payment</h2>
+    <p style="color:#64748B; margin-bottom:20px;">
+      Locking amount & verifying transaction...
+    </p>
+
+    <div style="height:8px; background:#E5E7EB; border-radius:10px; overflow:hidden;">
+      <div id="pay-progress"
+           style="width:0%; height:100%; 
+           background:linear-gradient(90deg,#4F46E5,#6366F1);
+           transition:0.4s;">
+      </div>
+    </div>
+
+    <div style="margin-top:15px; font-size:0.85rem; color:#94A3B8;">
+      Please do not close this window
+    </div>
+
+  </div>
+</div>
+
+
+    <div id="mod-ret" class="modal"><div class="modal-box">
+        <h3>Vehicle Check-in</h3>
+        <div class="input-group"><label>Kilometers Driven</label><input id="ret-kms" type="number" class="inp"></div>
+        <div class="input-group"><label>Damage Fine (₹)</label><input id="ret-fine" type="number" class="inp" value="0"></div>
+        <button class="btn btn-p" style="width:100%" onclick="processReturn()">Complete Return</button>
+        <button class="btn btn-o" style="width:100%; margin-top:10px;" onclick="closeAll()">Cancel</button>
+    </div></div>
+
+    <script>
+        let curV=null, curTx=null, role=null;
+        // Local copy of the server data, kept current with ?since= deltas
+        let store = { version: null, vehicles: new Map(), rentals: new Map(), stats: {} };
+        let finalAmount = 0;
+
+        function toggleAuth() { document.getElementById('login-form').classList.toggle('hidden'); document.getElementById('reg-form').classList.toggle('hidden'); }
+
+        async function login() {
+            const res = await fetch('/api/auth/login', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({email:document.getElementById('l-email').value, password:document.getElementById('l-pass').value})});
+            const d = await res.json();
+            if(d.status==='success') init(d.user); else Swal.fire('Error', d.message, 'error');
+        }
+
+        async function register() {
+            const res = await fetch('/api/auth/register', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({name:document.getElementById('r-name').value, email:document.getElementById('r-email').value, password:document.getElementById('r-pass').value})});
+            const d = await res.json();
+            if(d.status==='success') { Swal.fire('Success', 'Login now', 'success'); toggleAuth(); } else Swal.fire('Error', d.message, 'error');
+        }
+
+        function init(user) {
+            role = user.role;
+            store = { version: null, vehicles: new Map(), rentals: new Map(), stats: {} };
+            document.getElementById('auth').classList.add('hidden');
+            document.getElementById('app').classList.remove('hidden');
+            document.getElementById('u-name').innerText = user.name;
+            document.getElementById('u-role').innerText = user.role.toUpperCase();
+
+            if(role === 'admin') {
+                document.getElementById('nav-admin').classList.remove('hidden');
+                document.getElementById('btn-add').classList.remove('hidden');
+                nav('dash', document.querySelector('#nav-admin .nav-item'));
+            } else {
+                document.getElementById('nav-user').classList.remove('hidden');
+                nav('garage', document.querySelector('#nav-user .nav-item'));
+            }
+            sync().then(() => role === 'admin' ? listen() : null);
+        }
+
+        async function sync() {
+            const res = await fetch('/api/data/sync?compact=1' + (store.version !== null ? '&since=' + store.version : ''));
+            if(res.status === 304) return;
+            applySync(await res.json());
+        }
+
+        // Server push for the admin views: the same deltas as sync(), sent as
+        // soon as anything changes. When the server has no stream to spare
+        // (503) the browser gives up on it and we poll instead.
+        function listen() {
+            if(!window.EventSource || store.version === null) return poll();
+            const es = new EventSource('/api/events?compact=1&since=' + store.version);
+            es.addEventListener('sync', e => applySync(JSON.parse(e.data)));
+            es.onerror = () => { if(es.readyState === EventSource.CLOSED) poll(); };
+        }
+
+        function poll() {
+            setInterval(sync, 15000);
+        }
+
+        // compact=1 payloads list field names once and a value array per record
+        function records(t) {
+            if(Array.isArray(t)) return t;
+            return t.rows.map(row => {
+                const r = {};
+                t.columns.forEach((c, i) => { if(row[i] !== null) r[c] = row[i]; });
+                return r;
+            });
+        }
+
+        function applySync(d) {
+            if(d.full) { store.vehicles.clear(); store.rentals.clear(); }
+            records(d.data.vehicles).forEach(v => store.vehicles.set(v.id, v));
+            records(d.data.rentals).forEach(r => store.rentals.set(r.tx_id, r));
+            d.data.deleted.vehicles.forEach(id => store.vehicles.delete(id));
+            d.data.deleted.rentals.forEach(id => store.rentals.delete(id));
+            store.stats = d.data.stats;
+            // Deltas always carry current records, so a late one is harmless
+            // as long as the version never moves backwards
+            store.version = d.full ? d.version : Math.max(store.version || 0, d.version);
+
+            const data = { vehicles: [...store.vehicles.values()], rentals: [...store.rentals.values()], stats: store.stats };
+
+            // RENDER FLEET
+            document.getElementById('fleet-grid').innerHTML = data.vehicles.map(v => `
+                <div class="car-card">
+                    <span class="badge st-${v.status}">${v.status}</span>
+                    <img class="car-img" loading="lazy" src="${v.thumb ? '/media/thumbs/'+v.thumb : v.image ? '/media/'+v.image : 'https://placehold.co/400x250'}">
+                    <div class="car-body">
+                        <div style="display:flex; justify-content:space-between; align-items:start;">
+                            <div>
+                                <h3 style="margin:0 0 5px 0; font-size:1.2rem;">${v.model}</h3>
+                                <div class="tags">
+                                    <span class="tag"><i class="fas fa-calendar"></i> ${v.year}</span>
+                                    <span class="tag"><i class="fas fa-cog"></i> ${v.transmission}</span>
+                                    <span class="tag"><i class="fas fa-user"></i> ${v.seats}</span>
+                                    <span class="tag"><i class="fas fa-gas-pump"></i> ${v.fuel}</span>
+                                    <span class="tag"><i class="fas fa-road"></i> ${v.kms} km</span>
+                                    <span class="tag"><i class="fas fa-heartbeat"></i> ${v.health}%</span>
+
+                                </div>
+                            </div>
+                        </div>
+                        <div style="display:flex; justify-content:space-between; align-items:center; margin-top:15px; padding-top:15px; border-top:1px solid #F1F5F9;">
+                            <div><span style="font-size:1.4rem; font-weight:800; color:var(--p);">₹${v.price}</span> <span style="font-size:0.8rem; color:#94A3B8;">/ hr</span></div>
+                            <div style="display:flex; gap:10px;">
+                                ${role==='user' && v.status==='Available' ? `<button class="btn btn-p" style="padding:10px 20px;" onclick="openRent('${v.id}','${v.model}',${v.price})">Rent</button>` : ''}
+                                ${role==='admin' ? `<button class="btn btn-d" onclick="delCar('${v.id}')"><i class="fas fa-trash"></i></button>` : ''}
+                            </div>
+                        </div>
+                    </div>
+                </div>`).join('');
+
+            // RENDER ADMIN
+            if(role === 'admin') {
+                document.getElementById('st-rev').innerText = '₹' + data.stats.revenue.toLocaleString();
+                document.getElementById('st-act').innerText = data.stats.active;
+                document.getElementById('st-flt').innerText = data.stats.fleet;
+                document.getElementById('st-kms').innerText = data.stats.kms;
+
+                const active = data.rentals.filter(r => r.status === 'Active');
+                document.getElementById('active-list').innerHTML = active.length ? active.map(r => `
+                    <div style="background:white; padding:20px; border-radius:16px; border:1px solid #E2E8F0; display:flex; justify-content:space-between; align-items:center;">
+                        <div>
+                            <div style="font-weight:700; font-size:1.1rem;">${r.vehicle_model}</div>
+                            <div style="color:#64748B; font-size:0.9rem;">Renter: ${r.user_name} • ${r.user_email}</div>
+                        </div>
+                        <button class="btn btn-p" onclick="openRet('${r.tx_id}')">Check-in</button>
+                    </div>`).join('') : '<p style="color:#94A3B8;">No vehicles pending return.</p>';
+
+                if(!document.getElementById('view-ledger').classList.contains('hidden')) loadLedger(true);
+            }
+
+            // RENDER USER
+            if(role === 'user') {
+                const myActive = data.rentals.filter(r => r.status === 'Active');
+                document.getElementById('my-rentals').innerHTML = myActive.length ? myActive.map(r => `
+                    <div style="background:white; padding:30px; border-radius:20px; border:1px solid #E2E8F0; text-align:center;">
+                        <div style="font-size:3rem; margin-bottom:10px;">🚗</div>
+                        <h2 style="margin:0 0 10px 0;">${r.vehicle_model}</h2>
+                        <div style="background:#FEF2F2; color:#EF4444; padding:8px 16px; border-radius:30px; display:inline-block; font-weight:700; font-size:0.8rem; margin-bottom:15px;">ACTIVE RENTAL</div>
+                        <p style="color:#64748B;">Please drive safely. Return to the station for check-in.</p>
+                    </div>`).join('') : '<p style="color:#94A3B8;">No active rentals.</p>';
+            }
+        }
+
+        // The ledger is paged from /api/rentals rather than shipped with sync
+        let ledgerCursor = null;
+        async function loadLedger(reset) {
+            if(reset) ledgerCursor = null;
+            const res = await fetch('/api/rentals?compact=1&limit=50' + (ledgerCursor ? '&cursor=' + encodeURIComponent(ledgerCursor) : ''));
+            const d = await res.json();
+            const rows = records(d.rentals).map(r => `
+                    <tr>
+                        <td><code>${r.tx_id}</code></td>
+                        <td>${r.user_name}</td>
+                        <td>${r.vehicle_model}</td>
+                        <td>₹${r.total}</td>
+                        <td><span style="font-weight:700; color:${r.status==='Active'?'#10B981':'#64748B'}">${r.status}</span></td>
+                    </tr>`).join('');
+            const body = document.getElementById('ledger-body');
+            if(reset) body.innerHTML = rows; else body.insertAdjacentHTML('beforeend', rows);
+            ledgerCursor = d.next_cursor;
+            document.getElementById('ledger-more').classList.toggle('hidden', !ledgerCursor);
+        }
+
+        function openRent(id, model, price) {
+
+    curV = { v_id: id, price: price };
+    finalAmount = price;
+
+    document.getElementById('rent-info').innerText =
+        `${model} - ₹${price}/day`;
+
+    generateQR(finalAmount);
+
+    openModal('mod-rent');
+}
+
+        
+        async function confirmRent() {
+
+    const payId = document.getElementById('pay-id').value;
+    const payInput = document.getElementById('pay-id');
+const errorBox = document.getElementById('pay-error');
+
+// Simple UPI validation
+const upiPattern = /^[a-zA-Z0-9._-]+@[a-zA-Z]+$/;
+
+if(!upiPattern.test(payId)) {
+
+    payInput.classList.add("input-error");
+    errorBox.style.display = "block";
+    errorBox.innerText = "Enter valid UPI ID (example: name@bank)";
+
+    return;
+
+} else {
+    payInput.classList.remove("input-error");
+    errorBox.style.display = "none";
+}
+
+
+    closeAll();
+    openModal('mod-processing');
+
+    let progress = 0;
+
+    const progressBar = document.getElementById('pay-progress');
+    progressBar.style.width = "0%";
+
+    const interval = setInterval(() => {
+        progress = Math.min(progress + 15, 90);
+        progressBar.style.width = progress + "%";
+    }, 400);
+
+    const res = await fetch('/api/rent/create', {
+        method:'POST',
+        headers:{'Content-Type':'application/json'},
+        body:JSON.stringify({
+            v_id: curV.v_id,
+            price: finalAmount,
+            pay_id: payId
+        })
+    });
+
+    const d = await res.json();
+
+    // The car is held while the payment is verified server side
+    let state = d.status === 'success' ? d.booking : 'Unavailable';
+    for(let i = 0; state === 'Pending' && i < 600; i++) {
+        await new Promise(r => setTimeout(r, 500));
+        const s = await (await fetch('/api/rent/' + d.tx_id)).json();
+        state = s.rental ? s.rental.status : 'Failed';
+    }
+
+    clearInterval(interval);
+    progressBar.style.width = "100%";
+    closeAll();
+    sync();
+
+    if(state !== 'Active' && state !== 'Booked') {
+        if(state === 'Unavailable') Swal.fire('Unavailable', 'This vehicle was just taken', 'error');
+        else Swal.fire('Payment Failed', 'The payment could not be verified and the hold was released', 'error');
+        return;
+    }
+
+    confetti({
+        particleCount: 180,
+        spread: 90,
+        origin: { y: 0.6 }
+    });
+
+    document.getElementById('receipt-box').innerHTML = `
+        <div><span>Transaction ID:</span> <b>${d.tx_id}</b></div>
+        <div><span>Amount Paid:</span> <b>₹${finalAmount}</b></div>
+        <div><span>Method:</span> <b>${payId}</b></div>
+        <div><span>Status:</span> <b style="color:#10B981">SUCCESS</b></div>
+    `;
+
+    openModal('mod-success');
+}
+
+function generateQR(amount) {
+    const upiLink = `upi://pay?pa=nsuryachandra16@okicici&pn=DriveHub&am=${amount}&cu=INR`;
+    const qrURL = 
+        `https://api.qrserver.com/v1/create-qr-code/?size=200x200&data=${encodeURIComponent(upiLink)}`;
+
+    document.getElementById('qr-ph').src = qrURL;
+}
+function applyCoupon() {
+    const code = document.getElementById('pay-coup').value.trim().toUpperCase();
+
+    if(code === "HUB20") {
+        finalAmount = Math.round(curV.price * 0.8);
+        Swal.fire('Coupon Applied', '20% Discount Activated!', 'success');
+    } else if(code === "") {
+        finalAmount = curV.price;
+    } else {
+        finalAmount = curV.price;
+        Swal.fire('Invalid Code', 'No discount applied', 'warning');
+    }
+
+    document.getElementById('final-amt').innerText = "₹" + finalAmount;
+    generateQR(finalAmount);
+}
+
+
+        function openRet(tx) { curTx=tx; openModal('mod-ret'); }
+        async function processReturn() { 
+            await fetch('/api/rent/return', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({
+                tx_id:curTx, kms:document.getElementById('ret-kms').value, fine:document.getElementById('ret-fine').value
+            })});
+            closeAll(); sync(); Swal.fire('Success', 'Return Processed', 'success');
+        }
+
+        async function saveVehicle() {
+            const fd = new FormData();
+            ['model','price','year','fuel','trans','seats'].forEach(k => fd.append(k.replace('mv-',''), document.getElementById('mv-'+k).value));
+            const f = document.getElementById('mv-img').files[0]; if(f) fd.append('image', f);
+            await fetch('/api/vehicle/manage', {method:'POST', body:fd});
+            closeAll(); sync();
+        }
+
+        async function delCar(id) { if(confirm('Delete vehicle?')) { await fetch('/api/vehicle/delete', {method:'POST', headers:{'Content-Type':'application/json'}, body:JSON.stringify({id:id})}); sync(); } }
+        async function logout() { await fetch('/api/auth/logout', {method:'POST'}); location.reload(); }
+        function nav(v, el) { 
+            document.querySelectorAll('.nav-item').forEach(x=>x.classList.remove('active')); el.classList.add('active');
+            ['dash','garage','fleet','ledger'].forEach(x=>document.getElementById('view-'+x).classList.add('hidden'));
+            document.getElementById('view-'+v).classList.remove('hidden');
+            if(v === 'ledger') loadLedger(true);
+        }
+        function openModal(id) { document.getElementById(id).classList.add('active'); }
+        function closeAll() { document.querySelectorAll('.modal').forEach(x=>x.classList.remove('active')); }
+    
+
+    </script>
+</body>
+</html>
+"""
+
+# ==========================================
+# RUN
+# ==========================================
+
+build_ui(UI_CODE)
+
+_startup_lock = threading.Lock()
+_started_up = False
+
+
+def startup():
+    # Seeds missing tables and starts the background jobs. Done before the
+    # first request a worker serves rather than on import, so CLI commands
+    # (migrate-sqlite fills the tables itself) see the store as it is.
+    global _started_up
+    with _startup_lock:
+        if _started_up:
+            return
+        repair_db()
+        start_scheduler()
+        _started_up = True
+
+
+@app.before_request
+def startup_once():
+    if not _started_up:
+        startup()
+
+
+if __name__ == "__main__":
+    startup()
+    port = int(os.environ.get("PORT", 5000))
+    app.run(host="0.0.0.0", port=port)
+
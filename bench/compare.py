@@ -0,0 +1,68 @@
+"""Compare two bench/run.py result files.
+
+    python bench/compare.py before.json after.json [--max-regression 10]
+
+Prints p50/p99/throughput per mode and scenario with the change in
+percent. With --max-regression, exits 1 when any p99 rose or any
+throughput fell by more than that many percent.
+"""
+import argparse
+import json
+import sys
+
+
+def change(before, after):
+    if not before or after is None:
+        return None
+    return (after - before) / before * 100
+
+
+def fmt(value, pct):
+    text = '-' if value is None else f"{value:.1f}"
+    return f"{text} ({pct:+.1f}%)" if pct is not None else text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('before')
+    parser.add_argument('after')
+    parser.add_argument('--max-regression', type=float)
+    args = parser.parse_args()
+
+    with open(args.before) as f:
+        before = json.load(f)
+    with open(args.after) as f:
+        after = json.load(f)
+
+    for key in ('commit', 'scale', 'engine', 'dataset'):
+        if before['meta'].get(key) != after['meta'].get(key):
+            print(f"{key}: {before['meta'].get(key)} -> {after['meta'].get(key)}")
+
+    regressions = []
+    print(f"{'mode':9} {'scenario':15} {'p50 ms':>22} {'p99 ms':>22} {'req/s':>22} {'errors':>8}")
+    for mode, run in after['runs'].items():
+        old_run = before['runs'].get(mode)
+        if old_run is None:
+            continue
+        for name, new in run['scenarios'].items():
+            old = old_run['scenarios'].get(name)
+            if old is None:
+                continue
+            p50 = change(old['p50_ms'], new['p50_ms'])
+            p99 = change(old['p99_ms'], new['p99_ms'])
+            rps = change(old['throughput_rps'], new['throughput_rps'])
+            print(f"{mode:9} {name:15} {fmt(new['p50_ms'], p50):>22} {fmt(new['p99_ms'], p99):>22} "
+                  f"{fmt(new['throughput_rps'], rps):>22} {new['errors']:>8}")
+            if args.max_regression is not None:
+                if p99 is not None and p99 > args.max_regression:
+                    regressions.append(f"{mode}/{name} p99 {p99:+.1f}%")
+                if rps is not None and -rps > args.max_regression:
+                    regressions.append(f"{mode}/{name} throughput {rps:+.1f}%")
+
+    if regressions:
+        print("Regressions: " + ", ".join(regressions))
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
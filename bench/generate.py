@@ -0,0 +1,151 @@
+"""Generate a synthetic Drive Hub dataset (users.xml, vehicles.xml, rentals.xml).
+
+    python bench/generate.py --scale medium --out /tmp/drivehub-bench
+
+Scales: small = 1k rentals, medium = 100k, large = 1M. --rentals,
+--vehicles and --users override the preset. The same --seed always
+produces the same files, so runs on different commits compare like for
+like. Every user's password is "bench".
+"""
+import argparse
+import hashlib
+import os
+import random
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+SCALES = {
+    'small': {'users': 100, 'vehicles': 200, 'rentals': 1000},
+    'medium': {'users': 5000, 'vehicles': 2000, 'rentals': 100000},
+    'large': {'users': 50000, 'vehicles': 10000, 'rentals': 1000000}
+}
+
+PASSWORD = 'bench'
+ADMIN = {"id": "1", "name": "Drive Hub", "email": "admin@rental.com", "password": "admin", "role": "admin"}
+MODELS = ['Thar', 'Creta', 'Nexon', 'Swift', 'City', 'Model 3', 'XUV700', 'Innova', 'Baleno', 'Seltos']
+FUELS = ['Petrol', 'Diesel', 'Electric']
+
+
+def write_table(path, key, records):
+    # Same layout the app writes: one line, no pretty printing
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(f"<?xml version='1.0' encoding='utf-8'?>\n<{key}>")
+        for record in records:
+            f.write('<record>' + ''.join(f"<{k}>{escape(str(v))}</{k}>" for k, v in record.items()) + '</record>')
+        f.write(f"</{key}>")
+
+
+def password_hash(password, salt):
+    # The app's default scrypt format, but with a fixed salt so the same seed
+    # still writes identical files. Hashed once per password and shared, so
+    # logins measure the steady-state check, not the legacy rehash.
+    n, r, p = 2 ** 15, 8, 1
+    digest = hashlib.scrypt(password.encode(), salt=salt.encode(), n=n, r=r, p=p, maxmem=132 * n * r * p)
+    return f"scrypt:{n}:{r}:{p}${salt}${digest.hex()}"
+
+
+def user_email(i):
+    return f"user{i}@bench.local"
+
+
+def users(count, seed):
+    salt = f"bench-{seed}"
+    admin = {k: v for k, v in ADMIN.items() if k != 'password'}
+    yield dict(admin, password_hash=password_hash(ADMIN['password'], salt))
+    user_hash = password_hash(PASSWORD, salt)
+    for i in range(2, count + 1):
+        yield {"id": str(i), "name": f"Bench User {i}", "email": user_email(i), "password_hash": user_hash, "role": "user"}
+
+
+def vehicles(rng, count, rented):
+    for i in range(count):
+        yield {
+            "id": str(100000 + i),
+            "model": MODELS[i % len(MODELS)],
+            "price": rng.choice([800, 1200, 1500, 2000, 2500, 3200]),
+            "year": rng.randint(2015, 2025),
+            "fuel": rng.choice(FUELS),
+            "transmission": rng.choice(['Auto', 'Manual']),
+            "seats": rng.choice([4, 5, 7]),
+            "health": rng.randint(60, 100),
+            "kms": rng.randint(0, 90000),
+            "status": "Rented" if i in rented else "Available",
+            "image": ""
+        }
+
+
+def rentals(rng, count, n_users, n_vehicles, rented):
+    # Closed history spread over three years, oldest first, then one Active
+    # rental per rented vehicle
+    start = datetime(2023, 1, 1)
+    step = timedelta(days=3 * 365) / max(count, 1)
+    active = sorted(rented)
+    history = count - len(active)
+    for i in range(count):
+        if i < history:
+            vehicle = rng.randrange(n_vehicles)
+            when = start + step * i
+            status = 'Closed'
+        else:
+            vehicle = active[i - history]
+            when = datetime(2026, 1, 1) + timedelta(minutes=i - history)
+            status = 'Active'
+        user = rng.randint(2, max(n_users, 2))
+        price = rng.choice([800, 1200, 1500, 2000, 2500, 3200])
+        record = {
+            "tx_id": f"TX-{i:08X}",
+            "user_email": user_email(user),
+            "user_name": f"Bench User {user}",
+            "vehicle_id": str(100000 + vehicle),
+            "vehicle_model": MODELS[vehicle % len(MODELS)],
+            "price": price,
+            "total": price + (rng.choice([0, 0, 0, 250, 500]) if status == 'Closed' else 0),
+            "payment_method": "UPI",
+            "payment_id": f"bench{i}@upi",
+            "status": status,
+            "date": when.strftime("%Y-%m-%d %H:%M"),
+            "start": when.strftime("%Y-%m-%d %H:%M"),
+            "end": (when + timedelta(days=1)).strftime("%Y-%m-%d %H:%M")
+        }
+        if status == 'Closed':
+            record["return_date"] = (when + timedelta(hours=rng.randint(2, 30))).strftime("%Y-%m-%d %H:%M")
+        yield record
+
+
+def generate(out, users_count, vehicles_count, rentals_count, seed=42):
+    rng = random.Random(seed)
+    os.makedirs(out, exist_ok=True)
+    # Remove anything derived from a previous dataset in the same directory
+    # (a stale -wal next to a new .db would be replayed into it)
+    for name in ('stats.xml', 'changes.xml', 'rentals.journal', 'changes.journal',
+                 'drivehub.db', 'drivehub.db-wal', 'drivehub.db-shm',
+                 'sessions.db', 'sessions.db-wal', 'sessions.db-shm'):
+        if os.path.exists(os.path.join(out, name)):
+            os.remove(os.path.join(out, name))
+
+    rented = set(rng.sample(range(vehicles_count), min(vehicles_count // 10, rentals_count)))
+    write_table(os.path.join(out, 'users.xml'), 'users', users(users_count, seed))
+    write_table(os.path.join(out, 'vehicles.xml'), 'vehicles', vehicles(rng, vehicles_count, rented))
+    write_table(os.path.join(out, 'rentals.xml'), 'rentals', rentals(rng, rentals_count, users_count, vehicles_count, rented))
+    return {'users': users_count, 'vehicles': vehicles_count, 'rentals': rentals_count, 'seed': seed}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--users', type=int)
+    parser.add_argument('--vehicles', type=int)
+    parser.add_argument('--rentals', type=int)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--out', default='bench-data')
+    args = parser.parse_args()
+
+    size = dict(SCALES[args.scale])
+    for key in size:
+        if getattr(args, key) is not None:
+            size[key] = getattr(args, key)
+    print(generate(args.out, size['users'], size['vehicles'], size['rentals'], args.seed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,381 @@
+"""Load-test the Drive Hub API against a synthetic dataset.
+
+    python bench/run.py --scale small --mode both --out results.json
+    python bench/compare.py before.json after.json
+
+Each run regenerates the dataset (see generate.py) so runs are repeatable.
+It then drives login, sync, rent create, rent return and vehicle manage
+with --concurrency client threads:
+
+- client:   through Flask's test client, in this process
+- gunicorn: over HTTP against a local gunicorn (gthread) on a free port
+
+Results (p50/p99 latency, throughput, errors per scenario) are printed and
+written as JSON for compare.py.
+"""
+import argparse
+import gzip
+import http.client
+import json
+import math
+import os
+import platform
+import socket
+import subprocess
+import sys
+import threading
+import time
+import xml.etree.ElementTree as ET
+from datetime import datetime
+from urllib.parse import urlencode
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+REPO = os.path.dirname(HERE)
+sys.path.insert(0, HERE)
+
+from generate import SCALES, PASSWORD, ADMIN, generate, user_email  # noqa: E402
+
+SCENARIOS = ('login', 'sync', 'rent_create', 'rent_return', 'vehicle_manage')
+
+
+# ---------- clients ----------
+
+def _body(resp_headers, data):
+    if resp_headers.get('Content-Encoding') == 'gzip':
+        data = gzip.decompress(data)
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+class FlaskClient:
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, json_body=None, form=None):
+        resp = self.client.open(path, method=method, json=json_body, data=form,
+                                headers={'Accept-Encoding': 'gzip'})
+        return resp.status_code, _body(resp.headers, resp.get_data())
+
+
+class HttpClient:
+    # One keep-alive connection per client thread, session cookie kept by hand
+    def __init__(self, port):
+        self.conn = http.client.HTTPConnection('127.0.0.1', port, timeout=120)
+        self.cookie = None
+
+    def request(self, method, path, json_body=None, form=None):
+        headers = {'Accept-Encoding': 'gzip'}
+        body = None
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if json_body is not None:
+            body = json.dumps(json_body)
+            headers['Content-Type'] = 'application/json'
+        elif form is not None:
+            body = urlencode(form)
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        self.conn.request(method, path, body=body, headers=headers)
+        resp = self.conn.getresponse()
+        data = resp.read()
+        cookie = resp.getheader('Set-Cookie')
+        if cookie:
+            self.cookie = cookie.split(';', 1)[0]
+        return resp.status, _body(resp.headers, data)
+
+
+def login(client, email, password):
+    status, body = client.request('POST', '/api/auth/login', json_body={'email': email, 'password': password})
+    if status != 200 or not body or body.get('status') != 'success':
+        raise RuntimeError(f"Login failed for {email}: {status} {body}")
+    return client
+
+
+# ---------- scenarios ----------
+# A step makes one request and returns True when it succeeded. rent_create
+# hands its rentals to rent_return, which puts the cars back in the pool.
+
+class Scenario:
+    # Who each scenario's clients are logged in as (None: nobody)
+    ROLES = {'login': None, 'sync': 'admin', 'rent_create': 'user',
+             'rent_return': 'admin', 'vehicle_manage': 'admin'}
+
+    def __init__(self, dataset, available):
+        self.dataset = dataset
+        self.available = list(available)
+        self.rented = []
+        self.lock = threading.Lock()
+
+    def login(self, client, i):
+        email = user_email(2 + i % max(self.dataset['users'] - 1, 1))
+        status, body = client.request('POST', '/api/auth/login', json_body={'email': email, 'password': PASSWORD})
+        return status == 200 and body.get('status') == 'success'
+
+    def sync(self, client, i):
+        status, body = client.request('GET', '/api/data/sync')
+        return status == 200 and body.get('status') == 'success'
+
+    def rent_create(self, client, i):
+        with self.lock:
+            if not self.available:
+                return False
+            v_id = self.available.pop()
+        status, body = client.request('POST', '/api/rent/create', json_body={'v_id': v_id, 'price': 1500, 'pay_id': f'bench{i}@upi'})
+        ok = status == 200 and body.get('status') == 'success'
+        if ok:
+            with self.lock:
+                self.rented.append((body['tx_id'], v_id))
+        return ok
+
+    def wait_settled(self, client, timeout=120):
+        # Payments are confirmed in the background; a rental can only be
+        # returned once it has gone Active. Failed ones are dropped.
+        deadline = time.monotonic() + timeout
+        settled = []
+        for tx_id, v_id in self.rented:
+            while True:
+                status, body = client.request('GET', f'/api/rent/{tx_id}')
+                state = body['rental']['status'] if status == 200 else None
+                if state != 'Pending' or time.monotonic() > deadline:
+                    break
+                time.sleep(0.05)
+            if state == 'Active':
+                settled.append((tx_id, v_id))
+        self.rented = settled
+
+    def rent_return(self, client, i):
+        with self.lock:
+            if not self.rented:
+                return False
+            tx_id, v_id = self.rented.pop()
+        status, body = client.request('POST', '/api/rent/return', json_body={'tx_id': tx_id, 'kms': 120, 'fine': 0})
+        with self.lock:
+            self.available.append(v_id)
+        return status == 200 and body.get('status') == 'success'
+
+    def vehicle_manage(self, client, i):
+        v_id = self.available[i % len(self.available)]
+        status, body = client.request('POST', '/api/vehicle/manage', form={
+            'id': v_id, 'model': 'Bench Model', 'price': 1500 + i % 7, 'year': 2024, 'fuel': 'Petrol',
+            'transmission': 'Auto', 'seats': 5, 'health': 100, 'kms': 1000 + i, 'status': 'Available'
+        })
+        return status == 200 and body.get('status') == 'success'
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    # Nearest rank
+    rank = max(1, math.ceil(pct / 100 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def run_scenario(name, scenario, make_client, requests, concurrency):
+    role = scenario.ROLES[name]
+    step = getattr(scenario, name)
+    clients = []
+    for _ in range(concurrency):
+        client = make_client()
+        if role == 'admin':
+            login(client, ADMIN['email'], ADMIN['password'])
+        elif role == 'user':
+            login(client, user_email(2), PASSWORD)
+        clients.append(client)
+
+    latencies, errors = [], [0]
+    lock = threading.Lock()
+    counter = iter(range(requests))
+
+    def worker(client):
+        while True:
+            with lock:
+                i = next(counter, None)
+            if i is None:
+                return
+            started = time.perf_counter()
+            try:
+                ok = step(client, i)
+            except Exception:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                latencies.append(elapsed)
+                if not ok:
+                    errors[0] += 1
+
+    threads = [threading.Thread(target=worker, args=(c,)) for c in clients]
+    wall = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - wall
+
+    latencies.sort()
+
+    def ms(seconds):
+        return round(seconds * 1000, 3) if seconds is not None else None
+
+    return {
+        'requests': len(latencies),
+        'errors': errors[0],
+        'p50_ms': ms(percentile(latencies, 50)),
+        'p90_ms': ms(percentile(latencies, 90)),
+        'p99_ms': ms(percentile(latencies, 99)),
+        'mean_ms': ms(sum(latencies) / len(latencies)) if latencies else None,
+        'max_ms': ms(latencies[-1]) if latencies else None,
+        'throughput_rps': round(len(latencies) / wall, 2) if wall else None
+    }
+
+
+def run_all(make_client, dataset, available, args):
+    # The first full sync pays for reading the tables from disk
+    started = time.perf_counter()
+    login(make_client(), ADMIN['email'], ADMIN['password']).request('GET', '/api/data/sync')
+    cold = time.perf_counter() - started
+
+    scenario = Scenario(dataset, available)
+    results = {}
+    for name in args.scenarios:
+        count = args.requests
+        if name == 'rent_create':
+            count = min(count, len(scenario.available))
+        elif name == 'rent_return':
+            scenario.wait_settled(login(make_client(), ADMIN['email'], ADMIN['password']))
+            count = min(count, len(scenario.rented))
+        results[name] = run_scenario(name, scenario, make_client, count, args.concurrency)
+        print(f"  {name:15} {results[name]}")
+    return {'cold_sync_ms': round(cold * 1000, 3), 'scenarios': results}
+
+
+# ---------- modes ----------
+
+def prepare_engine(data_dir, engine):
+    if engine != 'sqlite':
+        return
+    env = dict(os.environ, STORAGE_ENGINE='xml', BACKGROUND_JOBS='0', PYTHONPATH=REPO)
+    subprocess.run([sys.executable, '-c', 'import app; app.migrate_xml_to_sqlite()'],
+                   cwd=data_dir, env=env, check=True)
+
+
+# Every client logs in from 127.0.0.1, so login throttling is switched off
+APP_ENV = {'BACKGROUND_JOBS': '0', 'LOGIN_THROTTLE': '0'}
+
+
+def run_client(data_dir, dataset, available, args):
+    os.environ.update(APP_ENV, STORAGE_ENGINE=args.engine)
+    os.chdir(data_dir)
+    sys.path.insert(0, REPO)
+    import app as drivehub
+    return run_all(lambda: FlaskClient(drivehub.app), dataset, available, args)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def run_gunicorn(data_dir, dataset, available, args):
+    port = free_port()
+    # Workers must share sessions, a login can land on either of them
+    env = dict(os.environ, **APP_ENV, STORAGE_ENGINE=args.engine, SESSION_STORE='sqlite')
+    server = subprocess.Popen([
+        sys.executable, '-m', 'gunicorn', 'app:app',
+        '--chdir', data_dir, '--pythonpath', REPO,
+        '--bind', f'127.0.0.1:{port}', '--workers', str(args.workers),
+        '--worker-class', 'gthread', '--threads', str(args.threads),
+        '--timeout', '300', '--log-level', 'warning'
+    ], env=env)
+    try:
+        deadline = time.monotonic() + 120
+        while True:
+            try:
+                HttpClient(port).request('GET', '/metrics')
+                break
+            except OSError:
+                if server.poll() is not None or time.monotonic() > deadline:
+                    raise RuntimeError("gunicorn did not start")
+                time.sleep(0.2)
+        return run_all(lambda: HttpClient(port), dataset, available, args)
+    finally:
+        server.terminate()
+        server.wait(timeout=30)
+
+
+def available_vehicles(data_dir):
+    ids = []
+    for _, elem in ET.iterparse(os.path.join(data_dir, 'vehicles.xml')):
+        if elem.tag == 'record':
+            if elem.findtext('status') == 'Available':
+                ids.append(elem.findtext('id'))
+            elem.clear()
+    return ids
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPO, capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scale', choices=SCALES, default='small')
+    parser.add_argument('--rentals', type=int, help="override the scale's rental count")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--data', default=os.path.join(REPO, 'bench-data'))
+    parser.add_argument('--mode', choices=('client', 'gunicorn', 'both'), default='client')
+    parser.add_argument('--engine', choices=('xml', 'sqlite'), default='xml')
+    parser.add_argument('--requests', type=int, default=200, help="requests per scenario")
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--workers', type=int, default=2, help="gunicorn workers")
+    parser.add_argument('--threads', type=int, default=8, help="gunicorn threads per worker")
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--out', help="write results JSON here")
+    args = parser.parse_args()
+
+    size = dict(SCALES[args.scale])
+    if args.rentals is not None:
+        size['rentals'] = args.rentals
+    data_dir = os.path.abspath(args.data)
+    out = os.path.abspath(args.out) if args.out else None
+
+    report = {
+        'meta': {
+            'commit': git_commit(),
+            'started': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'scale': args.scale,
+            'engine': args.engine,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'workers': args.workers,
+            'threads': args.threads
+        },
+        'runs': {}
+    }
+
+    # gunicorn first: the client mode imports the app into this process
+    modes = ['gunicorn', 'client'] if args.mode == 'both' else [args.mode]
+    for mode in modes:
+        started = time.perf_counter()
+        dataset = generate(data_dir, size['users'], size['vehicles'], size['rentals'], args.seed)
+        prepare_engine(data_dir, args.engine)
+        report['meta']['dataset'] = dataset
+        print(f"{mode}: dataset {dataset} ready in {time.perf_counter() - started:.1f}s")
+        runner = run_gunicorn if mode == 'gunicorn' else run_client
+        report['runs'][mode] = runner(data_dir, dataset, available_vehicles(data_dir), args)
+
+    if out:
+        with open(out, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {out}")
+
+
+if __name__ == '__main__':
+    main()